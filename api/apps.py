@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, post_save
 
 
 class EcomConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+
+        from .images import queue_derivatives
+        from .models import ProductImage
+        from .search import install_search_index
+        from .stats import create_user_stats
+
+        post_migrate.connect(install_search_index, sender=self)
+        post_save.connect(queue_derivatives, sender=ProductImage)
+        post_save.connect(create_user_stats, sender=User)
@@ -0,0 +1,162 @@
+"""
+Resized derivatives of product images.
+
+Rendering is pure CPU work on bytes, so it runs on a process pool; the parent
+process only reads the original, saves the results to storage and records
+them in ``ProductImageDerivative`` for the serializers.
+"""
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+
+from ecom.cache import invalidate_product
+from ecom.workers import setup_django
+
+from .models import ProductImage, ProductImageDerivative
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'WIDTHS': (320, 640, 1280),
+    'FORMATS': ('webp', 'avif'),
+    'QUALITY': 80,
+    'WORKERS': 2,
+}
+PIL_FORMATS = {'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP', 'avif': 'AVIF'}
+
+_executor = None
+
+
+def derivative_setting(name):
+    return getattr(settings, 'IMAGE_DERIVATIVES', {}).get(name, DEFAULTS[name])
+
+
+def output_formats(source_format):
+    """Same-format thumbnails plus whichever modern formats this Pillow can encode"""
+    formats = ['png' if source_format == 'PNG' else 'jpeg']
+    formats += [f for f in derivative_setting('FORMATS') if features.check(f)]
+    return formats
+
+
+def render_derivatives(data, widths, quality):
+    """Runs in a worker process; returns ``[(width, format, bytes), ...]``"""
+    with Image.open(io.BytesIO(data)) as source:
+        formats = output_formats(source.format)
+        source = ImageOps.exif_transpose(source)
+        if source.mode not in ('RGB', 'RGBA', 'L'):
+            source = source.convert('RGBA')
+        # Never upscale; an image narrower than every width gets one copy at its own width
+        targets = [w for w in widths if w < source.width] or [source.width]
+        rendered = []
+        for width in targets:
+            height = max(1, round(source.height * width / source.width))
+            resized = source.resize((width, height), Image.LANCZOS)
+            for fmt in formats:
+                frame = resized.convert('RGB') if fmt == 'jpeg' and resized.mode == 'RGBA' else resized
+                buffer = io.BytesIO()
+                frame.save(buffer, PIL_FORMATS[fmt], quality=quality, optimize=True)
+                rendered.append((width, fmt, buffer.getvalue()))
+        return rendered
+
+
+def render_image(image_id):
+    image = ProductImage.objects.get(pk=image_id)
+    with image.image.open('rb') as source:
+        data = source.read()
+    return render_derivatives(data, derivative_setting('WIDTHS'), derivative_setting('QUALITY'))
+
+
+def store_derivatives(image_id, rendered):
+    image = ProductImage.objects.filter(pk=image_id).first()
+    if image is None:
+        return []
+    stem = os.path.splitext(image.image.name)[0].replace('products/', 'derivatives/', 1)
+    derivatives = [
+        ProductImageDerivative(
+            image=image,
+            width=width,
+            format=fmt,
+            file=default_storage.save(f'{stem}_{width}.{fmt}', ContentFile(data)),
+        )
+        for width, fmt, data in rendered
+    ]
+    created = ProductImageDerivative.objects.bulk_create(derivatives, ignore_conflicts=True)
+    invalidate_product('api', image.product_id)
+    return created
+
+
+def generate_derivatives(image_id):
+    """Render and store synchronously, e.g. from a management command or a test"""
+    return store_derivatives(image_id, render_image(image_id))
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # spawn, not fork (see ecom/workers.py); unpickling render_derivatives imports the models
+        _executor = ProcessPoolExecutor(
+            max_workers=derivative_setting('WORKERS'),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=setup_django,
+        )
+    return _executor
+
+
+def schedule_derivatives(image_id):
+    """Read the upload here, render on the pool, store from the pool's callback thread"""
+    try:
+        image = ProductImage.objects.get(pk=image_id)
+        with image.image.open('rb') as source:
+            data = source.read()
+    except (ProductImage.DoesNotExist, OSError):
+        logger.exception('Cannot read product image %s for derivatives', image_id)
+        return
+
+    future = get_executor().submit(
+        render_derivatives, data, derivative_setting('WIDTHS'), derivative_setting('QUALITY')
+    )
+
+    def done(future):
+        try:
+            store_derivatives(image_id, future.result())
+        except Exception:
+            logger.exception('Derivatives failed for product image %s', image_id)
+        finally:
+            close_old_connections()
+
+    future.add_done_callback(done)
+
+
+def queue_derivatives(sender, instance, created, **kwargs):
+    """post_save hook for ProductImage"""
+    if created and instance.image:
+        transaction.on_commit(lambda: schedule_derivatives(instance.pk))
+
+
+def srcset(image, fmt, request=None):
+    entries = sorted(
+        (d for d in image.derivatives.all() if d.format == fmt), key=lambda d: d.width
+    )
+    return ', '.join(f'{absolute_url(d.file, request)} {d.width}w' for d in entries) or None
+
+
+def thumbnail_url(image, request=None):
+    """Smallest derivative in the original's format, else the original"""
+    derivatives = sorted(
+        (d for d in image.derivatives.all() if d.format in ('jpeg', 'png')), key=lambda d: d.width
+    )
+    name = derivatives[0].file if derivatives else image.image.name
+    return absolute_url(name, request)
+
+
+def absolute_url(name, request=None):
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request else url
@@ -0,0 +1,33 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from ecom import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Compare requests/s of JWT authentication with and without the per-process user cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Distinct users (and tokens) cycled through')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per run')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per authentication class; the fastest counts')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        with benchmark.scratch_environment():
+            self.stdout.write('Seeding...')
+            ds = benchmark.seed(users=options['users'], products=10, likes_per_product=0, comments_per_product=0,
+                                transactions=0, notifications_per_user=1)
+            results = benchmark.auth_benchmark(ds, options['requests'], options['repeat'])
+
+        baseline = results['JWTAuthentication']['requests_per_second']
+        for name, row in results.items():
+            self.stdout.write(
+                f'{name:24} {row["requests_per_second"]:10,.0f} requests/s  '
+                f'{row["requests_per_second"] / baseline:5.2f}x  {row["queries_per_request"]:.2f} queries/request'
+            )
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f'Results written to {options["output"]}')
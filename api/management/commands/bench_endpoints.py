@@ -0,0 +1,95 @@
+import json
+import subprocess
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from ecom import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway database and benchmark every api and prdapi route'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--transactions', type=int, default=2000)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=1, help='Concurrent workers per scenario')
+        parser.add_argument('--client', choices=('wsgi', 'asgi'), default='wsgi')
+        parser.add_argument('--only', help='Only scenarios whose name contains this text')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Compare against a JSON file written by --output')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed regression against --baseline (0.2 = 20%%)')
+        parser.add_argument('--use-current-db', action='store_true',
+                            help='Seed the configured database instead of a temporary copy')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            baseline = json.loads(Path(options['baseline']).read_text())['results']
+
+        with benchmark.scratch_environment(use_current_db=options['use_current_db']):
+            results, dataset = self.run(options)
+
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'commit': self.commit(),
+                'database': connection.vendor,
+                'client': options['client'],
+                'concurrency': options['concurrency'],
+                'requests_per_scenario': options['requests'],
+                'dataset': dataset.counts,
+            },
+            'results': results,
+        }
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2))
+            self.stdout.write(f'Results written to {options["output"]}')
+
+        # A scenario answered with the wrong status timed something other than what it names
+        mismatches = benchmark.mismatches(results)
+        if mismatches:
+            raise CommandError('Unexpected response status:\n  ' + '\n  '.join(mismatches))
+
+        if baseline is not None:
+            regressions = benchmark.compare(results, baseline, options['threshold'])
+            if regressions:
+                raise CommandError('Regressions against baseline:\n  ' + '\n  '.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
+
+    def run(self, options):
+        self.stdout.write('Seeding...')
+        dataset = benchmark.seed(
+            users=options['users'], products=options['products'], transactions=options['transactions']
+        )
+        self.stdout.write(
+            f'{"scenario":36} {"p50":>8} {"p95":>8} {"p99":>8} {"req/s":>8} {"queries":>8} {"errors":>7} {"unexpected":>10}'
+        )
+
+        def progress(name, row):
+            queries = '-' if row['queries_per_request'] is None else f'{row["queries_per_request"]:.1f}'
+            self.stdout.write(
+                f'{name:36} {row["p50_ms"]:8.2f} {row["p95_ms"]:8.2f} {row["p99_ms"]:8.2f} '
+                f'{row["rps"]:8.1f} {queries:>8} {row["errors"]:7d} {row["unexpected"]:10d}'
+            )
+
+        results = benchmark.run_benchmark(
+            dataset, requests=options['requests'], concurrency=options['concurrency'],
+            mode=options['client'], only=options['only'], progress=progress,
+        )
+        return results, dataset
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,84 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+
+from api.models import Product
+from api.views import ProductSearchAPIView
+
+BENCH_USERNAME = 'bench_search'
+SYLLABLES = ('ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'pa', 'do', 'fi', 'gu', 'ha', 'jo')
+
+
+def vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = 'Measure /products/search/ latency, optionally seeding synthetic products first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Insert this many synthetic products owned by the bench_search user')
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--target-ms', type=float, default=20.0,
+                            help='Fail when p95 latency exceeds this many milliseconds')
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete the synthetic products afterwards')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        words = vocabulary(5000, rng)
+
+        if options['seed']:
+            self.seed(options['seed'], words, rng)
+
+        factory = APIRequestFactory()
+        view = ProductSearchAPIView.as_view()
+        samples = []
+        for _ in range(options['queries']):
+            query = ' '.join(rng.sample(words, rng.randint(1, 2)))
+            request = factory.get('/products/search/', {'q': query})
+            started = time.perf_counter()
+            view(request).render()
+            samples.append((time.perf_counter() - started) * 1000)
+
+        p95 = percentile(samples, 95)
+        self.stdout.write(
+            f'{Product.objects.count()} products, {len(samples)} queries: '
+            f'p50={statistics.median(samples):.2f}ms p95={p95:.2f}ms '
+            f'p99={percentile(samples, 99):.2f}ms max={max(samples):.2f}ms'
+        )
+
+        if options['cleanup']:
+            User.objects.filter(username=BENCH_USERNAME).delete()
+
+        if p95 > options['target_ms']:
+            self.stderr.write(self.style.ERROR(f'p95 above target of {options["target_ms"]}ms'))
+            raise SystemExit(1)
+        self.stdout.write(self.style.SUCCESS('p95 within target'))
+
+    def seed(self, count, words, rng, batch_size=5000):
+        owner, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+        for start in range(0, count, batch_size):
+            Product.objects.bulk_create([
+                Product(
+                    user=owner,
+                    title=' '.join(rng.sample(words, 3)),
+                    description=' '.join(rng.sample(words, 25)),
+                )
+                for _ in range(min(batch_size, count - start))
+            ])
+            self.stdout.write(f'seeded {min(start + batch_size, count)}/{count}', ending='\r')
+        self.stdout.write('')
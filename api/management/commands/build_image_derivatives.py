@@ -0,0 +1,64 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from api.images import derivative_setting, render_derivatives, store_derivatives
+from api.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Render missing resized derivatives for existing product images (safe to rerun)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Render processes; defaults to IMAGE_DERIVATIVES["WORKERS"]')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many images')
+
+    def handle(self, *args, **options):
+        widths = derivative_setting('WIDTHS')
+        quality = derivative_setting('QUALITY')
+        # Images that already have derivatives are skipped, so an interrupted run resumes
+        pending = ProductImage.objects.filter(derivatives__isnull=True).order_by('pk')
+        total = pending.count()
+        if options['limit'] is not None:
+            total = min(total, options['limit'])
+        self.stdout.write(f'{total} image(s) without derivatives')
+
+        done = failed = 0
+        last_pk = 0
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=options['workers'] or derivative_setting('WORKERS')) as pool:
+            while done + failed < total:
+                size = min(options['batch_size'], total - done - failed)
+                batch = list(pending.filter(pk__gt=last_pk)[:size])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                futures = {}
+                for image in batch:
+                    try:
+                        with image.image.open('rb') as source:
+                            futures[pool.submit(render_derivatives, source.read(), widths, quality)] = image
+                    except OSError as exc:
+                        failed += 1
+                        self.stderr.write(f'image {image.pk}: cannot read {image.image.name}: {exc}')
+
+                for future in as_completed(futures):
+                    image = futures[future]
+                    try:
+                        store_derivatives(image.pk, future.result())
+                        done += 1
+                    except Exception as exc:
+                        failed += 1
+                        self.stderr.write(f'image {image.pk}: {exc}')
+
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{done + failed}/{total} processed ({failed} failed), '
+                    f'{(done + failed) / elapsed:.1f} images/s'
+                )
+
+        self.stdout.write(self.style.SUCCESS(f'Rendered derivatives for {done} image(s)'))
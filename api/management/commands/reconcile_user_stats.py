@@ -0,0 +1,63 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import UserStats
+from api.stats import FIELDS, count_user_stats
+
+
+class Command(BaseCommand):
+    help = 'Recount api UserStats from products, likes and comments and fix drift (run periodically)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drifted users without fixing them')
+
+    def handle(self, *args, **options):
+        drifted = missing = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    User.objects.filter(pk__gt=last_id).order_by('pk')
+                    .values_list('pk', flat=True)[:options['chunk_size']]
+                )
+                if not ids:
+                    break
+                last_id = ids[-1]
+
+                # Lock the rows so concurrent bump_user_stats calls wait for the fix
+                current = {
+                    stats.user_id: stats
+                    for stats in UserStats.objects.select_for_update().filter(user_id__in=ids)
+                }
+                stale, new = [], []
+                for user_id, totals in count_user_stats(ids).items():
+                    stats = current.get(user_id)
+                    if stats is None:
+                        new.append(UserStats(user_id=user_id, **totals))
+                        continue
+                    if all(getattr(stats, field) == totals[field] for field in FIELDS):
+                        continue
+                    self.stdout.write(
+                        f'user {user_id}: ' + ', '.join(
+                            f'{field} {getattr(stats, field)} -> {totals[field]}' for field in FIELDS
+                        )
+                    )
+                    for field in FIELDS:
+                        setattr(stats, field, totals[field])
+                    stale.append(stats)
+
+                drifted += len(stale)
+                missing += len(new)
+                if not options['dry_run']:
+                    UserStats.objects.bulk_update(stale, FIELDS)
+                    UserStats.objects.bulk_create(new, ignore_conflicts=True)
+
+        if not drifted and not missing:
+            self.stdout.write(self.style.SUCCESS('User stats are consistent'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{drifted} drifted and {missing} missing user stats row(s)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Fixed {drifted} drifted and created {missing} user stats row(s)'))
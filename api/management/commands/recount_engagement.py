@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from api import models as api_models
+from prdapi import models as prd_models
+
+TARGETS = {
+    'api': (api_models.Product, api_models.Like, api_models.Comment),
+    'prdapi': (prd_models.Product, prd_models.Like, prd_models.Comment),
+}
+
+
+def _totals(model, product_ids):
+    rows = (
+        model.objects.filter(product_id__in=product_ids)
+        .order_by()
+        .values('product_id')
+        .annotate(total=Count('pk'))
+    )
+    return {row['product_id']: row['total'] for row in rows}
+
+
+class Command(BaseCommand):
+    help = 'Rebuild denormalized like_count/comment_count on products and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--app', choices=sorted(TARGETS), action='append',
+                            help='Only recount this app (repeatable); defaults to all')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drifted products without fixing them')
+
+    def handle(self, *args, **options):
+        drifted_total = 0
+        for app in options['app'] or sorted(TARGETS):
+            drifted = self.recount(app, *TARGETS[app], options['chunk_size'], options['dry_run'])
+            drifted_total += drifted
+            self.stdout.write(f'{app}: {drifted} product(s) drifted')
+
+        if not drifted_total:
+            self.stdout.write(self.style.SUCCESS('Engagement counters are consistent'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{drifted_total} product(s) need fixing'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Fixed {drifted_total} product(s)'))
+
+    def recount(self, app, product_model, like_model, comment_model, chunk_size, dry_run):
+        drifted = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                chunk = list(
+                    product_model.objects.select_for_update()
+                    .filter(pk__gt=last_id)
+                    .order_by('pk')
+                    .only('pk', 'like_count', 'comment_count')[:chunk_size]
+                )
+                if not chunk:
+                    return drifted
+                last_id = chunk[-1].pk
+
+                ids = [product.pk for product in chunk]
+                likes = _totals(like_model, ids)
+                comments = _totals(comment_model, ids)
+
+                stale = []
+                for product in chunk:
+                    like_count = likes.get(product.pk, 0)
+                    comment_count = comments.get(product.pk, 0)
+                    if (product.like_count, product.comment_count) != (like_count, comment_count):
+                        self.stdout.write(
+                            f'{app} product {product.pk}: likes {product.like_count} -> {like_count}, '
+                            f'comments {product.comment_count} -> {comment_count}'
+                        )
+                        product.like_count = like_count
+                        product.comment_count = comment_count
+                        stale.append(product)
+
+                drifted += len(stale)
+                if stale and not dry_run:
+                    product_model.objects.bulk_update(stale, ['like_count', 'comment_count'])
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.trending import refresh_trending
+
+
+class Command(BaseCommand):
+    help = 'Rescore trending products that have new likes/comments since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Rescore every product with events (needed after changing TRENDING weights)')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep running, refreshing every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        full = options['full']
+        while True:
+            started = time.perf_counter()
+            count = refresh_trending(full=full, batch_size=options['batch_size'])
+            self.stdout.write(f'Rescored {count} product(s) in {time.perf_counter() - started:.2f}s')
+            if options['interval'] is None:
+                return
+            full = False
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,48 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:12
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+
+    def total(model_name):
+        rows = (
+            apps.get_model('api', model_name).objects.filter(product=OuterRef('pk'))
+            .order_by()
+            .values('product')
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+    Product.objects.update(like_count=total('Like'), comment_count=total('Comment'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-like_count', '-created_at'], name='api_product_like_co_2be24c_idx'),
+        ),
+    ]
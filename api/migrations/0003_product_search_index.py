@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:40
+
+from django.db import migrations
+
+from api.search import get_search_backend
+
+
+def install(apps, schema_editor):
+    get_search_backend(schema_editor.connection.vendor).install(schema_editor)
+
+
+def uninstall(apps, schema_editor):
+    get_search_backend(schema_editor.connection.vendor).uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_product_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
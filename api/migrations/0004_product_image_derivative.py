@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductImageDerivative',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.PositiveSmallIntegerField()),
+                ('format', models.CharField(choices=[('jpeg', 'JPEG'), ('png', 'PNG'), ('webp', 'WebP'), ('avif', 'AVIF')], max_length=4)),
+                ('file', models.CharField(help_text='Storage name of the resized file', max_length=255)),
+                ('image', models.ForeignKey(help_text='Original this was resized from', on_delete=django.db.models.deletion.CASCADE, related_name='derivatives', to='api.productimage')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('image', 'width', 'format'), name='unique_image_derivative')],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_user_stats(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserStats = apps.get_model('api', 'UserStats')
+
+    def total(model_name, owner):
+        rows = (
+            apps.get_model('api', model_name).objects.filter(**{owner: OuterRef('pk')})
+            .order_by()
+            .values(owner)
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+    users = User.objects.annotate(
+        n_products=total('Product', 'user'),
+        n_likes=total('Like', 'product__user'),
+        n_comments=total('Comment', 'user'),
+    ).values_list('pk', 'n_products', 'n_likes', 'n_comments')
+    UserStats.objects.bulk_create(
+        (
+            UserStats(user_id=pk, products_count=products, likes_received=likes, comments_made=comments)
+            for pk, products, likes, comments in users.iterator(chunk_size=2000)
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_product_image_derivative'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('products_count', models.PositiveIntegerField(default=0)),
+                ('likes_received', models.PositiveIntegerField(default=0)),
+                ('comments_made', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'user stats',
+            },
+        ),
+        migrations.RunPython(backfill_user_stats, migrations.RunPython.noop),
+    ]
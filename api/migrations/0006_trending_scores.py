@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_user_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTrendingScore',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='api.product')),
+                ('log_score', models.FloatField(db_index=True, help_text='Log of the decayed like/comment weight, relative to api.trending.EPOCH')),
+                ('likes', models.PositiveIntegerField(default=0, help_text='Likes counted in the score')),
+                ('comments', models.PositiveIntegerField(default=0, help_text='Comments counted in the score')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrendingWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('processed_until', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['created_at'], name='api_comment_created_db28e1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['created_at'], name='api_like_created_da30e2_idx'),
+        ),
+    ]
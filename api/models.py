@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Exists, OuterRef, Prefetch, Value
 from django.contrib.auth.models import User
 from django.core.validators import MinLengthValidator, FileExtensionValidator
 from django.core.exceptions import ValidationError
@@ -10,6 +11,29 @@ def validate_image_size(image):
         raise ValidationError(f'Image size cannot exceed 5MB. Current size: {image.size / (1024*1024):.2f}MB')
 
 
+class ProductQuerySet(models.QuerySet):
+    def with_engagement(self, user=None):
+        """Annotate the viewer's like and load relations so serializers never query per row"""
+        if user is not None and user.is_authenticated:
+            is_liked = Exists(Like.objects.filter(product=OuterRef('pk'), user=user))
+        else:
+            is_liked = Value(False)
+
+        return self.select_related('user').prefetch_related(
+            Prefetch('images', queryset=ProductImage.objects.prefetch_related('derivatives'))
+        ).annotate(is_liked_by_user=is_liked)
+
+    def with_recent_comments(self, limit):
+        """Load each product's newest ``limit`` comments and their authors into ``recent_comments``"""
+        return self.prefetch_related(
+            Prefetch(
+                'comments',
+                queryset=Comment.objects.select_related('user__stats').order_by('-created_at', '-id')[:limit],
+                to_attr='recent_comments',
+            )
+        )
+
+
 class Product(models.Model):
     user = models.ForeignKey(
         User,
@@ -26,14 +50,19 @@ class Product(models.Model):
         validators=[MinLengthValidator(10, 'Description must be at least 10 characters long')],
         help_text='Detailed product description'
     )
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['-created_at']),
             models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['-like_count', '-created_at']),
         ]
 
     def __str__(self):
@@ -88,6 +117,33 @@ class ProductImage(models.Model):
                 raise ValidationError('A product cannot have more than 10 images')
 
 
+class ProductImageDerivative(models.Model):
+    FORMAT_CHOICES = (
+        ('jpeg', 'JPEG'),
+        ('png', 'PNG'),
+        ('webp', 'WebP'),
+        ('avif', 'AVIF'),
+    )
+
+    image = models.ForeignKey(
+        ProductImage,
+        on_delete=models.CASCADE,
+        related_name='derivatives',
+        help_text='Original this was resized from'
+    )
+    width = models.PositiveSmallIntegerField()
+    format = models.CharField(max_length=4, choices=FORMAT_CHOICES)
+    file = models.CharField(max_length=255, help_text='Storage name of the resized file')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['image', 'width', 'format'], name='unique_image_derivative'),
+        ]
+
+    def __str__(self):
+        return f'{self.width}w {self.format} of image {self.image_id}'
+
+
 class Like(models.Model):
     user = models.ForeignKey(
         User,
@@ -109,6 +165,7 @@ class Like(models.Model):
         indexes = [
             models.Index(fields=['product', '-created_at']),
             models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['created_at']),
         ]
 
     def __str__(self):
@@ -142,6 +199,7 @@ class Comment(models.Model):
         indexes = [
             models.Index(fields=['product', '-created_at']),
             models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['created_at']),
         ]
 
     def __str__(self):
@@ -151,4 +209,52 @@ class Comment(models.Model):
         if self.text and len(self.text.strip()) < 1:
             raise ValidationError({'text': 'Comment cannot be empty or just whitespace'})
         if self.text and len(self.text) > 1000:
-            raise ValidationError({'text': 'Comment cannot exceed 1000 characters'})
\ No newline at end of file
+            raise ValidationError({'text': 'Comment cannot exceed 1000 characters'})
+
+
+class ProductTrendingScore(models.Model):
+    """Materialized popularity, maintained by api.trending.refresh_trending"""
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending'
+    )
+    log_score = models.FloatField(
+        db_index=True,
+        help_text='Log of the decayed like/comment weight, relative to api.trending.EPOCH'
+    )
+    likes = models.PositiveIntegerField(default=0, help_text='Likes counted in the score')
+    comments = models.PositiveIntegerField(default=0, help_text='Comments counted in the score')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Trending score for {self.product_id}'
+
+
+class TrendingWatermark(models.Model):
+    """Single row: events created before ``processed_until`` are already scored"""
+    processed_until = models.DateTimeField()
+
+    def __str__(self):
+        return f'Trending processed until {self.processed_until}'
+
+
+class UserStats(models.Model):
+    """Denormalized engagement totals per user, maintained by api.stats"""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    products_count = models.PositiveIntegerField(default=0)
+    likes_received = models.PositiveIntegerField(default=0)
+    comments_made = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'user stats'
+
+    def __str__(self):
+        return f'Stats for {self.user_id}'
@@ -0,0 +1,28 @@
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class ProductCursorPagination(CursorPagination):
+    """Keyset pagination over the (-created_at) product index; ties broken by id"""
+    page_size = getattr(settings, 'PRODUCT_PAGE_SIZE', 20)
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+    def get_paginated_data(self, data):
+        return OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+
+class CommentCursorPagination(ProductCursorPagination):
+    """Walks one product's comments down the (product, -created_at) index"""
+    page_size = getattr(settings, 'COMMENT_PAGE_SIZE', 20)
@@ -0,0 +1,143 @@
+import re
+
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+MAX_TERMS = 8
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+class SearchBackend:
+    """Returns ``[(product_id, relevance_score), ...]`` best match first"""
+
+    def install(self, schema_editor):
+        pass
+
+    def uninstall(self, schema_editor):
+        pass
+
+    def search(self, query, limit):
+        raise NotImplementedError
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """FTS5 external-content index over api_product, ranked with BM25"""
+    table = 'api_product_fts'
+    title_weight = 10.0
+    description_weight = 1.0
+
+    install_sql = (
+        "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        "title, description, content='api_product', content_rowid='id', tokenize='porter unicode61')",
+        "CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON api_product BEGIN "
+        "INSERT INTO {fts}(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+        "CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON api_product BEGIN "
+        "INSERT INTO {fts}({fts}, rowid, title, description) "
+        "VALUES ('delete', old.id, old.title, old.description); END",
+        # Counter updates touch api_product constantly; only reindex when the text changes
+        "CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF title, description ON api_product BEGIN "
+        "INSERT INTO {fts}({fts}, rowid, title, description) "
+        "VALUES ('delete', old.id, old.title, old.description); "
+        "INSERT INTO {fts}(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    )
+
+    def install(self, schema_editor):
+        # Table rebuilds in later migrations drop triggers, so this runs after every migrate
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                [f'{self.table}_a%'],
+            )
+            (triggers,) = cursor.fetchone()
+            if triggers == 3:
+                return
+            for statement in self.install_sql:
+                cursor.execute(statement.format(fts=self.table))
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+
+    def uninstall(self, schema_editor):
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {self.table}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def search(self, query, limit):
+        terms = search_terms(query)
+        if not terms:
+            return []
+        match = ' '.join(f'"{term}"*' for term in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, bm25({self.table}, %s, %s) AS score FROM {self.table} "
+                f"WHERE {self.table} MATCH %s ORDER BY score LIMIT %s",
+                [self.title_weight, self.description_weight, match, limit],
+            )
+            # bm25() is negative with lower meaning better; flip it for the API
+            return [(row_id, -score) for row_id, score in cursor.fetchall()]
+
+
+class PostgresSearchBackend(SearchBackend):
+    """GIN expression index over title/description, ranked with ts_rank_cd"""
+    document = "to_tsvector('english', coalesce(title, '') || ' ' || coalesce(description, ''))"
+
+    def install(self, schema_editor):
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS api_product_search_idx ON api_product USING GIN ({self.document})"
+        )
+
+    def uninstall(self, schema_editor):
+        schema_editor.execute('DROP INDEX IF EXISTS api_product_search_idx')
+
+    def search(self, query, limit):
+        if not search_terms(query):
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT id, ts_rank_cd({self.document}, q) AS score "
+                f"FROM api_product, websearch_to_tsquery('english', %s) q "
+                f"WHERE {self.document} @@ q ORDER BY score DESC, id DESC LIMIT %s",
+                [query, limit],
+            )
+            return [(row_id, score) for row_id, score in cursor.fetchall()]
+
+
+class ContainsSearchBackend(SearchBackend):
+    """Unindexed fallback for databases without a full-text engine"""
+
+    def search(self, query, limit):
+        from .models import Product
+
+        terms = search_terms(query)
+        if not terms:
+            return []
+        condition = Q()
+        for term in terms:
+            condition &= Q(title__icontains=term) | Q(description__icontains=term)
+        ids = Product.objects.filter(condition).values_list('id', flat=True)[:limit]
+        return [(row_id, 0.0) for row_id in ids]
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(vendor=None):
+    path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    return VENDOR_BACKENDS.get(vendor or connection.vendor, ContainsSearchBackend)()
+
+
+def install_search_index(sender=None, using='default', **kwargs):
+    """post_migrate hook that (re)creates the index if a migration dropped it"""
+    conn = connections[using]
+    if 'api_product' not in conn.introspection.table_names():
+        return
+    with conn.schema_editor() as schema_editor:
+        get_search_backend(conn.vendor).install(schema_editor)
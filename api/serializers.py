@@ -1,9 +1,15 @@
+from django.conf import settings
 from django.core.validators import FileExtensionValidator
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError as DjangoValidationError
+from ecom.fieldsets import SparseFieldsetMixin
+from ecom.passwords import create_user
+from .images import srcset, thumbnail_url
+from .stats import stats_for
 from .models import Product, ProductImage, Like, Comment
+from .uploads import MAX_IMAGE_SIZE, MAX_IMAGES_PER_PRODUCT
 import re
 
 
@@ -61,14 +67,16 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         validated_data.pop('password_confirm')
-        user = User.objects.create_user(
+        fields = dict(
             username=validated_data['username'],
             email=validated_data['email'],
-            password=validated_data['password'],
             first_name=validated_data.get('first_name', ''),
             last_name=validated_data.get('last_name', '')
         )
-        return user
+        # Hashed on the pool by the async view (see ecom/passwords.py)
+        if validated_data.get('password_hash'):
+            return create_user(validated_data['password_hash'], **fields)
+        return User.objects.create_user(password=validated_data['password'], **fields)
 
 
 class UserDetailSerializer(serializers.ModelSerializer):
@@ -80,15 +88,25 @@ class UserDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'username', 'email', 'date_joined')
 
     def get_products_count(self, obj):
-        return obj.products.count()
+        return stats_for(obj).products_count
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ('id', 'image', 'alt_text', 'order', 'uploaded_at')
+        fields = ('id', 'image', 'alt_text', 'order', 'uploaded_at', 'srcset')
         read_only_fields = ('id', 'uploaded_at')
 
+    def get_srcset(self, obj):
+        """{format: "url 320w, url 640w"} for the resized copies rendered so far"""
+        if obj.pk is None:
+            return {}
+        request = self.context.get('request')
+        formats = sorted({d.format for d in obj.derivatives.all()})
+        return {fmt: srcset(obj, fmt, request) for fmt in formats}
+
     def validate_image(self, value):
         if value.size > 5 * 1024 * 1024:  # 5MB
             raise serializers.ValidationError('Image size cannot exceed 5MB')
@@ -121,7 +139,7 @@ class CommentSerializer(serializers.ModelSerializer):
     def get_is_owner(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.user == request.user
+            return obj.user_id == request.user.id
         return False
 
     def validate_text(self, value):
@@ -134,9 +152,33 @@ class CommentSerializer(serializers.ModelSerializer):
         return value.strip()
 
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductEngagementMixin:
+    """Read engagement from the denormalized counters and ``with_engagement()`` annotations"""
+
+    def get_like_count(self, obj):
+        return obj.like_count
+
+    def get_comment_count(self, obj):
+        return obj.comment_count
+
+    def get_is_liked_by_user(self, obj):
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            if hasattr(obj, 'is_liked_by_user'):
+                return obj.is_liked_by_user
+            return obj.likes.filter(user=request.user).exists()
+        return False
+
+    def get_is_owner(self, obj):
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            return obj.user_id == request.user.id
+        return False
+
+
+class ProductListSerializer(SparseFieldsetMixin, ProductEngagementMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
-    user_id = serializers.IntegerField(source='user.id', read_only=True)
+    user_id = serializers.IntegerField(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
     like_count = serializers.SerializerMethodField()
     comment_count = serializers.SerializerMethodField()
@@ -151,31 +193,26 @@ class ProductListSerializer(serializers.ModelSerializer):
             'is_liked_by_user', 'is_owner', 'created_at', 'updated_at'
         )
         read_only_fields = ('id', 'created_at', 'updated_at')
+        expandable_fields = ('images',)
+        field_requirements = {
+            'username': ('user',),
+            'images': ('images',),
+            'is_liked_by_user': ('is_liked_by_user',),
+        }
 
-    def get_like_count(self, obj):
-        return obj.likes.count()
 
-    def get_comment_count(self, obj):
-        return obj.comments.count()
+class TrendingProductSerializer(ProductListSerializer):
+    trending_score = serializers.FloatField(read_only=True)
 
-    def get_is_liked_by_user(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.likes.filter(user=request.user).exists()
-        return False
-
-    def get_is_owner(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.user == request.user
-        return False
+    class Meta(ProductListSerializer.Meta):
+        fields = ProductListSerializer.Meta.fields + ('trending_score',)
 
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+class ProductDetailSerializer(SparseFieldsetMixin, ProductEngagementMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
-    user_id = serializers.IntegerField(source='user.id', read_only=True)
+    user_id = serializers.IntegerField(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
-    comments = CommentSerializer(many=True, read_only=True)
+    comments = serializers.SerializerMethodField()
     like_count = serializers.SerializerMethodField()
     comment_count = serializers.SerializerMethodField()
     is_liked_by_user = serializers.SerializerMethodField()
@@ -189,24 +226,21 @@ class ProductDetailSerializer(serializers.ModelSerializer):
             'is_liked_by_user', 'is_owner', 'created_at', 'updated_at'
         )
         read_only_fields = ('id', 'created_at', 'updated_at')
+        expandable_fields = ('images', 'comments')
+        field_requirements = {
+            'username': ('user',),
+            'images': ('images',),
+            'comments': ('recent_comments',),
+            'is_liked_by_user': ('is_liked_by_user',),
+        }
 
-    def get_like_count(self, obj):
-        return obj.likes.count()
-
-    def get_comment_count(self, obj):
-        return obj.comments.count()
-
-    def get_is_liked_by_user(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.likes.filter(user=request.user).exists()
-        return False
-
-    def get_is_owner(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.user == request.user
-        return False
+    def get_comments(self, obj):
+        """Newest comments only; the rest are paged from /products/<pk>/comments/"""
+        comments = getattr(obj, 'recent_comments', None)
+        if comments is None:
+            limit = getattr(settings, 'PRODUCT_DETAIL_COMMENTS', 10)
+            comments = obj.comments.select_related('user__stats').order_by('-created_at', '-id')[:limit]
+        return CommentSerializer(comments, many=True, context=self.context).data
 
 
 class ProductCreateUpdateSerializer(serializers.ModelSerializer):
@@ -348,7 +382,7 @@ class UserUpdateSerializer(serializers.ModelSerializer):
         return instance
 
 
-class ProductStatsSerializer(serializers.ModelSerializer):
+class ProductStatsSerializer(SparseFieldsetMixin, ProductEngagementMixin, serializers.ModelSerializer):
     like_count = serializers.SerializerMethodField()
     comment_count = serializers.SerializerMethodField()
     is_liked_by_user = serializers.SerializerMethodField()
@@ -357,18 +391,7 @@ class ProductStatsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ('id', 'like_count', 'comment_count', 'is_liked_by_user', 'view_count')
-
-    def get_like_count(self, obj):
-        return obj.likes.count()
-
-    def get_comment_count(self, obj):
-        return obj.comments.count()
-
-    def get_is_liked_by_user(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.likes.filter(user=request.user).exists()
-        return False
+        field_requirements = {'is_liked_by_user': ('is_liked_by_user',)}
 
 
 class ProductImageBulkSerializer(serializers.Serializer):
@@ -383,7 +406,7 @@ class ProductImageBulkSerializer(serializers.Serializer):
             ]
         ),
         allow_empty=False,
-        max_length=10
+        max_length=MAX_IMAGES_PER_PRODUCT
     )
     alt_texts = serializers.ListField(
         child=serializers.CharField(max_length=200, allow_blank=True),
@@ -392,8 +415,9 @@ class ProductImageBulkSerializer(serializers.Serializer):
     )
 
     def validate_images(self, value):
+        # ImageUploadHandler already stops oversized parts mid-stream; this covers other callers
         for image in value:
-            if image.size > 5 * 1024 * 1024:  # 5MB
+            if image.size > MAX_IMAGE_SIZE:
                 raise serializers.ValidationError(
                     f'Image {image.name} exceeds 5MB size limit'
                 )
@@ -411,9 +435,10 @@ class ProductImageBulkSerializer(serializers.Serializer):
         product = self.context.get('product')
         if product:
             existing_count = product.images.count()
-            if existing_count + len(images) > 10:
+            if existing_count + len(images) > MAX_IMAGES_PER_PRODUCT:
                 raise serializers.ValidationError(
-                    f'Cannot upload {len(images)} images. Product has {existing_count} images. Maximum is 10.'
+                    f'Cannot upload {len(images)} images. Product has {existing_count} images. '
+                    f'Maximum is {MAX_IMAGES_PER_PRODUCT}.'
                 )
 
         return attrs
@@ -446,16 +471,16 @@ class UserPublicSerializer(serializers.ModelSerializer):
         )
 
     def get_products_count(self, obj):
-        return obj.products.count()
+        return stats_for(obj).products_count
 
     def get_total_likes_received(self, obj):
-        return Like.objects.filter(product__user=obj).count()
+        return stats_for(obj).likes_received
 
     def get_total_comments_made(self, obj):
-        return obj.comments.count()
+        return stats_for(obj).comments_made
 
 
-class ProductMinimalSerializer(serializers.ModelSerializer):
+class ProductMinimalSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     thumbnail = serializers.SerializerMethodField()
     like_count = serializers.SerializerMethodField()
@@ -463,21 +488,20 @@ class ProductMinimalSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ('id', 'title', 'username', 'thumbnail', 'like_count', 'created_at')
+        field_requirements = {'username': ('user',), 'thumbnail': ('images',)}
 
     def get_thumbnail(self, obj):
-        first_image = obj.images.first()
+        # images.all() so a prefetch (with derivatives) is reused instead of a query per row
+        first_image = next(iter(obj.images.all()), None)
         if first_image:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(first_image.image.url)
-            return first_image.image.url
+            return thumbnail_url(first_image, self.context.get('request'))
         return None
 
     def get_like_count(self, obj):
-        return obj.likes.count()
+        return obj.like_count
 
 
-class ProductSearchSerializer(serializers.ModelSerializer):
+class ProductSearchSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     username = serializers.CharField(source='user.username', read_only=True)
     thumbnail = serializers.SerializerMethodField()
     excerpt = serializers.SerializerMethodField()
@@ -486,13 +510,12 @@ class ProductSearchSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ('id', 'title', 'username', 'thumbnail', 'excerpt', 'created_at', 'relevance_score')
+        field_requirements = {'username': ('user',), 'thumbnail': ('images',)}
 
     def get_thumbnail(self, obj):
-        first_image = obj.images.first()
+        first_image = next(iter(obj.images.all()), None)
         if first_image:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(first_image.image.url)
+            return thumbnail_url(first_image, self.context.get('request'))
         return None
 
     def get_excerpt(self, obj):
@@ -552,7 +575,7 @@ class CommentWithRepliesSerializer(serializers.ModelSerializer):
         return value.strip()
 
 
-class ProductWithUserSerializer(serializers.ModelSerializer):
+class ProductWithUserSerializer(SparseFieldsetMixin, ProductEngagementMixin, serializers.ModelSerializer):
     user = UserPublicSerializer(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
     like_count = serializers.SerializerMethodField()
@@ -568,24 +591,12 @@ class ProductWithUserSerializer(serializers.ModelSerializer):
             'like_count', 'comment_count', 'is_liked_by_user',
             'is_owner', 'latest_comments', 'created_at', 'updated_at'
         )
-
-    def get_like_count(self, obj):
-        return obj.likes.count()
-
-    def get_comment_count(self, obj):
-        return obj.comments.count()
-
-    def get_is_liked_by_user(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.likes.filter(user=request.user).exists()
-        return False
-
-    def get_is_owner(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.user == request.user
-        return False
+        expandable_fields = ('user', 'images', 'latest_comments')
+        field_requirements = {
+            'user': ('user',),
+            'images': ('images',),
+            'is_liked_by_user': ('is_liked_by_user',),
+        }
 
     def get_latest_comments(self, obj):
         latest = obj.comments.select_related('user').order_by('-created_at')[:3]
@@ -0,0 +1,61 @@
+"""
+Per-user engagement rollups.
+
+``UserStats`` holds what the user serializers used to COUNT on every call.
+Views adjust it with ``bump_user_stats`` in the same transaction as the write
+that changed it; ``manage.py reconcile_user_stats`` repairs any drift.
+"""
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+
+from .models import Comment, Like, Product, UserStats
+
+FIELDS = ('products_count', 'likes_received', 'comments_made')
+
+
+def count_user_stats(user_ids):
+    """Exact ``{user_id: {field: n}}`` from the source tables"""
+    totals = {user_id: dict.fromkeys(FIELDS, 0) for user_id in user_ids}
+    sources = (
+        ('products_count', Product.objects.filter(user_id__in=user_ids), 'user_id'),
+        ('likes_received', Like.objects.filter(product__user_id__in=user_ids), 'product__user_id'),
+        ('comments_made', Comment.objects.filter(user_id__in=user_ids), 'user_id'),
+    )
+    for field, queryset, owner in sources:
+        for row in queryset.order_by().values(owner).annotate(total=Count('pk')):
+            totals[row[owner]][field] = row['total']
+    return totals
+
+
+def refresh_user_stats(user_id):
+    stats = UserStats(user_id=user_id, **count_user_stats([user_id])[user_id])
+    UserStats.objects.bulk_create(
+        [stats], update_conflicts=True, unique_fields=['user'], update_fields=list(FIELDS)
+    )
+    return stats
+
+
+def bump_user_stats(user_id, **deltas):
+    """Apply ``field=delta`` changes; call inside the transaction that made them"""
+    # Clamped at zero: a drifted row should wait for reconcile_user_stats, not fail the request
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{field: Greatest(F(field) + delta, Value(0)) for field, delta in deltas.items()}
+    )
+    if not updated:
+        # No row yet: count from scratch, which already includes this write
+        refresh_user_stats(user_id)
+
+
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    """post_save hook for User: start every new account with an all-zero row"""
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+def stats_for(user):
+    """The user's rollup, via ``select_related('stats')`` when the caller did that"""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        user.stats = refresh_user_stats(user.pk)
+        return user.stats
@@ -1,3 +1,717 @@
-from django.test import TestCase
+import math
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from PIL import Image
+
+from ecom import benchmark
+
+from .images import generate_derivatives
+from .stats import refresh_user_stats
+from .trending import current_score, leaderboard, refresh_trending
+from .models import Product, ProductImage, ProductImageDerivative, Like, Comment, UserStats, ProductTrendingScore
+
+
+def seed_products(owner, fans, count):
+    products = Product.objects.bulk_create([
+        Product(user=owner, title=f'Product {i}', description='A product used in tests')
+        for i in range(count)
+    ])
+    ProductImage.objects.bulk_create([
+        ProductImage(product=product, image=f'products/{product.pk}.jpg') for product in products
+    ])
+    Like.objects.bulk_create([
+        Like(user=fan, product=product) for product in products for fan in fans
+    ])
+    Comment.objects.bulk_create([
+        Comment(user=fans[0], product=product, text='Nice one') for product in products
+    ])
+    Product.objects.filter(pk__in=[product.pk for product in products]).update(
+        like_count=len(fans), comment_count=1
+    )
+    return products
+
+
+@override_settings(ROOT_URLCONF='api.urls')
+class ProductListQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass12345')
+        cls.fans = [User.objects.create_user(f'fan{i}', password='pass12345') for i in range(2)]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_query_count_is_constant(self):
+        for count in (10, 1000, 10000):
+            with self.subTest(rows=count):
+                Product.objects.all().delete()
+                seed_products(self.owner, self.fans, count)
+                cache.clear()
+
+                # products with annotations + images prefetch + derivatives prefetch
+                with self.assertNumQueries(3):
+                    response = self.client.get('/products/', {'page_size': 100})
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['data']['results']), min(count, 100))
+
+    def test_annotations_match_per_row_counts(self):
+        product = seed_products(self.owner, self.fans, 1)[0]
+        self.client.force_authenticate(self.fans[0])
+
+        row = self.client.get('/products/').data['data']['results'][0]
+
+        self.assertEqual(row['like_count'], product.likes.count())
+        self.assertEqual(row['comment_count'], product.comments.count())
+        self.assertTrue(row['is_liked_by_user'])
+        self.assertFalse(row['is_owner'])
+        self.assertEqual(len(row['images']), 1)
+
+
+@override_settings(ROOT_URLCONF='api.urls')
+class SparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass12345')
+        cls.fan = User.objects.create_user('fan', password='pass12345')
+        cls.product = seed_products(cls.owner, [cls.fan], 3)[0]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.fan)
+
+    def test_fields_limit_the_payload_and_the_queries(self):
+        # No images prefetch, no owner join, no like subquery
+        with self.assertNumQueries(1) as ctx:
+            rows = self.client.get('/products/', {'fields': 'id,title,like_count'}).data['data']['results']
+
+        self.assertEqual(set(rows[0]), {'id', 'title', 'like_count'})
+        sql = ctx.captured_queries[0]['sql']
+        self.assertNotIn('auth_user', sql)
+        self.assertNotIn('api_like', sql)
+
+    def test_expand_picks_the_embeds(self):
+        url = f'/products/{self.product.pk}/'
+
+        bare = self.client.get(url, {'expand': ''}).data['data']
+        with_comments = self.client.get(url, {'fields': 'id', 'expand': 'comments'}).data['data']
+
+        self.assertNotIn('comments', bare)
+        self.assertNotIn('images', bare)
+        self.assertIn('title', bare)
+        self.assertEqual(set(with_comments), {'id', 'comments'})
+        self.assertEqual(len(with_comments['comments']), 1)
+
+    def test_unfiltered_response_is_unchanged(self):
+        row = self.client.get('/products/').data['data']['results'][0]
+
+        self.assertIn('images', row)
+        self.assertIn('is_liked_by_user', row)
+
+
+@override_settings(ROOT_URLCONF='api.urls')
+class ProductPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', password='pass12345')
+        cls.products = Product.objects.bulk_create([
+            Product(user=owner, title=f'Product {i}', description='A product used in tests')
+            for i in range(25)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_walks_every_product_once_in_stable_order(self):
+        seen = []
+        url = '/products/?page_size=10'
+        while url:
+            payload = self.client.get(url).data
+            self.assertTrue(payload['success'])
+            seen.extend(row['id'] for row in payload['data']['results'])
+            url = payload['data']['next']
+
+        expected = list(
+            Product.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_previous_link_returns_to_first_page(self):
+        first = self.client.get('/products/', {'page_size': 10}).data['data']
+        second = self.client.get(first['next']).data['data']
+        back = self.client.get(second['previous']).data['data']
+
+        self.assertIsNone(first['previous'])
+        self.assertEqual(
+            [row['id'] for row in back['results']],
+            [row['id'] for row in first['results']],
+        )
+
+
+@override_settings(ROOT_URLCONF='api.urls')
+class EngagementCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass12345')
+        cls.fan = User.objects.create_user('fan', password='pass12345')
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            user=self.owner, title='Desk lamp', description='A bright little desk lamp'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.fan)
+
+    def test_like_and_comment_write_paths_maintain_counters(self):
+        self.client.post('/likes/', {'product': self.product.pk})
+        comment_id = self.client.post(
+            '/comments/', {'product': self.product.pk, 'text': 'Love it'}
+        ).data['data']['id']
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.like_count, self.product.comment_count), (1, 1))
+
+        self.client.delete(f'/likes/{self.product.pk}/')
+        self.client.delete(f'/likes/{self.product.pk}/')
+        self.client.delete(f'/comments/{comment_id}/')
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.like_count, self.product.comment_count), (0, 0))
+
+    def test_recount_engagement_fixes_drift(self):
+        Like.objects.create(user=self.fan, product=self.product)
+        Product.objects.filter(pk=self.product.pk).update(comment_count=7)
+
+        out = StringIO()
+        call_command('recount_engagement', '--app', 'api', '--chunk-size', '1', stdout=out)
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.like_count, self.product.comment_count), (1, 0))
+        self.assertIn('Fixed 1 product(s)', out.getvalue())
+
+
+@override_settings(ROOT_URLCONF='api.urls')
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user('owner', password='pass12345')
+        cls.in_title = Product.objects.create(
+            user=owner, title='Walnut desk', description='Solid wood, seats two people comfortably'
+        )
+        cls.in_description = Product.objects.create(
+            user=owner, title='Office chair', description='Pairs well with any walnut furniture'
+        )
+        Product.objects.create(user=owner, title='Floor lamp', description='Warm light for reading')
+
+    def test_title_matches_rank_first(self):
+        results = self.client.get('/products/search/', {'q': 'walnut'}).data['data']
+
+        self.assertEqual([row['id'] for row in results], [self.in_title.pk, self.in_description.pk])
+        self.assertGreater(results[0]['relevance_score'], results[1]['relevance_score'])
+
+    def test_index_follows_updates_and_deletes(self):
+        Product.objects.filter(pk=self.in_description.pk).update(title='Walnut chair')
+        self.in_title.delete()
+
+        results = self.client.get('/products/search/', {'q': 'chair'}).data['data']
+        self.assertEqual([row['id'] for row in results], [self.in_description.pk])
+        self.assertFalse(self.client.get('/products/search/', {'q': 'desk'}).data['data'])
+
+    def test_prefix_and_punctuation(self):
+        results = self.client.get('/products/search/', {'q': 'lam"p OR'}).data['data']
+        self.assertEqual(results, [])
+        results = self.client.get('/products/search/', {'q': 'lam'}).data['data']
+        self.assertEqual(len(results), 1)
+
+    def test_short_query_is_rejected(self):
+        response = self.client.get('/products/search/', {'q': 'a'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_limit_is_at_least_one(self):
+        for limit in ('-1', '0'):
+            results = self.client.get('/products/search/', {'q': 'walnut', 'limit': limit}).data['data']
+            self.assertEqual([row['id'] for row in results], [self.in_title.pk])
+
+
+@override_settings(ROOT_URLCONF='api.urls')
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass12345')
+        cls.fan = User.objects.create_user('fan', password='pass12345')
+        cls.product = Product.objects.create(
+            user=cls.owner, title='Desk lamp', description='A bright little desk lamp'
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_hits_are_served_from_cache(self):
+        first = self.client.get(f'/products/{self.product.pk}/')
+        with self.assertNumQueries(0):
+            second = self.client.get(f'/products/{self.product.pk}/')
+
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn('Last-Modified', second)
+        self.assertIn('Authorization', second['Vary'])
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get('/products/')['ETag']
+
+        response = self.client.get('/products/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_writes_bump_product_and_list_versions(self):
+        detail_etag = self.client.get(f'/products/{self.product.pk}/')['ETag']
+        list_etag = self.client.get('/products/')['ETag']
+
+        client = APIClient()
+        client.force_authenticate(self.fan)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post('/likes/', {'product': self.product.pk})
+
+        detail = self.client.get(f'/products/{self.product.pk}/', HTTP_IF_NONE_MATCH=detail_etag)
+        listing = self.client.get('/products/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(detail.status_code, 200)
+        self.assertEqual(detail.json()['data']['like_count'], 1)
+        self.assertEqual(listing.status_code, 200)
+
+    def test_bump_in_another_process_reaches_this_one(self):
+        etag = self.client.get('/products/')['ETag']
+
+        # As manage.py refresh_trending, or another worker handling a write, would
+        subprocess.run(
+            [sys.executable, 'manage.py', 'shell', '-c',
+             'from ecom.cache import bump_versions; bump_versions("api:products")'],
+            cwd=settings.BASE_DIR, check=True, capture_output=True,
+        )
+
+        self.assertEqual(self.client.get('/products/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_authenticated_requests_bypass_cache(self):
+        self.client.get('/products/')
+        client = APIClient()
+        client.force_authenticate(self.fan)
+
+        response = client.get('/products/')
+
+        self.assertNotIn('ETag', response)
+
+    def test_works_with_file_based_cache(self):
+        with tempfile.TemporaryDirectory() as location:
+            backend = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+            with override_settings(CACHES={'default': backend}):
+                etag = self.client.get('/products/')['ETag']
+                response = self.client.get('/products/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(
+    ROOT_URLCONF='api.urls',
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    IMAGE_DERIVATIVES={'WIDTHS': (320, 640, 1280), 'FORMATS': ('webp',)},
+)
+class ImageDerivativeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass12345')
+        cls.product = Product.objects.create(user=cls.owner, title='Poster', description='A large poster')
+
+    def setUp(self):
+        cache.clear()
+
+    def make_image(self, width=800, height=400):
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), 'teal').save(buffer, 'JPEG')
+        name = default_storage.save('products/poster.jpg', ContentFile(buffer.getvalue()))
+        return ProductImage.objects.bulk_create([ProductImage(product=self.product, image=name)])[0]
+
+    def test_renders_each_width_below_the_original_in_each_format(self):
+        image = self.make_image()
+
+        generate_derivatives(image.pk)
+
+        rows = set(image.derivatives.values_list('width', 'format'))
+        self.assertEqual(rows, {(320, 'jpeg'), (640, 'jpeg'), (320, 'webp'), (640, 'webp')})
+        for derivative in image.derivatives.all():
+            with default_storage.open(derivative.file) as f, Image.open(f) as rendered:
+                self.assertEqual(rendered.size, (derivative.width, derivative.width // 2))
+
+    def test_small_original_is_not_upscaled(self):
+        image = self.make_image(width=200, height=100)
+
+        generate_derivatives(image.pk)
+
+        self.assertEqual(set(image.derivatives.values_list('width', flat=True)), {200})
+
+    def test_detail_exposes_srcset_and_list_thumbnail(self):
+        image = self.make_image()
+        generate_derivatives(image.pk)
+
+        data = self.client.get(f'/products/{self.product.pk}/').json()['data']
+        webp = data['images'][0]['srcset']['webp']
+        self.assertIn('320w', webp)
+        self.assertIn('640w', webp)
+
+    def test_backfill_command_skips_images_already_done(self):
+        done = self.make_image()
+        generate_derivatives(done.pk)
+        pending = self.make_image()
+        out = StringIO()
+
+        call_command('build_image_derivatives', workers=1, stdout=out)
+
+        self.assertIn('1 image(s) without derivatives', out.getvalue())
+        self.assertEqual(pending.derivatives.count(), 4)
+        self.assertEqual(ProductImageDerivative.objects.filter(image=done).count(), 4)
+
+
+def image_upload(name, fmt='JPEG', size=(64, 64)):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'orange').save(buffer, fmt)
+    buffer.seek(0)
+    buffer.name = name
+    return buffer
+
+
+@override_settings(ROOT_URLCONF='api.urls', MEDIA_ROOT=tempfile.mkdtemp())
+class ProductImageUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass12345')
+        cls.product = Product.objects.create(user=cls.owner, title='Bike', description='A sturdy city bike')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+        self.url = f'/products/{self.product.pk}/images/'
+
+    def test_uploads_images_with_alt_texts(self):
+        response = self.client.post(self.url, {
+            'images': [image_upload('a.jpg'), image_upload('b.png', 'PNG')],
+            'alt_texts': ['front', 'side'],
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            list(self.product.images.values_list('alt_text', 'order')), [('front', 1), ('side', 2)]
+        )
+
+    def test_extension_is_taken_from_the_bytes(self):
+        response = self.client.post(self.url, {'images': [image_upload('photo.jpg', 'PNG')]}, format='multipart')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(self.product.images.get().image.name.endswith('.png'))
+
+    def test_rejects_files_that_are_not_images(self):
+        fake = BytesIO(b'#!/bin/sh\necho not an image\n')
+        fake.name = 'evil.jpg'
+
+        response = self.client.post(self.url, {'images': [fake]}, format='multipart')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.product.images.exists())
+
+    def test_oversized_part_is_rejected(self):
+        huge = BytesIO(b'\xff\xd8\xff\xe0' + b'\0' * (5 * 1024 * 1024))
+        huge.name = 'huge.jpg'
+
+        response = self.client.post(self.url, {'images': [huge]}, format='multipart')
+
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(self.product.images.exists())
+
+    def test_per_product_limit_counts_existing_images(self):
+        ProductImage.objects.bulk_create([
+            ProductImage(product=self.product, image=f'products/{i}.jpg') for i in range(9)
+        ])
+
+        response = self.client.post(
+            self.url, {'images': [image_upload('a.jpg'), image_upload('b.jpg')]}, format='multipart'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Product has 9 images', response.json()['message'])
+        self.assertEqual(self.product.images.count(), 9)
+
+    def test_only_the_owner_can_upload(self):
+        self.client.force_authenticate(User.objects.create_user('other'))
+
+        response = self.client.post(self.url, {'images': [image_upload('a.jpg')]}, format='multipart')
+
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(ROOT_URLCONF='api.urls', PRODUCT_DETAIL_COMMENTS=3)
+class CommentThreadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass12345')
+        cls.product = Product.objects.create(user=cls.owner, title='Kettle', description='A quiet electric kettle')
+        cls.comments = [
+            Comment.objects.create(user=cls.owner, product=cls.product, text=f'Comment {i}') for i in range(25)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_detail_embeds_only_the_newest_comments(self):
+        data = self.client.get(f'/products/{self.product.pk}/').json()['data']
+
+        self.assertEqual(
+            [c['id'] for c in data['comments']], [c.pk for c in reversed(self.comments[-3:])]
+        )
+
+    def test_comment_endpoint_pages_through_every_comment(self):
+        seen = []
+        url = f'/products/{self.product.pk}/comments/?page_size=10'
+        while url:
+            page = self.client.get(url).json()['data']
+            seen.extend(c['id'] for c in page['results'])
+            url = page['next']
+
+        self.assertEqual(seen, [c.pk for c in reversed(self.comments)])
+
+    def test_comment_endpoint_404s_for_missing_product(self):
+        response = self.client.get('/products/999999/comments/')
+
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(ROOT_URLCONF='api.urls')
+class UserStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user('seller', password='pass12345')
+        cls.buyer = User.objects.create_user('buyer', password='pass12345')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def stats(self, user):
+        return UserStats.objects.filter(user=user).values('products_count', 'likes_received', 'comments_made').get()
+
+    def test_write_paths_keep_stats_current(self):
+        self.client.force_authenticate(self.seller)
+        product_id = self.client.post(
+            '/products/create/', {'title': 'Camera', 'description': 'A mirrorless camera'}
+        ).json()['data']['id']
+        self.client.force_authenticate(self.buyer)
+        self.client.post('/likes/', {'product': product_id})
+        self.client.post('/comments/', {'product': product_id, 'text': 'Still available?'})
+
+        self.assertEqual(self.stats(self.seller), {'products_count': 1, 'likes_received': 1, 'comments_made': 0})
+        self.assertEqual(self.stats(self.buyer), {'products_count': 0, 'likes_received': 0, 'comments_made': 1})
+
+        self.client.delete(f'/likes/{product_id}/')
+        self.assertEqual(self.stats(self.seller)['likes_received'], 0)
+
+        self.client.post('/likes/', {'product': product_id})
+        self.client.force_authenticate(self.seller)
+        self.client.delete(f'/products/{product_id}/edit/')
+
+        self.assertEqual(self.stats(self.seller), {'products_count': 0, 'likes_received': 0, 'comments_made': 0})
+        self.assertEqual(self.stats(self.buyer)['comments_made'], 0)
+
+    def test_profile_cost_does_not_grow_with_products(self):
+        seed_products(self.seller, [self.buyer], 50)
+        call_command('reconcile_user_stats', stdout=StringIO())
+        self.client.force_authenticate(User.objects.get(pk=self.seller.pk))
+
+        # the stats row is the only query
+        with self.assertNumQueries(1):
+            data = self.client.get('/auth/user/').json()['data']
+
+        self.assertEqual(data['products_count'], 50)
+
+    def test_product_detail_query_count_is_independent_of_comment_count(self):
+        product = seed_products(self.seller, [self.buyer], 1)[0]
+        Comment.objects.bulk_create([Comment(user=self.buyer, product=product, text='Hi') for _ in range(30)])
+
+        # product, images, derivatives, comments with users and stats
+        with self.assertNumQueries(4):
+            self.client.get(f'/products/{product.pk}/')
+
+    def test_reconcile_repairs_drift(self):
+        seed_products(self.seller, [self.buyer], 3)
+        UserStats.objects.filter(user=self.seller).delete()
+        UserStats.objects.update_or_create(user=self.buyer, defaults={'comments_made': 99})
+        out = StringIO()
+
+        call_command('reconcile_user_stats', stdout=out)
+
+        self.assertIn('comments_made 99 -> 3', out.getvalue())
+        self.assertEqual(self.stats(self.seller), {'products_count': 3, 'likes_received': 3, 'comments_made': 0})
+        self.assertEqual(self.stats(self.buyer)['comments_made'], 3)
+
+    def test_drifted_row_does_not_fail_the_write(self):
+        product = seed_products(self.seller, [self.buyer], 1)[0]
+        UserStats.objects.filter(user=self.seller).update(likes_received=0)
+        self.client.force_authenticate(self.buyer)
+
+        self.assertEqual(self.client.delete(f'/likes/{product.pk}/').status_code, 200)
+        self.assertEqual(self.stats(self.seller)['likes_received'], 0)
+
+
+@override_settings(ROOT_URLCONF='api.urls', TRENDING={'HALF_LIFE_HOURS': 24, 'LIKE_WEIGHT': 1.0, 'COMMENT_WEIGHT': 2.0})
+class TrendingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner', password='pass12345')
+        cls.fans = [User.objects.create_user(f'fan{i}', password='pass12345') for i in range(5)]
+        cls.fresh = Product.objects.create(user=cls.owner, title='Fresh', description='Liked just now')
+        cls.stale = Product.objects.create(user=cls.owner, title='Stale', description='Liked a while ago')
+
+    def setUp(self):
+        cache.clear()
+        leaderboard.clear()
+
+    def like(self, product, fans, age=timedelta(0)):
+        likes = Like.objects.bulk_create([Like(user=fan, product=product) for fan in fans])
+        Like.objects.filter(pk__in=[like.pk for like in likes]).update(created_at=timezone.now() - age)
+        Product.objects.filter(pk=product.pk).update(like_count=len(fans))
+        refresh_user_stats(product.user_id)
+
+    def test_recent_engagement_outranks_older_engagement(self):
+        self.like(self.fresh, self.fans[:2])
+        self.like(self.stale, self.fans, age=timedelta(days=3))
+
+        refresh_trending()
+        results = self.client.get('/products/trending/').json()['data']
+
+        self.assertEqual([row['id'] for row in results], [self.fresh.pk, self.stale.pk])
+        # five likes, three half-lives old
+        self.assertAlmostEqual(results[1]['trending_score'], 5 / 8, places=3)
+
+    def test_limit_is_at_least_one(self):
+        self.like(self.fresh, self.fans[:2])
+        self.like(self.stale, self.fans, age=timedelta(days=3))
+        refresh_trending()
+
+        for limit in ('-1', '0'):
+            results = self.client.get('/products/trending/', {'limit': limit}).json()['data']
+            self.assertEqual([row['id'] for row in results], [self.fresh.pk])
+
+    def test_score_is_the_decayed_sum(self):
+        self.like(self.stale, self.fans[:1], age=timedelta(hours=24))
+        Comment.objects.create(user=self.fans[0], product=self.stale, text='Nice')
+
+        refresh_trending()
+
+        score = current_score(ProductTrendingScore.objects.get(product=self.stale).log_score)
+        self.assertTrue(math.isclose(score, 0.5 + 2.0, rel_tol=1e-3))
+
+    def test_refresh_only_rescores_products_with_new_events(self):
+        self.like(self.fresh, self.fans[:2])
+        self.like(self.stale, self.fans[:2])
+        self.assertEqual(refresh_trending(), 2)
+
+        Like.objects.filter(product=self.fresh).update(created_at=timezone.now() - timedelta(hours=1))
+        Like.objects.filter(product=self.stale).update(created_at=timezone.now() - timedelta(hours=1))
+        refresh_trending(full=True)
+        Comment.objects.create(user=self.fans[0], product=self.fresh, text='Still here')
+
+        self.assertEqual(refresh_trending(), 1)
+
+    def test_unlike_is_picked_up_through_the_counter(self):
+        self.like(self.fresh, self.fans[:2], age=timedelta(hours=2))
+        refresh_trending(full=True)
+        client = APIClient()
+        client.force_authenticate(self.fans[0])
+
+        client.delete(f'/likes/{self.fresh.pk}/')
+        refresh_trending()
+
+        self.assertEqual(ProductTrendingScore.objects.get(product=self.fresh).likes, 1)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class CredentialViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def post(self, path, data):
+        return self.client.post(f'/api/v2/auth/{path}/', data, content_type='application/json')
+
+    def test_register_then_login_in_the_api_envelope(self):
+        response = self.post('register', {
+            'username': 'newcomer', 'email': 'newcomer@example.com',
+            'password': 'a-long-passphrase', 'password_confirm': 'a-long-passphrase',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['data']['username'], 'newcomer')
+        self.assertTrue(User.objects.get(username='newcomer').password.startswith('md5$'))
+
+        response = self.post('login', {'username': 'newcomer', 'password': 'a-long-passphrase'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['success'])
+        self.assertIn('access', response.json()['data'])
+
+    def test_errors_keep_the_envelope(self):
+        response = self.post('login', {'username': 'nobody', 'password': 'whatever'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'success': False, 'message': 'Invalid username or password', 'errors': None})
+
+        response = self.client.post('/api/v2/auth/login/', '{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+
+
+class BenchmarkHarnessTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_every_scenario_runs_against_a_seeded_dataset(self):
+        media = tempfile.mkdtemp()
+        with override_settings(MEDIA_ROOT=media, NOTIFICATION_DISPATCH={'MODE': 'inline'}):
+            ds = benchmark.seed(users=6, products=4, likes_per_product=2, comments_per_product=2,
+                                transactions=4, notifications_per_user=2)
+            results = benchmark.run_benchmark(ds, requests=2)
+
+        self.assertEqual(set(results), {scenario.name for scenario in benchmark.SCENARIOS})
+        self.assertEqual(Product.objects.count(), 4 + 2)
+        self.assertEqual(results['api products']['requests'], 2)
+        self.assertEqual(results['api like']['errors'], 0)
+        self.assertEqual(benchmark.mismatches(results), [])
+        self.assertIsNotNone(results['api product detail']['queries_per_request'])
+
+    def test_compare_flags_regressions_beyond_the_threshold(self):
+        row = {'p95_ms': 10.0, 'rps': 100.0, 'queries_per_request': 3.0, 'server_errors': 0}
+        baseline = {'fast': row, 'slow': row, 'chatty': row}
+        results = {
+            'fast': dict(row, p95_ms=11.0),
+            'slow': dict(row, p95_ms=20.0, rps=50.0),
+            'chatty': dict(row, queries_per_request=9.0, server_errors=1),
+        }
+
+        regressions = benchmark.compare(results, baseline, threshold=0.2)
+
+        self.assertEqual(len(regressions), 4)
+        self.assertFalse(any(line.startswith('fast') for line in regressions))
+
+    def test_mismatches_name_scenarios_with_unexpected_statuses(self):
+        results = {
+            'ok': benchmark.summarize([1.0, 2.0], [201, 201], 1.0, None, expected=201),
+            'rejected': benchmark.summarize([1.0, 2.0], [200, 400], 1.0, None),
+        }
+
+        self.assertEqual(benchmark.mismatches(results), ['rejected: 1 of 2 response(s) were not 200'])
@@ -0,0 +1,166 @@
+"""
+Time-decayed popularity for api products.
+
+A product's score at time ``t`` is the sum over its likes and comments of
+``weight * 2 ** -((t - event_time) / half_life)``. Every score decays by the
+same factor as time passes, so the ranking only changes when events arrive.
+``ProductTrendingScore`` therefore stores the time-independent part,
+
+    log_score = log(sum(weight * 2 ** ((event_time - EPOCH) / half_life)))
+
+(kept as a log so it never overflows), and orders by it directly. The
+current score is ``exp(log_score - (now - EPOCH) / half_life * ln 2)``.
+"""
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ecom.cache import bump_versions, get_versions
+
+from .models import Comment, Like, ProductTrendingScore, TrendingWatermark
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+CACHE_SCOPE = 'api:trending'
+
+DEFAULTS = {
+    'HALF_LIFE_HOURS': 24,
+    'LIKE_WEIGHT': 1.0,
+    'COMMENT_WEIGHT': 2.0,
+    'TOP_K': 100,
+    'CACHE_SECONDS': 60,
+    # Events committed this long after their created_at are still picked up
+    'LAG_SECONDS': 60,
+}
+
+
+def trending_setting(name):
+    return getattr(settings, 'TRENDING', {}).get(name, DEFAULTS[name])
+
+
+def _rate():
+    """ln 2 per half-life, per second"""
+    return math.log(2) / (trending_setting('HALF_LIFE_HOURS') * 3600)
+
+
+def log_terms(timestamps, weight):
+    rate, log_weight = _rate(), math.log(weight)
+    return [log_weight + (ts - EPOCH).total_seconds() * rate for ts in timestamps]
+
+
+def log_sum_exp(terms):
+    peak = max(terms)
+    return peak + math.log(sum(math.exp(term - peak) for term in terms))
+
+
+def current_score(log_score, now=None):
+    elapsed = ((now or timezone.now()) - EPOCH).total_seconds()
+    return math.exp(log_score - elapsed * _rate())
+
+
+def _timestamps(model, product_ids):
+    stamps = {}
+    rows = model.objects.filter(product_id__in=product_ids).order_by().values_list('product_id', 'created_at')
+    for product_id, created_at in rows.iterator(chunk_size=5000):
+        stamps.setdefault(product_id, []).append(created_at)
+    return stamps
+
+
+def rescore(product_ids):
+    """Recompute scores for these products from all of their events"""
+    likes = _timestamps(Like, product_ids)
+    comments = _timestamps(Comment, product_ids)
+    rows, empty = [], []
+    for product_id in product_ids:
+        terms = (log_terms(likes.get(product_id, ()), trending_setting('LIKE_WEIGHT'))
+                 + log_terms(comments.get(product_id, ()), trending_setting('COMMENT_WEIGHT')))
+        if not terms:
+            empty.append(product_id)
+            continue
+        rows.append(ProductTrendingScore(
+            product_id=product_id,
+            log_score=log_sum_exp(terms),
+            likes=len(likes.get(product_id, ())),
+            comments=len(comments.get(product_id, ())),
+        ))
+    ProductTrendingScore.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['product'],
+        update_fields=['log_score', 'likes', 'comments', 'updated_at'],
+    )
+    ProductTrendingScore.objects.filter(product_id__in=empty).delete()
+    return len(rows)
+
+
+def dirty_products(since):
+    """Products with events after ``since``, or whose counters moved since they were scored"""
+    ids = set()
+    if since is not None:
+        for model in (Like, Comment):
+            ids.update(model.objects.filter(created_at__gt=since).values_list('product_id', flat=True).distinct())
+    # Unlikes and deleted comments leave no event behind; the denormalized counters show them
+    ids.update(
+        ProductTrendingScore.objects.filter(
+            Q(likes__gt=F('product__like_count')) | Q(comments__gt=F('product__comment_count'))
+        ).values_list('product_id', flat=True)
+    )
+    return ids
+
+
+def refresh_trending(full=False, batch_size=500):
+    """Rescore what changed since the watermark; returns the number of products rescored"""
+    started = timezone.now()
+    watermark = TrendingWatermark.objects.filter(pk=1).values_list('processed_until', flat=True).first()
+    if full or watermark is None:
+        ids = set(Like.objects.values_list('product_id', flat=True).distinct())
+        ids.update(Comment.objects.values_list('product_id', flat=True).distinct())
+        ids.update(ProductTrendingScore.objects.values_list('product_id', flat=True))
+    else:
+        ids = dirty_products(watermark)
+
+    ids = sorted(ids)
+    for start in range(0, len(ids), batch_size):
+        with transaction.atomic():
+            rescore(ids[start:start + batch_size])
+
+    with transaction.atomic():
+        TrendingWatermark.objects.update_or_create(
+            pk=1, defaults={'processed_until': started - timedelta(seconds=trending_setting('LAG_SECONDS'))}
+        )
+        if ids:
+            bump_versions(CACHE_SCOPE)
+    return len(ids)
+
+
+class Leaderboard:
+    """Top-K ``(product_id, log_score)`` held in memory between refreshes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []
+        self._version = None
+        self._loaded_at = 0.0
+
+    def top(self, limit):
+        version = get_versions([CACHE_SCOPE])[0]
+        with self._lock:
+            stale = time.monotonic() - self._loaded_at > trending_setting('CACHE_SECONDS')
+            if stale or version != self._version:
+                self._entries = list(
+                    ProductTrendingScore.objects.order_by('-log_score', '-product_id')
+                    .values_list('product_id', 'log_score')[:trending_setting('TOP_K')]
+                )
+                self._version = version
+                self._loaded_at = time.monotonic()
+            return self._entries[:limit]
+
+    def clear(self):
+        with self._lock:
+            self._entries, self._version, self._loaded_at = [], None, 0.0
+
+
+leaderboard = Leaderboard()
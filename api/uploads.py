@@ -0,0 +1,131 @@
+"""
+Streaming upload handling for product images.
+
+``ImageUploadHandler`` replaces Django's default handlers for the bulk image
+endpoint. Every part is spooled to a temporary file chunk by chunk (so memory
+stays flat whatever the request size) and the upload is stopped as soon as a
+limit is crossed, instead of after the whole body has been buffered.
+"""
+import os
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+
+MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
+MAX_IMAGES_PER_PRODUCT = 10
+# Room for the multipart boundaries, part headers and alt_texts fields
+FORM_OVERHEAD = 64 * 1024
+
+# (content type, extension, test on the first bytes)
+SIGNATURES = (
+    ('image/jpeg', 'jpg', lambda head: head.startswith(b'\xff\xd8\xff')),
+    ('image/png', 'png', lambda head: head.startswith(b'\x89PNG\r\n\x1a\n')),
+    ('image/webp', 'webp', lambda head: head[:4] == b'RIFF' and head[8:12] == b'WEBP'),
+)
+SNIFF_BYTES = 12
+
+
+def sniff_image_type(head):
+    """(content type, extension) from the leading bytes, or None for anything else"""
+    for content_type, extension, matches in SIGNATURES:
+        if matches(head):
+            return content_type, extension
+    return None
+
+
+class UploadRejected(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """Spool ``field_name`` parts to disk, rejecting them while they stream in
+
+    ``existing_count`` is how many images the product already has; the
+    handler refuses the part that would take it past ``max_images``.
+    Rejections are kept on ``self.error`` for the view to report.
+    """
+
+    def __init__(self, request=None, existing_count=0, field_name='images',
+                 max_size=MAX_IMAGE_SIZE, max_images=MAX_IMAGES_PER_PRODUCT):
+        super().__init__(request)
+        self.field_name = field_name
+        self.max_size = max_size
+        self.remaining = max_images - existing_count
+        self.max_images = max_images
+        self.existing_count = existing_count
+        self.received = 0
+        self.error = None
+        self.head = b''
+
+    def reject(self, message, status=400):
+        self.error = UploadRejected(message, status)
+        # The parser closes (and so deletes) self.file on StopUpload; connection_reset
+        # tells it not to read the rest of the body either
+        raise StopUpload(connection_reset=True)
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        limit = max(self.remaining, 0) * self.max_size + FORM_OVERHEAD
+        if content_length > limit:
+            # Too large to possibly be valid; answer without reading a byte of it
+            self.error = UploadRejected(
+                f'Request body of {content_length} bytes exceeds the {limit} bytes this product can take',
+                status=413,
+            )
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None,
+                 content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        if field_name != self.field_name:
+            self.reject(f'Unexpected file field "{field_name}"')
+        self.received += 1
+        if self.received > self.remaining:
+            self.reject(
+                f'Cannot upload more than {self.remaining} images. Product has '
+                f'{self.existing_count} images. Maximum is {self.max_images}.'
+            )
+        if content_length is not None and content_length > self.max_size:
+            self.reject(f'Image {file_name} exceeds 5MB size limit', status=413)
+        self.head = b''
+        self.file = TemporaryUploadedFile(file_name, content_type, 0, charset, content_type_extra)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            self.reject(f'Image {self.file_name} exceeds 5MB size limit', status=413)
+        if len(self.head) < SNIFF_BYTES:
+            self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES:
+                self.check_signature()
+        self.file.write(raw_data)
+        return None
+
+    def check_signature(self):
+        sniffed = sniff_image_type(self.head)
+        if sniffed is None:
+            self.reject(f'{self.file_name} is not a JPEG, PNG or WEBP image')
+        # Trust the bytes, not the client: fix up the type and extension to match
+        self.file.content_type, extension = sniffed
+        self.file.name = f'{os.path.splitext(self.file_name)[0] or "image"}.{extension}'
+
+    def file_complete(self, file_size):
+        if len(self.head) < SNIFF_BYTES:
+            # Too short to have been checked while streaming. The last part completes
+            # outside the parser's StopUpload handling, so record rather than raise.
+            try:
+                self.check_signature()
+            except StopUpload:
+                self.file.close()
+                return None
+        self.file.seek(0)
+        self.file.size = file_size
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.file.close()
@@ -2,7 +2,8 @@ from django.urls import path
 
 from api.views import RegisterAPIView, LoginAPIView, UserDetailAPIView, ProductListAPIView, ProductCreateAPIView, \
     ProductDetailAPIView, ProductUpdateDeleteAPIView, LikeCreateAPIView, LikeDeleteAPIView, CommentCreateAPIView, \
-    CommentDeleteAPIView
+    CommentDeleteAPIView, ProductSearchAPIView, ProductImageUploadAPIView, \
+    ProductCommentListAPIView, ProductTrendingAPIView
 
 urlpatterns = [
     # Auth
@@ -13,8 +14,12 @@ urlpatterns = [
     # Products
     path("products/", ProductListAPIView.as_view()),
     path("products/create/", ProductCreateAPIView.as_view()),
+    path("products/search/", ProductSearchAPIView.as_view()),
+    path("products/trending/", ProductTrendingAPIView.as_view()),
     path("products/<int:pk>/", ProductDetailAPIView.as_view()),
     path("products/<int:pk>/edit/", ProductUpdateDeleteAPIView.as_view()),
+    path("products/<int:pk>/images/", ProductImageUploadAPIView.as_view()),
+    path("products/<int:pk>/comments/", ProductCommentListAPIView.as_view()),
 
     # Likes
     path("likes/", LikeCreateAPIView.as_view()),
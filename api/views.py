@@ -1,14 +1,24 @@
 # utils/responses.py
-from django.contrib.auth import authenticate
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Count, F
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from ecom.cache import cache_response, invalidate_product
+from ecom.credentials import CredentialView, render_json
+from ecom.passwords import authenticate, make_password
+
 from .models import Product, Like, Comment
+from .pagination import CommentCursorPagination, ProductCursorPagination
+from .search import get_search_backend
+from .stats import bump_user_stats
+from .trending import CACHE_SCOPE as TRENDING_SCOPE, current_score, leaderboard, trending_setting
 from .serializers import UserRegistrationSerializer, UserDetailSerializer, ProductListSerializer, \
-    ProductDetailSerializer, LikeSerializer
+    ProductDetailSerializer, LikeSerializer, ProductSearchSerializer, TrendingProductSerializer
 
 
 def api_success(message, data=None, status=200):
@@ -25,40 +35,50 @@ def api_error(message, errors=None, status=400):
         "errors": errors
     }, status=status)
 
-class RegisterAPIView(APIView):
-    permission_classes = [AllowAny]
-
-    def post(self, request):
-        serializer = UserRegistrationSerializer(data=request.data)
-        if serializer.is_valid():
-            user = serializer.save()
-            return api_success(
-                "User registered successfully",
-                UserDetailSerializer(user).data,
-                status=status.HTTP_201_CREATED
-            )
-        return api_error("Validation error", serializer.errors)
-
-
-
-class LoginAPIView(APIView):
-    permission_classes = [AllowAny]
-
-    def post(self, request):
-        user = authenticate(
-            username=request.data.get("username"),
-            password=request.data.get("password")
+class CredentialAPIView(CredentialView):
+    """CredentialView answering in the api_success/api_error envelope"""
+
+    def error_body(self, message, errors=None):
+        return {"success": False, "message": message, "errors": errors}
+
+    def success(self, message, data=None, status=200):
+        return render_json({"success": True, "message": message, "data": data}, status=status)
+
+class RegisterAPIView(CredentialAPIView):
+    async def post(self, request):
+        data = self.payload(request)
+        await self.throttle(request, data.get("username"))
+
+        serializer = UserRegistrationSerializer(data=data)
+        if not await sync_to_async(serializer.is_valid)():
+            return render_json(self.error_body("Validation error", serializer.errors), status=400)
+        encoded = await make_password(serializer.validated_data["password"])
+        user = await sync_to_async(serializer.save)(password_hash=encoded)
+        return self.success(
+            "User registered successfully",
+            await sync_to_async(lambda: UserDetailSerializer(user).data)(),
+            status=status.HTTP_201_CREATED
         )
 
+class LoginAPIView(CredentialAPIView):
+    async def post(self, request):
+        data = self.payload(request)
+        username = data.get("username")
+        await self.throttle(request, username)
+
+        user = await authenticate(request, username, data.get("password"))
         if not user:
-            return api_error("Invalid username or password", status=401)
+            return self.error("Invalid username or password", status.HTTP_401_UNAUTHORIZED)
 
+        return self.success("Login successful", await sync_to_async(self.tokens)(user))
+
+    def tokens(self, user):
         token = RefreshToken.for_user(user)
-        return api_success("Login successful", {
+        return {
             "access": str(token.access_token),
             "refresh": str(token),
             "user": UserDetailSerializer(user).data
-        })
+        }
 
 class UserDetailAPIView(APIView):
     permission_classes = [IsAuthenticated]
@@ -72,12 +92,69 @@ class UserDetailAPIView(APIView):
 class ProductListAPIView(APIView):
     permission_classes = [AllowAny]
 
+    @cache_response("api:products")
     def get(self, request):
-        products = Product.objects.all()
+        paginator = ProductCursorPagination()
+        products = paginator.paginate_queryset(
+            ProductListSerializer.prune_queryset(Product.objects.with_engagement(request.user), request),
+            request, view=self
+        )
         serializer = ProductListSerializer(
             products, many=True, context={"request": request}
         )
-        return api_success("Product list", serializer.data)
+        return api_success("Product list", paginator.get_paginated_data(serializer.data))
+
+class ProductSearchAPIView(APIView):
+    permission_classes = [AllowAny]
+    max_results = 50
+
+    def get(self, request):
+        query = request.GET.get("q", "").strip()
+        if len(query) < 2:
+            return api_error("Search query must be at least 2 characters")
+        try:
+            limit = max(1, min(int(request.GET.get("limit", 20)), self.max_results))
+        except ValueError:
+            return api_error("limit must be a number")
+
+        hits = get_search_backend().search(query, limit)
+        products = ProductSearchSerializer.prune_queryset(
+            Product.objects.select_related("user").prefetch_related("images__derivatives"), request
+        ).in_bulk([product_id for product_id, _ in hits])
+        results = []
+        for product_id, score in hits:
+            product = products.get(product_id)
+            if product is not None:
+                product.relevance_score = score
+                results.append(product)
+
+        serializer = ProductSearchSerializer(results, many=True, context={"request": request})
+        return api_success("Search results", serializer.data)
+
+class ProductTrendingAPIView(APIView):
+    permission_classes = [AllowAny]
+
+    @cache_response("api:products", TRENDING_SCOPE)
+    def get(self, request):
+        try:
+            limit = max(1, min(int(request.GET.get("limit", 20)), trending_setting("TOP_K")))
+        except ValueError:
+            return api_error("limit must be a number")
+
+        entries = leaderboard.top(limit)
+        products = TrendingProductSerializer.prune_queryset(
+            Product.objects.with_engagement(request.user), request
+        ).in_bulk([pk for pk, _ in entries])
+        results = []
+        for product_id, log_score in entries:
+            product = products.get(product_id)
+            if product is not None:
+                product.trending_score = current_score(log_score)
+                results.append(product)
+
+        serializer = TrendingProductSerializer(results, many=True, context={"request": request})
+        return api_success("Trending products", serializer.data)
+
 
 from rest_framework.permissions import IsAuthenticated
 from .serializers import ProductCreateUpdateSerializer
@@ -88,7 +165,10 @@ class ProductCreateAPIView(APIView):
     def post(self, request):
         serializer = ProductCreateUpdateSerializer(data=request.data)
         if serializer.is_valid():
-            product = serializer.save(user=request.user)
+            with transaction.atomic():
+                product = serializer.save(user=request.user)
+                bump_user_stats(request.user.pk, products_count=1)
+            invalidate_product("api")
             return api_success(
                 "Product created",
                 ProductListSerializer(product, context={"request": request}).data,
@@ -96,13 +176,19 @@ class ProductCreateAPIView(APIView):
             )
         return api_error("Validation error", serializer.errors)
 
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 
 class ProductDetailAPIView(APIView):
     permission_classes = [AllowAny]
 
+    @cache_response("api:product:{pk}")
     def get(self, request, pk):
-        product = get_object_or_404(Product, pk=pk)
+        products = Product.objects.with_engagement(request.user).with_recent_comments(
+            getattr(settings, "PRODUCT_DETAIL_COMMENTS", 10)
+        )
+        products = ProductDetailSerializer.prune_queryset(products, request)
+        product = get_object_or_404(products, pk=pk)
         return api_success(
             "Product details",
             ProductDetailSerializer(product, context={"request": request}).data
@@ -116,14 +202,61 @@ class ProductUpdateDeleteAPIView(APIView):
         serializer = ProductCreateUpdateSerializer(product, data=request.data)
         if serializer.is_valid():
             serializer.save()
+            invalidate_product("api", pk)
             return api_success("Product updated", serializer.data)
         return api_error("Validation error", serializer.errors)
 
     def delete(self, request, pk):
         product = get_object_or_404(Product, pk=pk, user=request.user)
-        product.delete()
+        with transaction.atomic():
+            # The cascade takes these likes and comments with it; settle everyone's stats first
+            likes = product.likes.count()
+            commenters = product.comments.order_by().values("user_id").annotate(total=Count("pk"))
+            for row in commenters:
+                bump_user_stats(row["user_id"], comments_made=-row["total"])
+            product.delete()
+            bump_user_stats(request.user.pk, products_count=-1, likes_received=-likes)
+        invalidate_product("api", pk)
         return api_success("Product deleted")
 
+from rest_framework.parsers import MultiPartParser
+from .models import ProductImage
+from .serializers import ProductImageBulkSerializer, ProductImageSerializer
+from .uploads import ImageUploadHandler
+
+class ProductImageUploadAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, pk):
+        product = get_object_or_404(Product, pk=pk, user=request.user)
+        # Must be installed before request.data is touched; it enforces the limits while parsing
+        handler = ImageUploadHandler(request._request, existing_count=product.images.count())
+        request._request.upload_handlers = [handler]
+        data = request.data
+        if handler.error is not None:
+            return api_error(handler.error.message, status=handler.error.status)
+
+        with transaction.atomic():
+            # Recount under the lock so concurrent uploads cannot pass 10 between them
+            product = Product.objects.select_for_update().get(pk=product.pk)
+            serializer = ProductImageBulkSerializer(data=data, context={"product": product})
+            if not serializer.is_valid():
+                return api_error("Validation error", serializer.errors)
+            images = serializer.validated_data["images"]
+            alt_texts = serializer.validated_data.get("alt_texts") or [""] * len(images)
+            start = product.images.count()
+            created = [
+                ProductImage.objects.create(product=product, image=image, alt_text=alt_text, order=start + i + 1)
+                for i, (image, alt_text) in enumerate(zip(images, alt_texts))
+            ]
+            invalidate_product("api", product.pk)
+        return api_success(
+            "Images uploaded",
+            ProductImageSerializer(created, many=True, context={"request": request}).data,
+            status=201
+        )
+
 class LikeCreateAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -133,7 +266,11 @@ class LikeCreateAPIView(APIView):
             context={"request": request}
         )
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                like = serializer.save()
+                Product.objects.filter(pk=like.product_id).update(like_count=F("like_count") + 1)
+                bump_user_stats(like.product.user_id, likes_received=1)
+                invalidate_product("api", like.product_id)
             return api_success("Product liked")
         return api_error("Validation error", serializer.errors)
 
@@ -141,10 +278,17 @@ class LikeDeleteAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def delete(self, request, product_id):
-        Like.objects.filter(
-            user=request.user,
-            product_id=product_id
-        ).delete()
+        with transaction.atomic():
+            deleted, _ = Like.objects.filter(
+                user=request.user,
+                product_id=product_id
+            ).delete()
+            if deleted:
+                Product.objects.filter(pk=product_id).update(like_count=F("like_count") - deleted)
+                owner_id = Product.objects.filter(pk=product_id).values_list("user_id", flat=True).first()
+                if owner_id is not None:
+                    bump_user_stats(owner_id, likes_received=-deleted)
+                invalidate_product("api", product_id)
         return api_success("Like removed")
 
 from .serializers import CommentSerializer
@@ -158,11 +302,29 @@ class CommentCreateAPIView(APIView):
             context={"request": request}
         )
         if serializer.is_valid():
-            serializer.save(user=request.user)
+            with transaction.atomic():
+                comment = serializer.save(user=request.user)
+                Product.objects.filter(pk=comment.product_id).update(comment_count=F("comment_count") + 1)
+                bump_user_stats(request.user.pk, comments_made=1)
+                invalidate_product("api", comment.product_id)
             return api_success("Comment added", serializer.data)
         return api_error("Validation error", serializer.errors)
 
 
+class ProductCommentListAPIView(APIView):
+    permission_classes = [AllowAny]
+
+    @cache_response("api:product:{pk}")
+    def get(self, request, pk):
+        get_object_or_404(Product.objects.only("pk"), pk=pk)
+        paginator = CommentCursorPagination()
+        comments = paginator.paginate_queryset(
+            Comment.objects.filter(product_id=pk).select_related("user__stats"), request, view=self
+        )
+        serializer = CommentSerializer(comments, many=True, context={"request": request})
+        return api_success("Comments", paginator.get_paginated_data(serializer.data))
+
+
 class CommentDeleteAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -170,6 +332,10 @@ class CommentDeleteAPIView(APIView):
         comment = get_object_or_404(Comment, pk=pk)
         if comment.user != request.user:
             return api_error("You cannot delete this comment", status=403)
-        comment.delete()
+        with transaction.atomic():
+            comment.delete()
+            Product.objects.filter(pk=comment.product_id).update(comment_count=F("comment_count") - 1)
+            bump_user_stats(comment.user_id, comments_made=-1)
+            invalidate_product("api", comment.product_id)
         return api_success("Comment deleted")
 
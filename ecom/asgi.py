@@ -3,6 +3,10 @@ ASGI config for ecom project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The live notification stream (/api/notifications/stream/) holds one coroutine
+per client, so serve it through this entry point, e.g.
+``uvicorn ecom.asgi:application``, rather than through WSGI workers.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -0,0 +1,155 @@
+"""
+JWT authentication without a user query per request.
+
+``CachedJWTAuthentication`` validates the token exactly like simplejwt's
+``JWTAuthentication`` (signature, expiry, token type), then builds
+``request.user`` from a per-process cache of the user's row, with their
+prdapi profile already attached, so ``request.user.profile`` is free too.
+
+Entries live ``JWT_USER_CACHE['TTL_SECONDS']`` and at most ``MAX_ENTRIES``
+are kept, least recently used going first. Saving or deleting a User or
+UserProfile (a password change, deactivation, ...) drops the entry in this
+process at once and again on commit; other processes pick the change up
+within the TTL. Each request gets its own instance, built from the cached
+column values.
+
+The user is read-only data: code that writes, or relies on the balance,
+re-reads under a row lock as ``prdapi.purchases`` does.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from prdapi.models import UserProfile
+
+DEFAULTS = {
+    'TTL_SECONDS': 30,
+    'MAX_ENTRIES': 10000,
+}
+
+
+def user_cache_setting(name):
+    return getattr(settings, 'JWT_USER_CACHE', {}).get(name, DEFAULTS[name])
+
+
+class UserCache:
+    """LRU of user rows by primary key (as a string, the form tokens carry it in), each kept for at most the TTL"""
+
+    def __init__(self):
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every discard, so a row read before a change is never stored after it
+        self._generation = 0
+
+    def get(self, pk):
+        with self._lock:
+            entry = self._rows.get(pk)
+            if entry is None:
+                return None
+            expires, row = entry
+            if expires < time.monotonic():
+                del self._rows[pk]
+                return None
+            self._rows.move_to_end(pk)
+            return row
+
+    def generation(self):
+        return self._generation
+
+    def put(self, pk, row, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._rows[pk] = (time.monotonic() + user_cache_setting('TTL_SECONDS'), row)
+            self._rows.move_to_end(pk)
+            while len(self._rows) > user_cache_setting('MAX_ENTRIES'):
+                self._rows.popitem(last=False)
+
+    def discard(self, pk):
+        with self._lock:
+            self._generation += 1
+            self._rows.pop(pk, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._rows.clear()
+
+    def __len__(self):
+        return len(self._rows)
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` whose users come from ``user_cache``; expects USER_ID_FIELD to be the primary key"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.columns = [field.attname for field in self.user_model._meta.concrete_fields]
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+        row = user_cache.get(str(user_id))
+        if row is None:
+            generation = user_cache.generation()
+            row = (
+                self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+                .values_list(*self.columns, 'profile__id').first()
+            )
+            if row is None:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+            user_cache.put(str(user_id), row, generation)
+        user = self.build(row)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
+
+    def build(self, row):
+        user = self.user_model.from_db(DEFAULT_DB_ALIAS, self.columns, row[:-1])
+        profile = None
+        if row[-1] is not None:
+            profile = UserProfile.from_db(DEFAULT_DB_ALIAS, ['id', 'user_id'], (row[-1], user.pk))
+            UserProfile.user.field.set_cached_value(profile, user)
+        # A user without a profile raises RelatedObjectDoesNotExist on .profile, as before
+        self.user_model.profile.related.set_cached_value(user, profile)
+        return user
+
+
+def forget_user(pk):
+    key = str(pk)
+    user_cache.discard(key)
+    # Again once committed, in case a request re-read the old row in between
+    transaction.on_commit(lambda: user_cache.discard(key))
+
+
+@receiver([post_save, post_delete], sender=get_user_model())
+def _user_changed(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def _profile_changed(sender, instance, **kwargs):
+    forget_user(instance.user_id)
@@ -0,0 +1,604 @@
+"""
+End-to-end benchmark of every route in prdapi/urls.py and api/urls.py.
+
+``seed()`` fills the database with a synthetic marketplace using
+``bulk_create``; ``run_benchmark()`` then drives each scenario through
+Django's in-process test client (WSGI ``Client`` or ``AsyncClient``),
+optionally from several workers at once, and reports latency percentiles,
+throughput and SQL queries per request (read from ``ecom.metrics``).
+Each scenario names the status its requests should get; ``mismatches()``
+lists scenarios whose responses did not, and ``compare()`` checks a run
+against a saved baseline.
+
+Run it with ``manage.py bench_endpoints``; see that command for options.
+"""
+import asyncio
+import io
+import itertools
+import random
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+
+import email_validator
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import close_old_connections, connection
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import setup_databases, teardown_databases
+from django.utils import timezone
+from PIL import Image
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api import models as api_models
+from api.trending import refresh_trending
+from ecom.authentication import CachedJWTAuthentication, user_cache
+from ecom.metrics import QueryRecorder, registry
+from prdapi import models as prd_models
+from prdapi.ledger import open_accounts
+from prdapi.notifications import dispatcher
+
+PASSWORD = 'bench-pass-123'
+# Reserved for testing (RFC 2606); email_validator accepts it, without DNS lookups, in its test environment
+EMAIL_DOMAIN = 'bench.test'
+WORDS = (
+    'amber', 'basket', 'cedar', 'denim', 'ember', 'fable', 'garnet', 'harbor', 'indigo', 'juniper',
+    'kettle', 'lantern', 'marble', 'nectar', 'olive', 'pepper', 'quartz', 'ribbon', 'saddle', 'timber',
+    'umber', 'velvet', 'walnut', 'yarrow', 'zephyr', 'canvas', 'copper', 'linen', 'meadow', 'pebble',
+)
+
+URLCONFS = {
+    'prdapi': ('ecom.urls', '/api/'),
+    'api': ('ecom.urls', '/api/v2/'),
+}
+
+
+@dataclass
+class Dataset:
+    run: str
+    users: list
+    tokens: dict
+    api_products: list
+    api_owner: dict
+    api_comments: list
+    prd_products: list
+    prd_owner: dict
+    notifications: list
+    counts: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.by_id = {user.pk: user for user in self.users}
+
+    def token(self, user):
+        return {'Authorization': f'Bearer {self.tokens[user.pk]}'}
+
+    @property
+    def fresh_users(self):
+        """Second half of the users: no seeded likes, so like scenarios never collide"""
+        return self.users[len(self.users) // 2:]
+
+
+@contextmanager
+def scratch_environment(use_current_db=False):
+    """A throwaway database (unless ``use_current_db``) and MEDIA_ROOT for a benchmark run"""
+    old_config = None
+    with tempfile.TemporaryDirectory() as media:
+        if not use_current_db:
+            # A file, not SQLite's in-memory test database, so concurrent workers share it
+            if connection.vendor == 'sqlite':
+                connection.settings_dict['TEST']['NAME'] = str(Path(media) / 'bench.sqlite3')
+            old_config = setup_databases(verbosity=0, interactive=False)
+        # Cached users belong to the database they were read from
+        user_cache.clear()
+        try:
+            with override_settings(MEDIA_ROOT=media):
+                yield
+        finally:
+            user_cache.clear()
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0)
+
+
+@lru_cache(maxsize=None)
+def jpeg_bytes():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), 'steelblue').save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def upload(name='bench.jpg'):
+    f = io.BytesIO(jpeg_bytes())
+    f.name = name
+    return f
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def seed(users=200, products=1000, likes_per_product=5, comments_per_product=3,
+         transactions=2000, notifications_per_user=20, rng=None, batch_size=2000):
+    """Insert a synthetic data set in both apps and bring every derived table up to date"""
+    rng = rng or random.Random(7)
+    run = uuid.uuid4().hex[:6]
+    password = make_password(PASSWORD)
+
+    people = User.objects.bulk_create([
+        User(username=f'bench_{run}_{i}', email=f'bench_{run}_{i}@{EMAIL_DOMAIN}', password=password)
+        for i in range(users)
+    ], batch_size=batch_size)
+    open_accounts({user: Decimal('1000000.00') for user in people})
+    # Likes are seeded from the first half only; see Dataset.fresh_users
+    likers = people[:max(1, users // 2)]
+
+    api_products = api_models.Product.objects.bulk_create([
+        api_models.Product(user=rng.choice(people), title=_text(rng, 3).title(), description=_text(rng, 20))
+        for _ in range(products)
+    ], batch_size=batch_size)
+    api_models.ProductImage.objects.bulk_create([
+        api_models.ProductImage(product=product, image=f'products/bench/{product.pk}.jpg', order=1)
+        for product in api_products
+    ], batch_size=batch_size)
+    api_models.Like.objects.bulk_create([
+        api_models.Like(user=user, product=product)
+        for product in api_products
+        for user in rng.sample(likers, min(likes_per_product, len(likers)))
+    ], batch_size=batch_size)
+    api_comments = api_models.Comment.objects.bulk_create([
+        api_models.Comment(user=rng.choice(people), product=product, text=_text(rng, 8))
+        for product in api_products for _ in range(comments_per_product)
+    ], batch_size=batch_size)
+
+    prd_products = prd_models.Product.objects.bulk_create([
+        prd_models.Product(user=rng.choice(people), name=_text(rng, 2)[:50], desc=_text(rng, 15),
+                           price=Decimal(rng.randint(100, 10000)) / 100, image='products/bench.jpg')
+        for _ in range(products)
+    ], batch_size=batch_size)
+    prd_models.Like.objects.bulk_create([
+        prd_models.Like(user=user, product=product)
+        for product in prd_products
+        for user in rng.sample(likers, min(likes_per_product, len(likers)))
+    ], batch_size=batch_size)
+    prd_models.Comment.objects.bulk_create([
+        prd_models.Comment(user=rng.choice(people), product=product, content=_text(rng, 8))
+        for product in prd_products for _ in range(comments_per_product)
+    ], batch_size=batch_size)
+    sales = []
+    for _ in range(transactions):
+        product = rng.choice(prd_products)
+        buyer = rng.choice(people)
+        sales.append(prd_models.Transaction(product=product, sender=buyer, receiver_id=product.user_id,
+                                            amount=product.price, tx_type='withdraw'))
+    prd_models.Transaction.objects.bulk_create(sales, batch_size=batch_size)
+    notifications = prd_models.Notification.objects.bulk_create([
+        prd_models.Notification(from_user=rng.choice(people), to_user=user, message=f'{_text(rng, 2)} liked your product')
+        for user in people for _ in range(notifications_per_user)
+    ], batch_size=batch_size)
+
+    # Derived tables the write paths would normally maintain
+    call_command('recount_engagement', stdout=io.StringIO())
+    call_command('reconcile_user_stats', stdout=io.StringIO())
+    refresh_trending(full=True)
+
+    return Dataset(
+        run=run,
+        users=people,
+        tokens={user.pk: str(AccessToken.for_user(user)) for user in people},
+        api_products=[p.pk for p in api_products],
+        api_owner={p.pk: p.user_id for p in api_products},
+        api_comments=[(c.pk, c.user_id) for c in api_comments],
+        prd_products=[p.pk for p in prd_products],
+        prd_owner={p.pk: p.user_id for p in prd_products},
+        notifications=[(n.pk, n.to_user_id) for n in notifications],
+        counts={
+            'users': users, 'products': products, 'likes_per_product': likes_per_product,
+            'comments_per_product': comments_per_product, 'transactions': transactions,
+            'notifications_per_user': notifications_per_user,
+        },
+    )
+
+
+@dataclass
+class Call:
+    method: str
+    path: str
+    data: object = None
+    user: object = None
+    json: bool = True
+    headers: dict = field(default_factory=dict)
+
+
+@dataclass
+class Scenario:
+    name: str
+    app: str
+    build: object  # (Dataset, random.Random, n) -> Call
+    status: int = 200  # what every request of the scenario should get
+
+
+def _user_of(ds, user_id):
+    return ds.by_id[user_id]
+
+
+def _like_pair(ds, products, n):
+    fresh = ds.fresh_users
+    return fresh[n % len(fresh)], products[(n // len(fresh)) % len(products)]
+
+
+def _owned(ds, products, owner, rng):
+    product = rng.choice(products)
+    return product, _user_of(ds, owner[product])
+
+
+def _buyer(ds, rng, product):
+    while True:
+        user = rng.choice(ds.users)
+        if user.pk != ds.prd_owner[product]:
+            return user
+
+
+def _register(prefix, ds, n, extra):
+    name = f'{prefix}_{ds.run}_{n}_{uuid.uuid4().hex[:6]}'
+    return {'username': name, 'email': f'{name}@{EMAIL_DOMAIN}', 'password': PASSWORD, **extra}
+
+
+SCENARIOS = [
+    # prdapi/urls.py (mounted at /api/ in ecom/urls.py)
+    Scenario('prdapi register', 'prdapi', lambda ds, rng, n: Call(
+        'post', 'register/', _register('reg', ds, n, {'balance': '100.00'})), status=201),
+    Scenario('prdapi login', 'prdapi', lambda ds, rng, n: Call(
+        'post', 'login/', {'username': rng.choice(ds.users).username, 'password': PASSWORD})),
+    Scenario('prdapi products public', 'prdapi', lambda ds, rng, n: Call('get', 'products/public/')),
+    Scenario('prdapi products', 'prdapi', lambda ds, rng, n: Call('get', 'products/')),
+    Scenario('prdapi product detail', 'prdapi', lambda ds, rng, n: Call(
+        'get', f'products/{rng.choice(ds.prd_products)}/')),
+    Scenario('prdapi product create', 'prdapi', lambda ds, rng, n: Call(
+        'post', 'products/create/',
+        {'name': f'new {ds.run} {n} {uuid.uuid4().hex[:6]}', 'desc': 'Benchmark product', 'price': '9.99',
+         'image': upload()},
+        user=rng.choice(ds.users), json=False), status=201),
+    Scenario('prdapi like', 'prdapi', lambda ds, rng, n: (lambda user, product: Call(
+        'post', f'products/{product}/like/', user=user))(*_like_pair(ds, ds.prd_products, n))),
+    Scenario('prdapi comment', 'prdapi', lambda ds, rng, n: Call(
+        'post', f'products/{rng.choice(ds.prd_products)}/comment/', {'content': _text(rng, 6)},
+        user=rng.choice(ds.users))),
+    Scenario('prdapi buy', 'prdapi', lambda ds, rng, n: (lambda product: Call(
+        'post', f'products/{product}/buy/', user=_buyer(ds, rng, product),
+        headers={'Idempotency-Key': uuid.uuid4().hex}))(rng.choice(ds.prd_products))),
+    Scenario('prdapi notifications', 'prdapi', lambda ds, rng, n: Call(
+        'get', 'notifications/', user=rng.choice(ds.users))),
+    Scenario('prdapi notifications unread count', 'prdapi', lambda ds, rng, n: Call(
+        'get', 'notifications/unread-count/', user=rng.choice(ds.users))),
+    Scenario('prdapi notification read', 'prdapi', lambda ds, rng, n: (lambda pk, to_user: Call(
+        'post', f'notifications/{pk}/read/', user=_user_of(ds, to_user)))(*rng.choice(ds.notifications))),
+    Scenario('prdapi notifications read all', 'prdapi', lambda ds, rng, n: Call(
+        'post', 'notifications/read/', {'before': timezone.now().isoformat()}, user=rng.choice(ds.users))),
+    Scenario('prdapi like history', 'prdapi', lambda ds, rng, n: Call('get', 'likes/', user=rng.choice(ds.users))),
+    Scenario('prdapi comment history', 'prdapi', lambda ds, rng, n: Call(
+        'get', 'comments/', user=rng.choice(ds.users))),
+    Scenario('prdapi transaction history', 'prdapi', lambda ds, rng, n: Call(
+        'get', 'transactions/', user=rng.choice(ds.users))),
+    # notifications/stream/ never completes; measure it with manage.py sse_load instead
+
+    # api/urls.py
+    Scenario('api register', 'api', lambda ds, rng, n: Call(
+        'post', 'auth/register/', _register('reg', ds, n, {'password_confirm': PASSWORD})), status=201),
+    Scenario('api login', 'api', lambda ds, rng, n: Call(
+        'post', 'auth/login/', {'username': rng.choice(ds.users).username, 'password': PASSWORD})),
+    Scenario('api user', 'api', lambda ds, rng, n: Call('get', 'auth/user/', user=rng.choice(ds.users))),
+    Scenario('api products', 'api', lambda ds, rng, n: Call('get', 'products/')),
+    Scenario('api products search', 'api', lambda ds, rng, n: Call(
+        'get', 'products/search/', {'q': rng.choice(WORDS)})),
+    Scenario('api products trending', 'api', lambda ds, rng, n: Call('get', 'products/trending/')),
+    Scenario('api product detail', 'api', lambda ds, rng, n: Call(
+        'get', f'products/{rng.choice(ds.api_products)}/')),
+    Scenario('api product comments', 'api', lambda ds, rng, n: Call(
+        'get', f'products/{rng.choice(ds.api_products)}/comments/')),
+    Scenario('api product create', 'api', lambda ds, rng, n: Call(
+        'post', 'products/create/', {'title': f'New {_text(rng, 2)}', 'description': _text(rng, 12)},
+        user=rng.choice(ds.users)), status=201),
+    Scenario('api product edit', 'api', lambda ds, rng, n: (lambda product, owner: Call(
+        'put', f'products/{product}/edit/', {'title': f'Edited {_text(rng, 2)}', 'description': _text(rng, 12)},
+        user=owner))(*_owned(ds, ds.api_products, ds.api_owner, rng))),
+    Scenario('api product images', 'api', lambda ds, rng, n: (lambda product, owner: Call(
+        'post', f'products/{product}/images/', {'images': [upload()]}, user=owner, json=False,
+    ))(*_owned(ds, ds.api_products, ds.api_owner, rng)), status=201),
+    Scenario('api like', 'api', lambda ds, rng, n: (lambda user, product: Call(
+        'post', 'likes/', {'product': product}, user=user))(*_like_pair(ds, ds.api_products, n))),
+    # Undoes exactly the likes the previous scenario created
+    Scenario('api unlike', 'api', lambda ds, rng, n: (lambda user, product: Call(
+        'delete', f'likes/{product}/', user=user))(*_like_pair(ds, ds.api_products, n))),
+    Scenario('api comment', 'api', lambda ds, rng, n: Call(
+        'post', 'comments/', {'product': rng.choice(ds.api_products), 'text': _text(rng, 6)},
+        user=rng.choice(ds.users))),
+    Scenario('api comment delete', 'api', lambda ds, rng, n: (lambda pk, author: Call(
+        'delete', f'comments/{pk}/', user=_user_of(ds, author)))(*ds.api_comments[n % len(ds.api_comments)])),
+]
+
+
+def _client_kwargs(ds, call, prefix):
+    kwargs = {'path': prefix + call.path, 'headers': dict(call.headers)}
+    if call.user is not None:
+        kwargs['headers'].update(ds.token(call.user))
+    if call.data is not None:
+        kwargs['data'] = call.data
+    if call.json and call.method != 'get' and call.data is not None:
+        kwargs['content_type'] = 'application/json'
+    return kwargs
+
+
+def _percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _query_totals():
+    totals = [h for key, h in registry.snapshot().items() if key[0] == 'db_queries']
+    return sum(h.total for h in totals), sum(h.count for h in totals)
+
+
+def summarize(latencies, statuses, elapsed, queries, expected=200):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'expected_status': expected,
+        'unexpected': sum(1 for status in statuses if status != expected),
+        'errors': sum(1 for status in statuses if status >= 400),
+        'server_errors': sum(1 for status in statuses if status >= 500),
+        'p50_ms': round(_percentile(ordered, 50), 3),
+        'p95_ms': round(_percentile(ordered, 95), 3),
+        'p99_ms': round(_percentile(ordered, 99), 3),
+        'mean_ms': round(statistics.fmean(ordered), 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'queries_per_request': round(queries, 2) if queries is not None else None,
+    }
+
+
+def _drain(response):
+    """Read a streamed body, so its queries and time are part of the measurement"""
+    if response.streaming and not response.is_async:
+        for _ in response.streaming_content:
+            pass
+
+
+def _run_wsgi(ds, scenario, prefix, requests, concurrency):
+    counter = itertools.count()
+    latencies, statuses = [], []
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = Client(raise_request_exception=False)
+        try:
+            while (n := next(counter)) < requests:
+                call = scenario.build(ds, rng, n)
+                kwargs = _client_kwargs(ds, call, prefix)
+                started = time.perf_counter()
+                response = getattr(client, call.method)(**kwargs)
+                _drain(response)
+                took = (time.perf_counter() - started) * 1000
+                with lock:
+                    latencies.append(took)
+                    statuses.append(response.status_code)
+        finally:
+            if concurrency > 1:
+                close_old_connections()
+
+    if concurrency == 1:
+        worker(0)
+    else:
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return latencies, statuses
+
+
+async def _run_asgi(ds, scenario, prefix, requests, concurrency):
+    counter = itertools.count()
+    latencies, statuses = [], []
+
+    async def worker(seed):
+        rng = random.Random(seed)
+        client = AsyncClient(raise_request_exception=False)
+        while (n := next(counter)) < requests:
+            call = scenario.build(ds, rng, n)
+            kwargs = _client_kwargs(ds, call, prefix)
+            started = time.perf_counter()
+            response = await getattr(client, call.method)(**kwargs)
+            if response.streaming and not response.is_async:
+                await sync_to_async(_drain)(response)
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses.append(response.status_code)
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return latencies, statuses
+
+
+@contextmanager
+def accept_test_emails():
+    """email_validator accepts ``EMAIL_DOMAIN`` and skips its DNS lookups meanwhile"""
+    previous = email_validator.TEST_ENVIRONMENT
+    email_validator.TEST_ENVIRONMENT = True
+    try:
+        yield
+    finally:
+        email_validator.TEST_ENVIRONMENT = previous
+
+
+def run_benchmark(ds, requests=200, concurrency=1, mode='wsgi', only=None, progress=None):
+    """Drive every scenario (or those whose name contains ``only``); returns {name: summary}"""
+    results = {}
+    for scenario in SCENARIOS:
+        if only and only not in scenario.name:
+            continue
+        urlconf, prefix = URLCONFS[scenario.app]
+        cache.clear()
+        # Every simulated client shares one address; the login limits would turn most requests into 429s
+        with override_settings(ROOT_URLCONF=urlconf, METRICS={'ENABLED': True, 'QUERY_LOG_THRESHOLD': None},
+                               PASSWORD_HASHING={**settings.PASSWORD_HASHING, 'RATE_LIMITS': {}}), \
+                accept_test_emails():
+            before_total, before_count = _query_totals()
+            started = time.perf_counter()
+            if mode == 'asgi':
+                latencies, statuses = asyncio.run(_run_asgi(ds, scenario, prefix, requests, concurrency))
+            else:
+                latencies, statuses = _run_wsgi(ds, scenario, prefix, requests, concurrency)
+            elapsed = time.perf_counter() - started
+            after_total, after_count = _query_totals()
+        # Coalesced notifications would otherwise land in the next scenario, or after teardown
+        dispatcher.flush()
+        measured = after_count - before_count
+        queries = (after_total - before_total) / measured if measured else None
+        results[scenario.name] = summarize(latencies, statuses, elapsed, queries, scenario.status)
+        if progress:
+            progress(scenario.name, results[scenario.name])
+    return results
+
+
+def mismatches(results):
+    """Scenarios some of whose responses did not have the expected status"""
+    return [
+        f'{name}: {row["unexpected"]} of {row["requests"]} response(s) were not {row["expected_status"]}'
+        for name, row in results.items() if row.get('unexpected')
+    ]
+
+
+def compare(results, baseline, threshold):
+    """Regressions of ``results`` against ``baseline`` beyond ``threshold`` (0.2 = 20%)"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + threshold):
+            regressions.append(f'{name}: p95 {previous["p95_ms"]}ms -> {current["p95_ms"]}ms')
+        if previous.get('rps') and current.get('rps') and current['rps'] < previous['rps'] * (1 - threshold):
+            regressions.append(f'{name}: {previous["rps"]} -> {current["rps"]} requests/s')
+        before, after = previous.get('queries_per_request'), current.get('queries_per_request')
+        # Query counts are near-deterministic, so half a query of slack covers random data
+        if before is not None and after is not None and after > before * (1 + threshold) + 0.5:
+            regressions.append(f'{name}: {before} -> {after} queries/request')
+        if current['server_errors'] > previous.get('server_errors', 0):
+            regressions.append(f'{name}: {previous.get("server_errors", 0)} -> {current["server_errors"]} 5xx')
+    return regressions
+
+
+def _best_rate(rows, repeat, build):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        build()
+        best = min(best, time.perf_counter() - started)
+    return rows / best if best else float('inf')
+
+
+def serialization_benchmark(rows=1000, repeat=5):
+    """
+    Rows/s for the prdapi product list and transaction history, query to bytes,
+    through each serialization path. Run after ``seed``.
+    """
+    from django.contrib.auth.models import AnonymousUser
+    from django.test import RequestFactory
+    from rest_framework.renderers import JSONRenderer
+
+    from ecom.renderers import FastJSONRenderer
+    from prdapi.serializers import ProductListFlatSerializer, ProductListSerializer, TransactionHistorySerializer
+
+    request = RequestFactory().get('/api/products/')
+    request.user = AnonymousUser()
+    context = {'request': request}
+    products = prd_models.Product.objects.with_viewer_like(request.user).order_by('-created_at', '-id')
+    transactions = prd_models.Transaction.objects.order_by('-created_at', '-id')
+    rows = min(rows, products.count(), transactions.count())
+
+    def model_products(renderer):
+        page = list(products.select_related('user')[:rows])
+        return renderer.render(ProductListSerializer(page, many=True, context=context).data)
+
+    def flat_products(renderer):
+        page = list(ProductListFlatSerializer.values(products)[:rows])
+        return renderer.render(ProductListFlatSerializer(page, context=context).data)
+
+    def instance_transactions(renderer):
+        # The dicts TransactionHistory used to build from model instances
+        return renderer.render([{
+            'product': t.product.name if t.product else None,
+            'amount': t.amount,
+            'type': t.tx_type,
+            'date': t.created_at,
+        } for t in transactions.select_related('product')[:rows]])
+
+    def flat_transactions(renderer):
+        page = list(TransactionHistorySerializer.values(transactions)[:rows])
+        return renderer.render(TransactionHistorySerializer(page).data)
+
+    paths = [
+        ('products: ModelSerializer + JSONRenderer', model_products, JSONRenderer()),
+        ('products: ModelSerializer + FastJSONRenderer', model_products, FastJSONRenderer()),
+        ('products: flat + JSONRenderer', flat_products, JSONRenderer()),
+        ('products: flat + FastJSONRenderer', flat_products, FastJSONRenderer()),
+        ('transactions: instances + JSONRenderer', instance_transactions, JSONRenderer()),
+        ('transactions: flat + FastJSONRenderer', flat_transactions, FastJSONRenderer()),
+    ]
+    return {
+        name: {'rows': rows, 'rows_per_second': round(_best_rate(rows, repeat, lambda: build(renderer)), 1)}
+        for name, build, renderer in paths
+    }
+
+
+@contextmanager
+def authentication_classes(classes):
+    """Views that do not choose their own authentication use ``classes`` meanwhile"""
+    previous = APIView.authentication_classes
+    APIView.authentication_classes = classes
+    try:
+        yield
+    finally:
+        APIView.authentication_classes = previous
+
+
+def auth_benchmark(ds, requests=2000, repeat=3):
+    """
+    Requests/s and queries per request of an authenticated endpoint that does
+    no work of its own, through simplejwt's JWTAuthentication and through
+    CachedJWTAuthentication. Run after ``seed``.
+    """
+    client = Client()
+    headers = [ds.token(user) for user in ds.users]
+
+    def run():
+        for i in range(requests):
+            client.get('/api/notifications/unread-count/', headers=headers[i % len(headers)])
+
+    results = {}
+    for auth_class in (JWTAuthentication, CachedJWTAuthentication):
+        cache.clear()
+        user_cache.clear()
+        with authentication_classes([auth_class]):
+            # The first pass warms the unread counts and, for the cached class, the users
+            queries = QueryRecorder(keep_sql=False)
+            with connection.execute_wrapper(queries):
+                run()
+                warm = queries.count
+                run()
+            rate = _best_rate(requests, repeat, run)
+        results[auth_class.__name__] = {
+            'requests': requests,
+            'requests_per_second': round(rate, 1),
+            'queries_per_request': round((queries.count - warm) / requests, 2),
+        }
+    return results
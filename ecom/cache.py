@@ -0,0 +1,108 @@
+"""
+Versioned response cache for anonymous read endpoints.
+
+Every cached response is keyed on the version counters of the scopes it
+depends on (e.g. ``api:products`` and ``api:product:7``). Writes bump those
+counters instead of deleting entries, so stale responses simply stop being
+addressed and age out of the cache's own LRU/cull policy.
+
+Bodies may live in a per-process cache, since a body is only found under the
+versions it was built from. The counters must be seen by every process, so
+they live in the ``versions`` cache alias when there is one (a cache shared
+between workers, see ``CACHES`` in settings), else in the default cache.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, parse_etags, quote_etag
+from rest_framework.response import Response
+
+VERSION_PREFIX = 'ver:'
+RESPONSE_PREFIX = 'resp:'
+
+
+def version_cache():
+    return caches['versions'] if 'versions' in settings.CACHES else cache
+
+
+def get_versions(scopes):
+    counters = version_cache()
+    keys = [VERSION_PREFIX + scope for scope in scopes]
+    versions = counters.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        # add() so a concurrent first reader can't clobber a newer bump
+        for key, version in missing.items():
+            counters.add(key, version, timeout=None)
+        versions.update(counters.get_many(list(missing)))
+    return [versions.get(key, 0) for key in keys]
+
+
+def bump_versions(*scopes):
+    """Invalidate every cached response depending on ``scopes`` once the transaction commits"""
+    def bump():
+        now = time.time_ns()
+        version_cache().set_many({VERSION_PREFIX + scope: now for scope in scopes}, timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def invalidate_product(app_label, pk=None):
+    scopes = [f'{app_label}:products']
+    if pk is not None:
+        scopes.append(f'{app_label}:product:{pk}')
+    bump_versions(*scopes)
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return etag in parse_etags(if_none_match) or if_none_match.strip() == '*'
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and int(last_modified) <= if_modified_since
+
+
+def cache_response(*scopes):
+    """
+    Cache a DRF ``get`` handler for anonymous users.
+
+    ``scopes`` are format strings filled from the URL kwargs, so
+    ``'api:product:{pk}'`` ties a detail response to that product's version.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if request.user.is_authenticated:
+                return method(view, request, *args, **kwargs)
+
+            versions = get_versions([scope.format(**kwargs) for scope in scopes])
+            digest = hashlib.sha1(
+                f'{request.build_absolute_uri()}|{versions}'.encode()
+            ).hexdigest()
+            etag = quote_etag(digest)
+            last_modified = max(versions) / 1e9
+
+            if _not_modified(request, etag, last_modified):
+                response = Response(status=304)
+            else:
+                data = cache.get(RESPONSE_PREFIX + digest)
+                if data is None:
+                    response = method(view, request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                    cache.set(RESPONSE_PREFIX + digest, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+                else:
+                    response = Response(data)
+
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            response['Cache-Control'] = 'no-cache'
+            patch_vary_headers(response, ['Authorization'])
+            return response
+        return wrapper
+    return decorator
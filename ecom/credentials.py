@@ -0,0 +1,76 @@
+"""
+Async base view for the login and register endpoints of both apps.
+
+DRF's APIView is synchronous, so these are plain Django views. They parse
+JSON or form bodies and render through ``FastJSONRenderer``, so responses
+look as they did from DRF. Every attempt first spends a token from the
+per-IP and per-username buckets (ecom/throttling.py); hashing then runs on
+the pool (ecom/passwords.py). A worker thread or event loop therefore waits
+on the pool instead of burning CPU, and other endpoints keep their workers.
+
+Subclasses implement ``async def post`` and ``error_body(message)`` for
+their app's error envelope. Throttled attempts get 429, a saturated pool
+gets 503, and both carry a Retry-After header.
+"""
+import json
+import math
+
+from django.http import HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from ecom.passwords import PoolBusy
+from ecom.renderers import FastJSONRenderer
+from ecom.throttling import Throttled, client_ip, take
+
+
+class InvalidPayload(Exception):
+    pass
+
+
+def render_json(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+class CredentialView(View):
+    http_method_names = ['post', 'options']
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Token endpoints, like DRF's APIView: there is no session to forge requests with
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def error_body(self, message):
+        return {'error': message}
+
+    def error(self, message, status, retry_after=None):
+        response = render_json(self.error_body(message), status=status)
+        if retry_after is not None:
+            response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except InvalidPayload as e:
+            return self.error(str(e), 400)
+        except Throttled as e:
+            return self.error('Too many attempts, try again later', 429, retry_after=e.wait)
+        except PoolBusy:
+            return self.error('Server busy, try again shortly', 503, retry_after=1)
+
+    def payload(self, request):
+        if request.content_type != 'application/json':
+            return request.POST
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError as e:
+            raise InvalidPayload(f'JSON parse error - {e}')
+        if not isinstance(data, dict):
+            raise InvalidPayload('Expected a JSON object')
+        return data
+
+    async def throttle(self, request, username):
+        """Spend this attempt's tokens; raises ``Throttled`` past the limits"""
+        username = username.lower() if isinstance(username, str) else None
+        await take({'ip': client_ip(request), 'username': username})
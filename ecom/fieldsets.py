@@ -0,0 +1,94 @@
+"""
+Sparse fieldsets for read serializers: ``?fields=`` and ``?expand=``.
+
+``?fields=id,title`` keeps only those fields. Embeds (the names in
+``Meta.expandable_fields``: nested serializers and method fields that load
+related rows) are chosen by ``?expand=``, plus any named in ``?fields=``.
+With neither parameter the serializer renders everything, as before.
+
+Fields that were not asked for are removed when the serializer is built,
+so their ``get_<field>`` methods never run. ``prune_queryset`` drops the
+queryset work behind them: ``Meta.field_requirements`` maps a field to the
+select_related roots, prefetch lookups (by root or ``to_attr``) and
+annotations it reads.
+"""
+from django.db.models import Prefetch
+
+
+def param_set(request, name):
+    """Comma-separated query parameter as a set, or None when it is absent"""
+    value = request.GET.get(name)
+    if value is None:
+        return None
+    return {part.strip() for part in value.split(",") if part.strip()}
+
+
+def _select_paths(tree, prefix=""):
+    for name, children in tree.items():
+        path = prefix + name
+        if children:
+            yield from _select_paths(children, path + "__")
+        else:
+            yield path
+
+
+def _prefetch_root(lookup):
+    path = lookup.prefetch_to if isinstance(lookup, Prefetch) else lookup
+    return path.split("__")[0]
+
+
+def prune(queryset, names):
+    """``queryset`` without the select_related roots, prefetches and annotations in ``names``"""
+    related = queryset.query.select_related
+    if isinstance(related, dict):
+        paths = [path for path in _select_paths(related) if path.split("__")[0] not in names]
+        queryset = queryset.select_related(None)
+        if paths:
+            queryset = queryset.select_related(*paths)
+
+    lookups = [lookup for lookup in queryset._prefetch_related_lookups if _prefetch_root(lookup) not in names]
+    queryset = queryset.prefetch_related(None).prefetch_related(*lookups)
+
+    selected = list(queryset.query.annotation_select)
+    kept = [name for name in selected if name not in names]
+    if len(kept) != len(selected):
+        # Masked annotations stay usable in filters and ordering but leave the SELECT list
+        queryset.query.set_annotation_mask(kept)
+    return queryset
+
+
+class SparseFieldsetMixin:
+    """Serializer mixin honouring ``?fields=`` and ``?expand=`` on GET requests"""
+
+    @classmethod
+    def requested_fields(cls, request):
+        """Names to render for ``request``, or None for all of them"""
+        if request is None or request.method != "GET":
+            return None
+        fields, expand = param_set(request, "fields"), param_set(request, "expand")
+        if fields is None and expand is None:
+            return None
+
+        expandable = set(getattr(cls.Meta, "expandable_fields", ()))
+        chosen = (fields or set()) | (expand or set())
+        return {
+            name for name in cls.Meta.fields
+            if (name in chosen if name in expandable else fields is None or name in fields)
+        }
+
+    @classmethod
+    def prune_queryset(cls, queryset, request):
+        keep = cls.requested_fields(request)
+        if keep is None:
+            return queryset
+        requirements = getattr(cls.Meta, "field_requirements", {})
+        needed = set().union(*(requirements.get(name, ()) for name in keep))
+        unused = set().union(*requirements.values()) - needed
+        return prune(queryset, unused) if unused else queryset
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        keep = self.requested_fields(self.context.get("request"))
+        if keep is not None:
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
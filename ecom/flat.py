@@ -0,0 +1,88 @@
+"""
+Read-only list rows built straight from ``.values()``.
+
+A ``FlatSerializer`` declares ``columns``, output key to ``values()`` path.
+Dotted keys nest, so ``"user.username": "user__username"`` renders
+``{"user": {"username": ...}}``, and one path may feed several keys. A
+``get_<key>(value)`` method post-processes its column (``get_user_id`` for
+``user.id``). Rows go from the cursor to plain dicts with no model instances
+or field objects in between, which is where a ModelSerializer list spends
+most of its time; Decimal and datetime values are left to the renderer.
+
+The query always selects every column, so pagination can read its ordering
+fields; ``?fields=`` only trims the output keys.
+"""
+from django.conf import settings
+
+from .fieldsets import param_set
+
+
+class FlatSerializer:
+    columns = {}
+
+    def __init__(self, instance=None, many=True, context=None):
+        self.instance = instance
+        self.context = context or {}
+
+    @classmethod
+    def values(cls, queryset, *extra):
+        """``queryset.values()`` over every column path, plus ``extra`` (say, pagination keys)"""
+        return queryset.values(*dict.fromkeys([*cls.columns.values(), *extra]))
+
+    def plan(self):
+        request = self.context.get("request")
+        fields = param_set(request, "fields") if request is not None else None
+        steps, nested = [], {}
+        for key, path in self.columns.items():
+            outer, _, inner = key.partition(".")
+            if fields is not None and outer not in fields:
+                continue
+            transform = getattr(self, "get_" + key.replace(".", "_"), None)
+            if not inner:
+                steps.append((key, path, transform))
+            elif outer in nested:
+                nested[outer].append((inner, path, transform))
+            else:
+                nested[outer] = [(inner, path, transform)]
+                steps.append((outer, nested[outer], None))
+        return steps
+
+    def builder(self):
+        """Function turning one ``values()`` row into an output dict"""
+        steps = self.plan()
+
+        def build(row):
+            out = {}
+            for key, path, transform in steps:
+                if isinstance(path, list):
+                    out[key] = {
+                        inner: transform(row[p]) if transform else row[p] for inner, p, transform in path
+                    }
+                else:
+                    out[key] = transform(row[path]) if transform else row[path]
+            return out
+
+        return build
+
+    @property
+    def data(self):
+        return list(map(self.builder(), self.instance))
+
+
+class FlatListMixin:
+    """ListAPIView mixin: with ``FLAT_LIST_RESPONSES`` on, list through ``flat_serializer_class``"""
+    flat_serializer_class = None
+
+    def flat_enabled(self):
+        return self.flat_serializer_class is not None and getattr(settings, "FLAT_LIST_RESPONSES", True)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.flat_enabled():
+            queryset = self.flat_serializer_class.values(queryset)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.flat_enabled():
+            return self.flat_serializer_class
+        return super().get_serializer_class()
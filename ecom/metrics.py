@@ -0,0 +1,354 @@
+"""
+Per-endpoint request metrics and a Prometheus text endpoint.
+
+``MetricsMiddleware`` measures, for every request, the wall time, the number
+of SQL queries and the time spent in them, the time spent rendering the
+response body (DRF's serializer output to JSON) and the response size, and
+files them under the resolved URL name (or route) and view class.
+
+Each thread records into its own ``Recorder``, so the request path never takes
+a lock; ``/metrics`` merges the recorders when it is scraped. Values go into
+HDR-style log-linear histograms (8 sub-buckets per power of two, so any
+quantile is within 12.5% of the true value) and are exported as Prometheus
+summaries.
+
+Requests issuing more than ``METRICS['QUERY_LOG_THRESHOLD']`` queries are
+logged with their repeated SQL fingerprints, which is what an N+1 looks like.
+
+``/metrics`` answers only clients in ``METRICS['ALLOWED_IPS']`` (loopback by
+default) or presenting ``Authorization: Bearer <METRICS['TOKEN']>``, and 403
+to everyone else.
+
+Under ASGI a sync view is measured on the thread it runs on, so it reports
+what it does under WSGI. Async views (the credential endpoints) run their
+queries on other threads and only report wall time and response size.
+"""
+import hmac
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'QUERY_LOG_THRESHOLD': 50,
+    'QUANTILES': (0.5, 0.9, 0.99),
+    'ALLOWED_IPS': ('127.0.0.1', '::1'),
+    'TOKEN': None,
+}
+
+SUB_BUCKET_BITS = 3
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+# (name, help, scale from the recorded integer unit to the exported unit)
+SERIES = {
+    'request_duration_seconds': ('Wall time of the request', 1e-6),
+    'db_queries': ('SQL queries issued by the request', 1),
+    'db_duration_seconds': ('Time spent executing SQL', 1e-6),
+    'serialization_duration_seconds': ('Time spent rendering the response body', 1e-6),
+    'response_bytes': ('Size of the response body', 1),
+}
+
+
+def metrics_setting(name):
+    return getattr(settings, 'METRICS', {}).get(name, DEFAULTS[name])
+
+
+def bucket_index(value):
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return 2 * SUB_BUCKETS + (shift - 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+
+def bucket_upper_bound(index):
+    """Largest value that lands in bucket ``index``"""
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift, offset = divmod(index - 2 * SUB_BUCKETS, SUB_BUCKETS)
+    shift += 1
+    return ((SUB_BUCKETS + offset + 1) << shift) - 1
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total')
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.total = 0
+
+    def record(self, value):
+        value = max(int(value), 0)
+        index = bucket_index(value)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+
+    def merge(self, other):
+        counts = list(other.counts)
+        if len(counts) > len(self.counts):
+            self.counts.extend([0] * (len(counts) - len(self.counts)))
+        for index, n in enumerate(counts):
+            self.counts[index] += n
+        self.count += other.count
+        self.total += other.total
+
+    def quantile(self, q):
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return bucket_upper_bound(index)
+        return bucket_upper_bound(len(self.counts) - 1)
+
+
+class Recorder:
+    """One thread's histograms, keyed by (series, url_name, view)"""
+
+    def __init__(self):
+        self.histograms = {}
+
+    def record(self, labels, values):
+        for series, value in values.items():
+            key = (series,) + labels
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.record(value)
+
+
+class Registry:
+    def __init__(self):
+        self._local = threading.local()
+        self._recorders = []
+        self._lock = threading.Lock()
+
+    def recorder(self):
+        recorder = getattr(self._local, 'recorder', None)
+        if recorder is None:
+            recorder = self._local.recorder = Recorder()
+            # Once per thread; recording itself never locks
+            with self._lock:
+                self._recorders.append(recorder)
+        return recorder
+
+    def snapshot(self):
+        with self._lock:
+            recorders = list(self._recorders)
+        merged = {}
+        for recorder in recorders:
+            for key, histogram in list(recorder.histograms.items()):
+                merged.setdefault(key, Histogram()).merge(histogram)
+        return merged
+
+    def reset(self):
+        with self._lock:
+            for recorder in self._recorders:
+                recorder.histograms = {}
+
+
+registry = Registry()
+
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+
+
+def fingerprint(sql):
+    """SQL with literals and IN lists collapsed, so repeats of one query compare equal"""
+    sql = _LITERALS.sub('?', sql)
+    return _IN_LISTS.sub('(...)', sql)
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` that counts and times queries"""
+
+    def __init__(self, keep_sql):
+        self.count = 0
+        self.duration = 0.0
+        self.keep_sql = keep_sql
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            if self.keep_sql:
+                self.statements.append(sql)
+
+
+def _labels(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return ('<unresolved>', '<none>')
+    func = match.func
+    view = getattr(func, 'view_class', None) or getattr(func, 'cls', None)
+    view_name = view.__name__ if view is not None else getattr(func, '__name__', repr(func))
+    return (match.url_name or match.route or match.view_name, view_name)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not metrics_setting('ENABLED') or request.path == '/metrics':
+            return self.get_response(request)
+        return self.measure(request, self.get_response)
+
+    def measure(self, request, get_response):
+        queries = QueryRecorder(keep_sql=metrics_setting('QUERY_LOG_THRESHOLD') is not None)
+        request._metrics_render = 0.0
+        started = time.perf_counter()
+        with self.counting(queries):
+            response = get_response(request)
+
+        if response.streaming and not response.is_async:
+            # The body runs its queries as it is iterated; record once it has been sent
+            response.streaming_content = self.measure_stream(request, response.streaming_content, queries, started)
+        else:
+            self.record(request, queries, started, len(response.content) if not response.streaming else 0)
+        return response
+
+    def counting(self, queries):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(queries))
+        return stack
+
+    def measure_stream(self, request, content, queries, started):
+        size = 0
+        try:
+            with self.counting(queries):
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self.record(request, queries, started, size)
+
+    def record(self, request, queries, started, size):
+        labels = _labels(request)
+        registry.recorder().record(labels, {
+            'request_duration_seconds': (time.perf_counter() - started) * 1e6,
+            'db_queries': queries.count,
+            'db_duration_seconds': queries.duration * 1e6,
+            'serialization_duration_seconds': request._metrics_render * 1e6,
+            'response_bytes': size,
+        })
+        threshold = metrics_setting('QUERY_LOG_THRESHOLD')
+        if threshold is not None and queries.count > threshold:
+            self.log_duplicates(request, labels, queries)
+
+    async def __acall__(self, request):
+        if not metrics_setting('ENABLED') or request.path == '/metrics':
+            return await self.get_response(request)
+        if not self.async_view(request):
+            # Django runs a sync view on this request's thread-sensitive thread; wrapping the call on
+            # that thread lets the execute wrappers see its queries, as under WSGI
+            return await sync_to_async(self.measure, thread_sensitive=True)(request, async_to_sync(self.get_response))
+
+        # Async views run their queries on other threads, so only time and size are known here
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        registry.recorder().record(_labels(request), {
+            'request_duration_seconds': (time.perf_counter() - started) * 1e6,
+            'response_bytes': 0 if response.streaming else len(response.content),
+        })
+        return response
+
+    def async_view(self, request):
+        try:
+            match = resolve(request.path_info, getattr(request, 'urlconf', None))
+        except Resolver404:
+            return False
+        return iscoroutinefunction(match.func)
+
+    def process_template_response(self, request, response):
+        # DRF responses render after the view returns; time that step on its own
+        render = response.render
+
+        def timed_render():
+            started = time.perf_counter()
+            rendered = render()
+            request._metrics_render = time.perf_counter() - started
+            return rendered
+
+        response.render = timed_render
+        return response
+
+    def log_duplicates(self, request, labels, queries):
+        repeated = [
+            (count, sql) for sql, count in Counter(map(fingerprint, queries.statements)).most_common(5)
+            if count > 1
+        ]
+        logger.warning(
+            '%s %s (%s, %s) issued %d queries in %.1fms; repeated: %s',
+            request.method, request.path, labels[0], labels[1], queries.count, queries.duration * 1000,
+            '; '.join(f'{count}x {sql}' for count, sql in repeated) or 'none',
+        )
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(snapshot):
+    lines = []
+    quantiles = metrics_setting('QUANTILES')
+    for series, (help_text, scale) in SERIES.items():
+        name = f'ecom_{series}'
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} summary')
+        for key in sorted(k for k in snapshot if k[0] == series):
+            histogram = snapshot[key]
+            labels = f'url_name="{_escape(key[1])}",view="{_escape(key[2])}"'
+            for q in quantiles:
+                lines.append(f'{name}{{{labels},quantile="{q}"}} {histogram.quantile(q) * scale:g}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.total * scale:g}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def scrape_allowed(request):
+    # REMOTE_ADDR only, as in ecom/throttling.py: X-Forwarded-For is client-controlled
+    if request.META.get('REMOTE_ADDR') in metrics_setting('ALLOWED_IPS'):
+        return True
+    token = metrics_setting('TOKEN')
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode())
+
+
+def metrics_view(request):
+    if not scrape_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_prometheus(registry.snapshot()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -0,0 +1,160 @@
+"""
+Password hashing off the request workers.
+
+PBKDF2 at Django's iteration count is tens of milliseconds of CPU per call,
+so a burst of logins occupies every worker. The async login and register
+views (see ecom/credentials.py) hash on a process pool instead:
+``PASSWORD_HASHING['WORKERS']`` processes, with at most ``MAX_PENDING`` hashes
+queued or running. Past that, ``PoolBusy`` is raised and the view answers 503
+rather than queueing without bound.
+
+``authenticate`` and ``check_password`` mirror ModelBackend and
+``User.check_password``. That includes the upgrade on login: a password
+stored with a hasher other than ``PASSWORD_HASHERS[0]``, or with fewer
+iterations than it now uses, is rehashed and saved. Changing the first
+hasher therefore upgrades users as they log in.
+
+Workers only receive a hasher's dotted path and the strings to hash, so
+this module must not import models at the top.
+"""
+import asyncio
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hasher, identify_hasher, is_password_usable
+from django.contrib.auth.signals import user_login_failed
+from django.utils.module_loading import import_string
+
+from ecom.workers import setup_django
+
+DEFAULTS = {
+    'WORKERS': 2,
+    'MAX_PENDING': 64,
+    'RATE_LIMITS': {},
+}
+
+
+def hashing_setting(name):
+    return getattr(settings, 'PASSWORD_HASHING', {}).get(name, DEFAULTS[name])
+
+
+class PoolBusy(Exception):
+    pass
+
+
+def _encode(hasher_path, password):
+    hasher = import_string(hasher_path)()
+    return hasher.encode(password, hasher.salt())
+
+
+def _verify(hasher_path, password, encoded):
+    return import_string(hasher_path)().verify(password, encoded)
+
+
+def _path(hasher):
+    return f'{type(hasher).__module__}.{type(hasher).__qualname__}'
+
+
+class HashingPool:
+    """A process pool, started on first use, that refuses work past ``MAX_PENDING``"""
+
+    def __init__(self):
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork (see ecom/workers.py)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=hashing_setting('WORKERS'),
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=setup_django,
+                )
+            return self._executor
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._pending >= hashing_setting('MAX_PENDING'):
+                raise PoolBusy
+            self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor(), fn, *args)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for the next caller
+            self.shutdown(wait=False)
+            raise PoolBusy
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+pool = HashingPool()
+atexit.register(pool.shutdown)
+
+
+async def make_password(password):
+    """``django.contrib.auth.hashers.make_password``, hashed on the pool"""
+    return await pool.run(_encode, _path(get_hasher('default')), password)
+
+
+async def check_password(user, password):
+    """``user.check_password(password)`` on the pool, saving an upgraded hash when it matches"""
+    encoded = user.password
+    if password is None or not is_password_usable(encoded):
+        return False
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    if not await pool.run(_verify, _path(hasher), password, encoded):
+        return False
+
+    preferred = get_hasher('default')
+    if hasher.algorithm != preferred.algorithm or preferred.must_update(encoded):
+        user.password = await make_password(password)
+        await sync_to_async(user.save)(update_fields=['password'])
+    return True
+
+
+async def authenticate(request, username, password):
+    """ModelBackend.authenticate for username/password, with the hashing on the pool"""
+    User = get_user_model()
+    user = None
+    if username is not None and password is not None:
+        try:
+            user = await sync_to_async(User._default_manager.get_by_natural_key)(username)
+        except User.DoesNotExist:
+            # Hash anyway, so the response time does not reveal which usernames exist
+            await make_password(password)
+        else:
+            if not (await check_password(user, password) and getattr(user, 'is_active', True)):
+                user = None
+    if user is None:
+        await user_login_failed.asend(sender=__name__, credentials={'username': username}, request=request)
+    return user
+
+
+def create_user(encoded, **fields):
+    """``User.objects.create_user`` for a password already hashed by ``make_password``"""
+    User = get_user_model()
+    manager = User._default_manager
+    fields['email'] = manager.normalize_email(fields.get('email'))
+    fields[User.USERNAME_FIELD] = User.normalize_username(fields[User.USERNAME_FIELD])
+    user = User(**fields)
+    user.password = encoded
+    user.save(using=manager.db)
+    return user
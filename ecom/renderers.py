@@ -0,0 +1,36 @@
+"""
+JSON rendering through orjson, when it is installed.
+
+``FastJSONRenderer`` produces the same bytes as DRF's ``JSONRenderer``:
+compact UTF-8, datetimes as ISO 8601 with ``Z`` for UTC, and everything
+orjson has no native encoding for (Decimal, lazy strings, timedelta, ...)
+through DRF's own encoder. Without orjson, or when the client asks for
+indented output, it is ``JSONRenderer``.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+_encoder = encoders.JSONEncoder()
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_encoder.default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Integers beyond 64 bits and the like; the stdlib encoder copes
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same JavaScript-safe escaping as JSONRenderer
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -53,6 +53,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'ecom.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -90,6 +91,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # WAL lets readers proceed during writes; IMMEDIATE takes the write lock up
+        # front so concurrent purchases queue on the busy timeout instead of failing
+        'OPTIONS': {
+            'init_command': 'PRAGMA journal_mode=WAL;',
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -138,9 +146,139 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
     ],
+    # simplejwt's JWTAuthentication with users cached per process (see ecom/authentication.py)
     'DEFAULT_AUTHENTICATION_CLASSES': (
-            'rest_framework_simplejwt.authentication.JWTAuthentication',
-        )
+            'ecom.authentication.CachedJWTAuthentication',
+        ),
+    # Same output as JSONRenderer, encoded by orjson when it is installed (see ecom/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'ecom.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+}
+
+# LocMemCache evicts least-recently-used entries past MAX_ENTRIES. For a cache
+# shared between worker processes use FileBasedCache with the same OPTIONS.
+# 'versions' holds the response cache's version counters (see ecom/cache.py).
+# It must be shared by every process that writes or serves, or a bump in one
+# worker (or in manage.py refresh_trending) leaves the others serving old
+# bodies. FileBasedCache shares them between the processes of one host; point
+# it at Redis or Memcached when workers span hosts.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecom',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'var' / 'cache-versions',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+}
+
+# Seconds a cached anonymous product response may live (see ecom/cache.py)
+RESPONSE_CACHE_TIMEOUT = 300
+
+# How prdapi hands notifications off the request path (see prdapi/notifications.py).
+# MODE is "thread", "outbox" (drained by manage.py drain_notifications) or "inline".
+NOTIFICATION_DISPATCH = {
+    'MODE': 'thread',
+    'QUEUE_SIZE': 10000,
+    'BATCH_SIZE': 500,
+    'COALESCE_WINDOW': 10,
+}
+
+# Resized copies rendered for every api.ProductImage upload (see api/images.py).
+# Formats this Pillow build cannot encode are skipped.
+IMAGE_DERIVATIVES = {
+    'WIDTHS': (320, 640, 1280),
+    'FORMATS': ('webp', 'avif'),
+    'QUALITY': 80,
+    'WORKERS': 2,
+}
+
+# Page size for the cursor-paginated product lists (?page_size= may override up to 100)
+PRODUCT_PAGE_SIZE = 20
+
+# Keyset pages of the prdapi like/comment/transaction history (see prdapi/history.py).
+# Pages are streamed, so MAX_PAGE_SIZE bounds response time rather than memory.
+HISTORY_PAGINATION = {
+    'PAGE_SIZE': 100,
+    'MAX_PAGE_SIZE': 5000,
+}
+
+# Balances are an append-only ledger (see prdapi/ledger.py); `manage.py
+# snapshot_balances --interval 60` keeps the per-user snapshots close to the
+# head, stopping SNAPSHOT_LAG_SECONDS short of it for transactions still in flight.
+LEDGER = {
+    'SNAPSHOT_LAG_SECONDS': 60,
+}
+
+# Read-only lists with a FlatSerializer build their rows from .values() instead
+# of ModelSerializer instances (see ecom/flat.py); False falls back to the latter.
+FLAT_LIST_RESPONSES = True
+
+# Per-endpoint histograms served at /metrics (see ecom/metrics.py). Requests
+# issuing more than QUERY_LOG_THRESHOLD queries log their repeated SQL;
+# None turns that off. Async views (the login and register endpoints) report
+# only wall time and response size, so query counts and this log skip them.
+# /metrics answers clients in ALLOWED_IPS, or sending "Authorization: Bearer
+# <TOKEN>" when TOKEN is set, and 403 to everyone else.
+METRICS = {
+    'ENABLED': True,
+    'QUERY_LOG_THRESHOLD': 50,
+    'ALLOWED_IPS': ('127.0.0.1', '::1'),
+    'TOKEN': None,
+}
+
+# Decay and weights for /products/trending/ (see api/trending.py). Scores are
+# refreshed by `manage.py refresh_trending --interval 60`; run it once with
+# --full after changing HALF_LIFE_HOURS or the weights.
+TRENDING = {
+    'HALF_LIFE_HOURS': 24,
+    'LIKE_WEIGHT': 1.0,
+    'COMMENT_WEIGHT': 2.0,
+    'TOP_K': 100,
+    'CACHE_SECONDS': 60,
+}
+
+# Newest comments embedded in an api product detail; older ones come from
+# /products/<pk>/comments/, COMMENT_PAGE_SIZE at a time
+PRODUCT_DETAIL_COMMENTS = 10
+COMMENT_PAGE_SIZE = 20
+
+# Login and register in both apps hash passwords on a pool of WORKERS processes
+# (see ecom/passwords.py) and answer 503 once MAX_PENDING hashes are queued.
+# RATE_LIMITS are token buckets of (attempts, per seconds) per client IP and
+# per username, spent before any hashing; an empty bucket means 429.
+PASSWORD_HASHING = {
+    'WORKERS': 2,
+    'MAX_PENDING': 64,
+    'RATE_LIMITS': {
+        'ip': (30, 60),
+        'username': (10, 60),
+    },
+}
+
+# New passwords use the first hasher. A login with a hash from a later one, or
+# from an older iteration count, is rehashed with the first and saved, so
+# moving e.g. Argon2PasswordHasher (needs argon2-cffi) to the top upgrades
+# users as they log in.
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# Users behind JWTs, cached per process by CachedJWTAuthentication. Saves of a
+# User or UserProfile evict their entry in the saving process at once; other
+# processes serve the old row for at most TTL_SECONDS.
+JWT_USER_CACHE = {
+    'TTL_SECONDS': 30,
+    'MAX_ENTRIES': 10000,
 }
 
 SIMPLE_JWT = {
@@ -0,0 +1,64 @@
+"""
+Token buckets for credential endpoints.
+
+``PASSWORD_HASHING['RATE_LIMITS']`` maps a scope (``'ip'``, ``'username'``)
+to ``(attempts, seconds)``. Each client IP and each username gets a bucket
+of ``attempts`` tokens, refilled evenly over ``seconds``. ``take`` spends one
+token from every bucket a request falls in, or none if any is empty. In that
+case it returns how long to wait, so the views reject the attempt before
+any hashing starts.
+
+Buckets live in the default cache, so workers share them when the cache is
+shared. The read-modify-write is not atomic, so a burst racing on one
+bucket can get a token or two more than its limit.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+
+from ecom.passwords import hashing_setting
+
+KEY_PREFIX = 'throttle:'
+
+
+class Throttled(Exception):
+    def __init__(self, wait):
+        super().__init__(f'Retry in {wait:.1f}s')
+        self.wait = wait
+
+
+def client_ip(request):
+    # REMOTE_ADDR only: X-Forwarded-For is client-controlled unless a trusted proxy rewrites it
+    return request.META.get('REMOTE_ADDR') or 'unknown'
+
+
+def _key(scope, ident):
+    return KEY_PREFIX + scope + ':' + hashlib.blake2b(ident.encode(), digest_size=16).hexdigest()
+
+
+async def take(idents, now=None):
+    """Spend a token for each ``{scope: ident}`` with a configured limit; raises ``Throttled`` when one is empty"""
+    limits = hashing_setting('RATE_LIMITS')
+    buckets = {
+        _key(scope, str(ident)): limits[scope]
+        for scope, ident in idents.items() if scope in limits and ident is not None
+    }
+    if not buckets:
+        return
+    now = time.time() if now is None else now
+    stored = await cache.aget_many(list(buckets))
+
+    spent, wait = {}, 0.0
+    for key, (attempts, seconds) in buckets.items():
+        rate = attempts / seconds
+        tokens, stamp = stored.get(key, (attempts, now))
+        tokens = min(attempts, tokens + (now - stamp) * rate)
+        if tokens < 1:
+            wait = max(wait, (1 - tokens) / rate)
+        spent[key] = (tokens - 1, now)
+    if wait:
+        raise Throttled(wait)
+    # A bucket left alone for ``seconds`` is full again, which is what a missing key means
+    for key, value in spent.items():
+        await cache.aset(key, value, timeout=int(buckets[key][1]) + 1)
@@ -19,7 +19,11 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
+from ecom.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("api/",include("prdapi.urls"))
+    path("api/v2/", include("api.urls")),
+    path("api/",include("prdapi.urls")),
+    path("metrics", metrics_view),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
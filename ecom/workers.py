@@ -0,0 +1,18 @@
+"""
+Helpers for process pools that run project code.
+
+Pools start their workers with the ``spawn`` method, not ``fork``: the server
+process has threads (the notification dispatcher, pool feeders, ...) that a
+forked child would inherit in whatever state they were in. A spawned worker
+is a fresh interpreter, so pass ``setup_django`` as the pool's initializer
+before it unpickles anything that imports models.
+
+This module must not import models.
+"""
+import os
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecom.settings')
+    import django
+    django.setup()
@@ -0,0 +1,32 @@
+from rest_framework.filters import BaseFilterBackend
+
+from .serializers import ProductFilterSerializer
+
+
+class ProductFilterBackend(BaseFilterBackend):
+    """
+    Validated product filters for the listing.
+
+    Every lookup has an index behind it: ``price`` for the price range,
+    ``(user, -created_at)`` for the owner and ``-created_at`` /
+    ``(-like_count, -created_at)`` for the orderings.
+    """
+    lookups = {
+        "min_price": "price__gte",
+        "max_price": "price__lte",
+        "owner": "user_id",
+        "created_after": "created_at__gte",
+        "created_before": "created_at__lt",
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        params = ProductFilterSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+
+        queryset = queryset.filter(**{
+            lookup: filters[name] for name, lookup in self.lookups.items() if name in filters
+        })
+        if filters.get("my_products") and request.user.is_authenticated:
+            queryset = queryset.filter(user=request.user)
+        return queryset.order_by(*ProductFilterSerializer.ORDERINGS[filters["ordering"]])
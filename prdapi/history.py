@@ -0,0 +1,93 @@
+"""
+Keyset-paginated, streamed history for likes, comments and transactions.
+
+Pages are ordered newest first on ``(created_at, id)``, and ``?cursor=`` is
+the position of the last row already sent, so each page is an index range
+scan however deep the client has paged. Rows are fetched with ``iterator()``
+and written out as they arrive; the response is
+
+    {"results": [...], "next": "<url>" | null}
+
+with ``next`` last, because it is only known once the page has been read.
+"""
+import heapq
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+
+from ecom.renderers import FastJSONRenderer
+
+# Rows serialized per chunk written to the client
+CHUNK_ROWS = 500
+
+
+def history_setting(name, default):
+    return getattr(settings, "HISTORY_PAGINATION", {}).get(name, default)
+
+
+def encode_cursor(row):
+    position = f"{row['created_at'].isoformat()}|{row['id']}"
+    return urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(raw):
+    try:
+        created_at, pk = urlsafe_b64decode(raw.encode()).decode().rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ValidationError({"cursor": "Invalid cursor"})
+
+
+def page_size(request):
+    default = history_setting("PAGE_SIZE", 100)
+    try:
+        size = int(request.GET.get("page_size", default))
+    except ValueError:
+        raise ValidationError({"page_size": "page_size must be a number"})
+    return max(1, min(size, history_setting("MAX_PAGE_SIZE", 5000)))
+
+
+def newest_first(queryset, cursor, limit):
+    """Rows of ``queryset`` (a ``.values()`` queryset) older than ``cursor``, newest first"""
+    if cursor is not None:
+        created_at, pk = cursor
+        # A range on created_at keeps the (owner, -created_at) index usable; ties are cut on id
+        queryset = queryset.filter(created_at__lte=created_at).exclude(Q(created_at=created_at) & Q(id__gte=pk))
+    return queryset.order_by("-created_at", "-id")[:limit].iterator(chunk_size=CHUNK_ROWS)
+
+
+def merge_newest_first(*streams):
+    return heapq.merge(*streams, key=lambda row: (row["created_at"], row["id"]), reverse=True)
+
+
+def stream_page(request, rows, build, limit):
+    """Stream ``build(row)`` for up to ``limit`` of ``rows``; a row beyond that means there is a next page"""
+    renderer = FastJSONRenderer()
+
+    def chunks():
+        yield b'{"results":['
+        last, sent, more, batch = None, 0, False, []
+        for row in rows:
+            if sent == limit:
+                more = True
+                break
+            batch.append(build(row))
+            last, sent = row, sent + 1
+            if len(batch) == CHUNK_ROWS:
+                yield (b"," if sent > CHUNK_ROWS else b"") + renderer.render(batch)[1:-1]
+                batch = []
+        if batch:
+            yield (b"," if sent > len(batch) else b"") + renderer.render(batch)[1:-1]
+
+        next_url = b"null"
+        if more:
+            params = request.GET.copy()
+            params["cursor"] = encode_cursor(last)
+            next_url = renderer.render(request.build_absolute_uri(f"{request.path}?{params.urlencode()}"))
+        yield b'],"next":' + next_url + b"}"
+
+    return StreamingHttpResponse(chunks(), content_type="application/json")
@@ -0,0 +1,140 @@
+"""
+Balances kept as an append-only, double-entry ledger.
+
+Money only moves by appending ``LedgerEntry`` rows: a deposit credits one
+user, and a purchase appends a debit for the buyer and an equal credit for
+the seller, both pointing at its ``Transaction``. Nothing is updated in
+place, so concurrent purchases never contend on a shared balance row.
+
+``BalanceSnapshot`` holds a user's balance through some entry id, and is
+moved forward by ``manage.py snapshot_balances``. A balance is then
+
+    snapshot.balance + sum(entries of the user with id > snapshot.through_entry_id)
+
+which reads only the entries since the last snapshot, through the
+``(user, id)`` index. Snapshots stop ``LEDGER['SNAPSHOT_LAG_SECONDS']`` short
+of now, so entries from transactions still in flight (ids are handed out
+before commit) are never skipped over.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import BalanceSnapshot, LedgerEntry, UserProfile
+
+ZERO = Decimal("0.00")
+
+DEFAULTS = {
+    "SNAPSHOT_LAG_SECONDS": 60,
+}
+
+
+def ledger_setting(name):
+    return getattr(settings, "LEDGER", {}).get(name, DEFAULTS[name])
+
+
+def balances_of(user_ids, chunk_size=900):
+    """Current balance of each of ``user_ids``"""
+    user_ids = list(user_ids)
+    balances = {}
+    # Chunked so the IN lists stay under SQLite's bound-parameter limit
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        snapshots = dict(
+            BalanceSnapshot.objects.filter(user_id__in=chunk).values_list("user_id", "balance")
+        )
+        through = BalanceSnapshot.objects.filter(user_id=OuterRef("user_id")).values("through_entry_id")
+        totals = dict(
+            LedgerEntry.objects.filter(user_id__in=chunk, id__gt=Coalesce(Subquery(through), 0))
+            .order_by().values_list("user_id").annotate(Sum("amount"))
+        )
+        for user_id in chunk:
+            balances[user_id] = snapshots.get(user_id, ZERO) + (totals.get(user_id) or ZERO)
+    return balances
+
+
+def balance_of(user_id):
+    return balances_of([user_id])[user_id]
+
+
+def open_accounts(balances):
+    """Create the profiles for ``{user: opening balance}``, depositing any non-zero balance"""
+    UserProfile.objects.bulk_create([UserProfile(user=user) for user in balances])
+    LedgerEntry.objects.bulk_create([
+        LedgerEntry(user=user, kind=LedgerEntry.DEPOSIT, amount=balance)
+        for user, balance in balances.items() if balance
+    ])
+
+
+def open_account(user, balance=ZERO):
+    open_accounts({user: balance})
+
+
+def record_purchases(transactions):
+    """Append the buyer's debit and the seller's credit for each of ``transactions``"""
+    LedgerEntry.objects.bulk_create([
+        entry
+        for tx in transactions if tx.amount
+        for entry in (
+            LedgerEntry(user_id=tx.sender_id, transaction=tx, kind=LedgerEntry.PURCHASE, amount=-tx.amount),
+            LedgerEntry(user_id=tx.receiver_id, transaction=tx, kind=LedgerEntry.PURCHASE, amount=tx.amount),
+        )
+    ])
+
+
+def record_purchase(tx):
+    record_purchases([tx])
+
+
+def take_snapshots(batch_size=500, lag=None):
+    """
+    Move every snapshot with newer entries forward; returns how many were written.
+
+    Each run snapshots through the newest entry older than the lag (the
+    horizon). Every snapshot already covers all of its user's entries up to the
+    previous horizon, the highest ``through_entry_id``, so only entries between
+    the two horizons are summed.
+    """
+    lag = ledger_setting("SNAPSHOT_LAG_SECONDS") if lag is None else lag
+    cutoff = timezone.now() - timedelta(seconds=lag)
+    horizon = (
+        LedgerEntry.objects.filter(created_at__lte=cutoff)
+        .order_by("-id").values_list("id", flat=True).first()
+    )
+    if horizon is None:
+        return 0
+
+    written = 0
+    # One transaction, so a run that fails part way leaves the previous horizon intact
+    with transaction.atomic():
+        watermark = BalanceSnapshot.objects.aggregate(through=Max("through_entry_id"))["through"] or 0
+        if horizon <= watermark:
+            return 0
+        deltas = list(
+            LedgerEntry.objects.filter(id__gt=watermark, id__lte=horizon)
+            .order_by("user_id").values_list("user_id").annotate(Sum("amount"))
+        )
+        rows = iter(deltas)
+        while batch := list(islice(rows, batch_size)):
+            current = dict(
+                BalanceSnapshot.objects.filter(user_id__in=[user_id for user_id, _ in batch])
+                .values_list("user_id", "balance")
+            )
+            BalanceSnapshot.objects.bulk_create(
+                [
+                    BalanceSnapshot(user_id=user_id, balance=current.get(user_id, ZERO) + delta,
+                                    through_entry_id=horizon)
+                    for user_id, delta in batch
+                ],
+                update_conflicts=True,
+                unique_fields=["user"],
+                update_fields=["balance", "through_entry_id", "taken_at"],
+            )
+            written += len(batch)
+    return written
@@ -0,0 +1,32 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from ecom import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Compare rows/s of the ModelSerializer and flat list paths, with and without the fast renderer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Rows serialized per run')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per path; the fastest counts')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        with benchmark.scratch_environment():
+            self.stdout.write('Seeding...')
+            benchmark.seed(users=50, products=options['rows'], likes_per_product=1, comments_per_product=0,
+                           transactions=options['rows'], notifications_per_user=0)
+            results = benchmark.serialization_benchmark(options['rows'], options['repeat'])
+
+        baselines = {}
+        for name, row in results.items():
+            baseline = baselines.setdefault(name.split(':')[0], row['rows_per_second'])
+            self.stdout.write(
+                f'{name:48} {row["rows_per_second"]:12,.0f} rows/s  {row["rows_per_second"] / baseline:5.1f}x'
+            )
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f'Results written to {options["output"]}')
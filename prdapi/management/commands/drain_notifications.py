@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from prdapi.notifications import drain_outbox
+
+
+class Command(BaseCommand):
+    help = 'Write queued NotificationOutbox rows as coalesced notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--loop', action='store_true', help='Keep draining until interrupted')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between passes with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            events, written = drain_outbox(batch_size=options['batch_size'])
+            if events or not options['loop']:
+                self.stdout.write(f'Drained {events} event(s) into {written} notification(s)')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
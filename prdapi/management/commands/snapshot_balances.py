@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from prdapi.ledger import take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Move balance snapshots forward over the ledger entries appended since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--lag', type=float, default=None,
+                            help='Leave entries newer than LAG seconds for the next run (default LEDGER setting)')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Keep running, snapshotting every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            count = take_snapshots(batch_size=options['batch_size'], lag=options['lag'])
+            self.stdout.write(f'Snapshotted {count} balance(s) in {time.perf_counter() - started:.2f}s')
+            if options['interval'] is None:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,121 @@
+import asyncio
+import time
+import tracemalloc
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from prdapi.models import Notification
+from prdapi.notifications import write_notifications
+from prdapi.streams import hub
+
+STREAM_PATH = '/api/notifications/stream/'
+
+
+class Connection:
+    """Minimal ASGI client holding one SSE request open until told to disconnect"""
+
+    def __init__(self, token):
+        self.token = token
+        self.status = None
+        self.requested = False
+        self.closed = asyncio.Event()
+        self.received = asyncio.Event()
+
+    @property
+    def scope(self):
+        return {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': STREAM_PATH,
+            'raw_path': STREAM_PATH.encode(),
+            'root_path': '',
+            'query_string': f'token={self.token}'.encode(),
+            'headers': [(b'host', b'localhost'), (b'accept', b'text/event-stream')],
+            'client': ('127.0.0.1', 50000),
+            'server': ('localhost', 80),
+        }
+
+    async def receive(self):
+        if not self.requested:
+            self.requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.closed.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif b'event: notification' in message.get('body', b''):
+            self.received.set()
+
+
+class Command(BaseCommand):
+    help = 'Hold N concurrent SSE streams open through ecom.asgi and report memory per connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=50, help='Connections are spread across this many users')
+        parser.add_argument('--timeout', type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        run = uuid.uuid4().hex[:8]
+        users = [User.objects.create_user(f'sse_load_{run}_{i}') for i in range(options['users'])]
+        try:
+            asyncio.run(self.run(users, options['connections'], options['timeout']))
+        finally:
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    async def run(self, users, count, timeout):
+        from ecom.asgi import application
+
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+        connections = [Connection(tokens[i % len(tokens)]) for i in range(count)]
+
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        tasks = [
+            asyncio.create_task(application(conn.scope, conn.receive, conn.send))
+            for conn in connections
+        ]
+        await self.wait_for(lambda: hub.connection_count() >= count, timeout, 'connections to open')
+        connect_seconds = time.perf_counter() - started
+        per_connection = (tracemalloc.get_traced_memory()[0] - baseline) / count
+
+        started = time.perf_counter()
+        await sync_to_async(write_notifications)([
+            Notification(from_user=users[0], to_user=user, message='load test') for user in users
+        ])
+        await asyncio.wait_for(
+            asyncio.gather(*(conn.received.wait() for conn in connections)), timeout
+        )
+        fanout_seconds = time.perf_counter() - started
+        tracemalloc.stop()
+
+        for conn in connections:
+            conn.closed.set()
+        await asyncio.wait(tasks, timeout=timeout)
+        await self.wait_for(lambda: hub.connection_count() == 0, timeout, 'streams to close')
+
+        failed = sum(1 for conn in connections if conn.status != 200)
+        self.stdout.write(
+            f'{count} connections opened in {connect_seconds:.2f}s, '
+            f'{per_connection / 1024:.1f} KiB traced memory per connection, '
+            f'fan-out to all in {fanout_seconds * 1000:.1f}ms'
+        )
+        if failed:
+            raise CommandError(f'{failed} connection(s) did not get a 200 response')
+
+    async def wait_for(self, predicate, timeout, what):
+        deadline = time.perf_counter() + timeout
+        while not predicate():
+            if time.perf_counter() > deadline:
+                raise CommandError(f'Timed out waiting for {what}')
+            await asyncio.sleep(0.05)
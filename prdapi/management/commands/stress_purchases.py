@@ -0,0 +1,106 @@
+import random
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+
+from prdapi.ledger import balances_of, open_account
+from prdapi.models import Product, Transaction
+from prdapi.purchases import PurchaseError, purchase_product
+
+USER_PREFIX = 'stress_buyer_'
+
+
+class Command(BaseCommand):
+    help = 'Hammer purchase_product from N threads and verify the total balance is conserved'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--buys', type=int, default=50, help='Purchases attempted per thread')
+        parser.add_argument('--users', type=int, default=4)
+        parser.add_argument('--balance', type=Decimal, default=Decimal('100.00'))
+        parser.add_argument('--price', type=Decimal, default=Decimal('7.50'))
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded users and products')
+
+    def handle(self, *args, **options):
+        users, products = self.seed(options['users'], options['balance'], options['price'])
+        user_ids = [user.pk for user in users]
+        expected_total = options['balance'] * len(users)
+        stats = {'purchased': 0, 'replayed': 0, 'rejected': 0, 'retries': 0}
+        lock = threading.Lock()
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(options['buys']):
+                    buyer = rng.choice(users)
+                    product = rng.choice([p for p in products if p.user_id != buyer.pk])
+                    key = uuid.uuid4().hex
+                    # Every fifth purchase is retried with the same key, as a flaky client would
+                    for _attempt in range(2 if rng.random() < 0.2 else 1):
+                        outcome = self.buy(buyer, product, key, stats, lock)
+                        with lock:
+                            stats[outcome] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        balances = balances_of(user_ids)
+        total = sum(balances.values())
+        negative = sum(1 for balance in balances.values() if balance < 0)
+        recorded = Transaction.objects.filter(sender_id__in=user_ids).count()
+        attempts = sum(stats[k] for k in ('purchased', 'replayed', 'rejected'))
+
+        self.stdout.write(
+            f"{attempts} attempts in {elapsed:.2f}s ({attempts / elapsed:.1f}/s): "
+            f"{stats['purchased']} purchased, {stats['replayed']} replayed, "
+            f"{stats['rejected']} rejected, {stats['retries']} lock retries"
+        )
+
+        if not options['keep']:
+            User.objects.filter(pk__in=user_ids).delete()
+
+        if total != expected_total or negative or recorded != stats['purchased']:
+            raise CommandError(
+                f'Invariant broken: total {total} (expected {expected_total}), '
+                f'{negative} negative balance(s), {recorded} transactions for {stats["purchased"]} purchases'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Total balance conserved at {total}'))
+
+    def seed(self, count, balance, price):
+        run = uuid.uuid4().hex[:8]
+        users = []
+        for i in range(count):
+            user = User.objects.create_user(f'{USER_PREFIX}{run}_{i}')
+            open_account(user, balance)
+            users.append(user)
+        products = Product.objects.bulk_create([
+            Product(user=user, name=f'stress {run} {i}', desc='stress test item', price=price, image='products/stress.jpg')
+            for i, user in enumerate(users)
+        ])
+        return users, products
+
+    def buy(self, buyer, product, key, stats, lock, max_retries=50):
+        for attempt in range(max_retries):
+            try:
+                _, created = purchase_product(buyer, product, key)
+                return 'purchased' if created else 'replayed'
+            except PurchaseError:
+                return 'rejected'
+            except OperationalError:
+                # SQLite reports lock contention past the busy timeout as OperationalError
+                with lock:
+                    stats['retries'] += 1
+                time.sleep(0.001 * (attempt + 1))
+        raise CommandError('Gave up after repeated lock contention')
@@ -0,0 +1,119 @@
+from decimal import Decimal
+from itertools import groupby
+
+from django.core.management.base import BaseCommand, CommandError
+
+from prdapi.models import BalanceSnapshot, LedgerEntry, Transaction
+
+ZERO = Decimal('0.00')
+
+
+class Command(BaseCommand):
+    help = (
+        'Check the whole ledger in streaming passes: every purchase balances, no balance ever goes '
+        'negative and every snapshot matches the entries it covers'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per round trip')
+        parser.add_argument('--max-problems', type=int, default=20, help='Problems printed before only counting')
+
+    def handle(self, *args, **options):
+        self.chunk_size = options['chunk_size']
+        self.max_problems = options['max_problems']
+        self.problems = 0
+
+        transactions = self.check_transactions()
+        self.check_unrecorded()
+        entries, users = self.check_accounts()
+
+        summary = f'{entries} entries, {transactions} transactions, {users} accounts'
+        if self.problems:
+            raise CommandError(f'Ledger has {self.problems} problem(s) across {summary}')
+        self.stdout.write(self.style.SUCCESS(f'Ledger consistent: {summary}'))
+
+    def problem(self, message):
+        self.problems += 1
+        if self.problems <= self.max_problems:
+            self.stderr.write(message)
+
+    def check_transactions(self):
+        """Each purchase is one debit of the sender and one credit of the receiver, for its amount"""
+        rows = (
+            LedgerEntry.objects.filter(transaction__isnull=False)
+            .order_by('transaction_id', 'id')
+            .values_list('transaction_id', 'user_id', 'amount',
+                         'transaction__sender_id', 'transaction__receiver_id', 'transaction__amount')
+            .iterator(chunk_size=self.chunk_size)
+        )
+        count = 0
+        for tx_id, entries in groupby(rows, key=lambda row: row[0]):
+            count += 1
+            legs, total, debited, credited = 0, ZERO, False, False
+            for _, user_id, amount, sender_id, receiver_id, tx_amount in entries:
+                legs += 1
+                total += amount
+                debited |= user_id == sender_id and amount == -tx_amount
+                credited |= user_id == receiver_id and amount == tx_amount
+            if legs != 2 or total or not (debited and credited):
+                self.problem(f'Transaction {tx_id}: {legs} entries summing to {total}, '
+                             f'debit of sender {"found" if debited else "missing"}, '
+                             f'credit of receiver {"found" if credited else "missing"}')
+        return count
+
+    def check_unrecorded(self):
+        """Transactions since the ledger was opened that have no entries at all"""
+        opened = LedgerEntry.objects.order_by('id').values_list('created_at', flat=True).first()
+        if opened is None:
+            return
+        unrecorded = (
+            Transaction.objects.filter(created_at__gte=opened, entries__isnull=True).exclude(amount=0)
+            .values_list('pk', flat=True).iterator(chunk_size=self.chunk_size)
+        )
+        for tx_id in unrecorded:
+            self.problem(f'Transaction {tx_id}: no ledger entries')
+
+    def check_accounts(self):
+        """Replay every account in entry order against its snapshot"""
+        rows = (
+            LedgerEntry.objects.order_by('user_id', 'id')
+            .values_list('user_id', 'id', 'amount')
+            .iterator(chunk_size=self.chunk_size)
+        )
+        snapshots = (
+            BalanceSnapshot.objects.order_by('user_id')
+            .values_list('user_id', 'balance', 'through_entry_id')
+            .iterator(chunk_size=self.chunk_size)
+        )
+        snapshot = next(snapshots, None)
+        entries = users = 0
+
+        for user_id, account in groupby(rows, key=lambda row: row[0]):
+            users += 1
+            # Snapshots of users without entries are only right if they are zero
+            while snapshot is not None and snapshot[0] < user_id:
+                self.check_snapshot(snapshot, ZERO)
+                snapshot = next(snapshots, None)
+            covered = snapshot if snapshot is not None and snapshot[0] == user_id else None
+
+            balance, at_snapshot = ZERO, ZERO
+            for _, entry_id, amount in account:
+                entries += 1
+                balance += amount
+                if covered is not None and entry_id <= covered[2]:
+                    at_snapshot = balance
+                if balance < 0:
+                    self.problem(f'User {user_id}: balance {balance} after entry {entry_id}')
+            if covered is not None:
+                self.check_snapshot(covered, at_snapshot)
+                snapshot = next(snapshots, None)
+
+        while snapshot is not None:
+            self.check_snapshot(snapshot, ZERO)
+            snapshot = next(snapshots, None)
+        return entries, users
+
+    def check_snapshot(self, snapshot, expected):
+        user_id, balance, through = snapshot
+        if balance != expected:
+            self.problem(f'User {user_id}: snapshot through entry {through} is {balance}, entries sum to {expected}')
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prdapi', '0004_notification_outbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['to_user', 'status', '-created_at'], name='prdapi_noti_to_user_edc046_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prdapi', '0005_notification_unread_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['user', '-created_at'], name='prdapi_comm_user_id_f6adc3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['product', '-created_at'], name='prdapi_comm_product_26f405_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['user', '-created_at'], name='prdapi_like_user_id_74e26a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['product', '-created_at'], name='prdapi_like_product_c08ad2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['user', '-created_at'], name='prdapi_prod_user_id_7ada1e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='prdapi_prod_price_dbdef5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['sender', '-created_at'], name='prdapi_tran_sender__e9ba9b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['receiver', '-created_at'], name='prdapi_tran_receive_7276fa_idx'),
+        ),
+    ]
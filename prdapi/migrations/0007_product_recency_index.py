@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prdapi', '0006_read_model_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-created_at'], name='prdapi_prod_created_80477a_idx'),
+        ),
+    ]
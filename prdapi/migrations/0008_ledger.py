@@ -0,0 +1,87 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+BATCH_SIZE = 1000
+
+
+def open_ledger(apps, schema_editor):
+    """Carry each stored balance over as an opening deposit, snapshotted through that entry"""
+    UserProfile = apps.get_model('prdapi', 'UserProfile')
+    LedgerEntry = apps.get_model('prdapi', 'LedgerEntry')
+    BalanceSnapshot = apps.get_model('prdapi', 'BalanceSnapshot')
+
+    last_id = 0
+    while True:
+        profiles = list(
+            UserProfile.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', 'user_id', 'balance')[:BATCH_SIZE]
+        )
+        if not profiles:
+            break
+        last_id = profiles[-1][0]
+        LedgerEntry.objects.bulk_create([
+            LedgerEntry(user_id=user_id, kind='deposit', amount=balance)
+            for _, user_id, balance in profiles if balance
+        ])
+        opening = dict(
+            LedgerEntry.objects.filter(user_id__in=[user_id for _, user_id, _ in profiles])
+            .values_list('user_id', 'id')
+        )
+        BalanceSnapshot.objects.bulk_create([
+            BalanceSnapshot(user_id=user_id, balance=balance, through_entry_id=opening.get(user_id, 0))
+            for _, user_id, balance in profiles
+        ])
+
+
+def close_ledger(apps, schema_editor):
+    """Fold the ledger back into the balance column"""
+    UserProfile = apps.get_model('prdapi', 'UserProfile')
+    LedgerEntry = apps.get_model('prdapi', 'LedgerEntry')
+
+    totals = LedgerEntry.objects.order_by().values_list('user_id').annotate(Sum('amount'))
+    for user_id, balance in totals.iterator():
+        UserProfile.objects.filter(user_id=user_id).update(balance=balance)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('prdapi', '0007_product_recency_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance_snapshot', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('through_entry_id', models.PositiveBigIntegerField()),
+                ('taken_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('deposit', 'Deposit'), ('purchase', 'Purchase')], max_length=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='prdapi.transaction')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'id'], name='prdapi_ledg_user_id_b58a7c_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('amount', 0), _negated=True), name='ledger_entry_amount_nonzero')],
+            },
+        ),
+        migrations.RunPython(open_ledger, close_ledger),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='balance',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prdapi', '0008_ledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notificationoutbox',
+            name='kind',
+            field=models.CharField(choices=[('like', 'Like'), ('comment', 'Comment'), ('purchase', 'Purchase'), ('checkout', 'Checkout')], max_length=10),
+        ),
+    ]
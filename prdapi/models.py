@@ -1,21 +1,52 @@
 from django.db import models
+from django.db.models import Exists, OuterRef, Value
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
-    balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
     def __str__(self):
         return self.user.username
 
+    @property
+    def balance(self):
+        """Derived from the ledger; see prdapi/ledger.py"""
+        from .ledger import balance_of
+        return balance_of(self.user_id)
+
+class ProductQuerySet(models.QuerySet):
+    def with_viewer_like(self, user=None):
+        if user is not None and user.is_authenticated:
+            is_liked = Exists(Like.objects.filter(product=OuterRef("pk"), user=user))
+        else:
+            is_liked = Value(False)
+        return self.annotate(is_liked_by_user=is_liked)
+
+    def for_listing(self, user=None):
+        """Owner, comments and the viewer's like in a fixed number of queries"""
+        return self.select_related("user").prefetch_related("comment_set__user").with_viewer_like(user)
+
 class Product(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=50)
     desc = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to="products/")
+    like_count = models.PositiveIntegerField(default=0, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-like_count", "-created_at"]),
+            models.Index(fields=["user", "-created_at"]),
+            models.Index(fields=["price"]),
+            models.Index(fields=["-created_at"]),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -25,6 +56,10 @@ class Like(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     class Meta:
         unique_together = ('user', 'product')
+        indexes = [
+            models.Index(fields=["user", "-created_at"]),
+            models.Index(fields=["product", "-created_at"]),
+        ]
 
 class Comment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -32,6 +67,12 @@ class Comment(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-created_at"]),
+            models.Index(fields=["product", "-created_at"]),
+        ]
+
 class Notification(models.Model):
     STATUS_CHOICES = (
         ("read", "Read"),
@@ -44,6 +85,29 @@ class Notification(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="unread")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["to_user", "status", "-created_at"]),
+        ]
+
+class NotificationOutbox(models.Model):
+    LIKE = "like"
+    COMMENT = "comment"
+    PURCHASE = "purchase"
+    CHECKOUT = "checkout"
+    KIND_CHOICES = (
+        (LIKE, "Like"),
+        (COMMENT, "Comment"),
+        (PURCHASE, "Purchase"),
+        (CHECKOUT, "Checkout"),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    from_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    to_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    created_at = models.DateTimeField(default=timezone.now)
+
 class Transaction(models.Model):
     TX_TYPE = (
         ("deposit", "Deposit"),
@@ -55,4 +119,45 @@ class Transaction(models.Model):
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name="received_transactions")
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     tx_type = models.CharField(max_length=10, choices=TX_TYPE)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["sender", "idempotency_key"], name="unique_sender_idempotency_key"),
+        ]
+        indexes = [
+            models.Index(fields=["sender", "-created_at"]),
+            models.Index(fields=["receiver", "-created_at"]),
+        ]
+
+class LedgerEntry(models.Model):
+    """Append-only: positive amounts credit ``user``, negative ones debit them"""
+    DEPOSIT = "deposit"
+    PURCHASE = "purchase"
+    KIND_CHOICES = (
+        (DEPOSIT, "Deposit"),
+        (PURCHASE, "Purchase"),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="ledger_entries")
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, null=True, blank=True,
+                                    related_name="entries")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "id"]),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=~models.Q(amount=0), name="ledger_entry_amount_nonzero"),
+        ]
+
+class BalanceSnapshot(models.Model):
+    """A user's balance over every ledger entry up to ``through_entry_id``"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="balance_snapshot")
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    through_entry_id = models.PositiveBigIntegerField()
+    taken_at = models.DateTimeField(auto_now=True)
@@ -0,0 +1,270 @@
+"""
+Notification fan-out off the request path.
+
+Views call ``notify()``; depending on ``settings.NOTIFICATION_DISPATCH['MODE']``
+the event is
+
+* ``thread``: queued after commit for a background worker that coalesces
+  bursts and writes them with ``bulk_create`` (falls back to the outbox when
+  the queue is full),
+* ``outbox``: stored in ``NotificationOutbox`` inside the caller's transaction
+  and written later by ``manage.py drain_notifications``,
+* ``inline``: written immediately, as before.
+"""
+import atexit
+import logging
+import queue
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Notification, NotificationOutbox
+from .streams import hub
+
+logger = logging.getLogger(__name__)
+
+VERBS = {
+    NotificationOutbox.LIKE: "liked your product",
+    NotificationOutbox.COMMENT: "commented on your product",
+    NotificationOutbox.PURCHASE: "bought your product",
+    NotificationOutbox.CHECKOUT: "bought several of your products",
+}
+
+DEFAULTS = {
+    "MODE": "thread",
+    "QUEUE_SIZE": 10000,
+    "BATCH_SIZE": 500,
+    "COALESCE_WINDOW": 10,
+}
+
+
+def dispatch_setting(name):
+    return getattr(settings, "NOTIFICATION_DISPATCH", {}).get(name, DEFAULTS[name])
+
+
+@dataclass
+class NotificationEvent:
+    kind: str
+    from_user_id: int
+    from_username: str
+    to_user_id: int
+    product_id: int = None
+    created_at: datetime = field(default_factory=timezone.now)
+
+    @classmethod
+    def from_outbox(cls, row):
+        return cls(row.kind, row.from_user_id, row.from_user.username, row.to_user_id,
+                   row.product_id, row.created_at)
+
+    def to_outbox(self):
+        return NotificationOutbox(kind=self.kind, from_user_id=self.from_user_id, to_user_id=self.to_user_id,
+                                  product_id=self.product_id, created_at=self.created_at)
+
+
+def build_message(kind, usernames):
+    verb = VERBS[kind]
+    if len(usernames) == 1:
+        return f"{usernames[0]} {verb}"
+    others = len(usernames) - 1
+    return f"{usernames[0]} and {others} other{'s' if others > 1 else ''} {verb}"
+
+
+class Coalescer:
+    """Groups events per (recipient, kind, product) that start within ``window`` seconds"""
+
+    def __init__(self, window):
+        self.window = timedelta(seconds=window)
+        self.groups = {}
+
+    def add(self, event):
+        """Returns the notification of a group this event closed, if any"""
+        key = (event.to_user_id, event.kind, event.product_id)
+        closed = []
+        group = self.groups.get(key)
+        if group is not None and event.created_at - group["started"] >= self.window:
+            closed.append(self._build(self.groups.pop(key)))
+            group = None
+        if group is None:
+            group = self.groups[key] = {"event": event, "started": event.created_at, "actors": {}}
+        group["actors"].setdefault(event.from_user_id, event.from_username)
+        return closed
+
+    def pop_expired(self, now=None):
+        cutoff = (now or timezone.now()) - self.window
+        expired = [key for key, group in self.groups.items() if group["started"] <= cutoff]
+        return [self._build(self.groups.pop(key)) for key in expired]
+
+    def pop_all(self):
+        groups, self.groups = self.groups, {}
+        return [self._build(group) for group in groups.values()]
+
+    def _build(self, group):
+        event = group["event"]
+        return Notification(
+            from_user_id=next(iter(group["actors"])),
+            to_user_id=event.to_user_id,
+            message=build_message(event.kind, list(group["actors"].values())),
+        )
+
+
+def write_notifications(notifications):
+    if notifications:
+        Notification.objects.bulk_create(notifications, batch_size=dispatch_setting("BATCH_SIZE"))
+        forget_unread_counts({n.to_user_id for n in notifications})
+        # Inline mode writes inside the view's transaction; streams must not see rows that roll back
+        transaction.on_commit(lambda: hub.publish(notifications))
+
+
+def _unread_key(user_id):
+    return f"notifications:unread:{user_id}"
+
+
+def unread_count(user_id):
+    count = cache.get(_unread_key(user_id))
+    if count is None:
+        count = Notification.objects.filter(to_user_id=user_id, status="unread").count()
+        cache.set(_unread_key(user_id), count, timeout=300)
+    return count
+
+
+def forget_unread_counts(user_ids):
+    cache.delete_many([_unread_key(user_id) for user_id in user_ids])
+
+
+class NotificationDispatcher:
+    """Bounded in-process queue drained by one daemon thread"""
+    poll_interval = 0.5
+
+    def __init__(self, queue_size=None, window=None, autostart=True):
+        self.queue = queue.Queue(maxsize=queue_size or dispatch_setting("QUEUE_SIZE"))
+        self.coalescer = Coalescer(dispatch_setting("COALESCE_WINDOW") if window is None else window)
+        self.autostart = autostart
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def submit(self, event):
+        if self.autostart:
+            self._ensure_worker()
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            logger.warning("Notification queue full, spilling event to the outbox")
+            event.to_outbox().save()
+
+    def flush(self):
+        """Write everything queued or pending, regardless of the coalescing window"""
+        with self._lock:
+            self._drain_queue()
+            self._write(self.coalescer.pop_all())
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stopping.clear()
+                    self._thread = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                first = self.queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                first = None
+            with self._lock:
+                ready = []
+                if first is not None:
+                    ready.extend(self.coalescer.add(first))
+                ready.extend(self._drain_queue())
+                ready.extend(self.coalescer.pop_expired())
+                self._write(ready)
+
+    def _drain_queue(self):
+        ready = []
+        while True:
+            try:
+                event = self.queue.get_nowait()
+            except queue.Empty:
+                return ready
+            ready.extend(self.coalescer.add(event))
+
+    def _write(self, notifications):
+        if not notifications:
+            return
+        try:
+            write_notifications(notifications)
+        except Exception:
+            logger.exception("Dropped %d notification(s)", len(notifications))
+        finally:
+            if threading.current_thread() is self._thread:
+                close_old_connections()
+
+
+dispatcher = NotificationDispatcher()
+atexit.register(dispatcher.stop)
+
+
+def notify(kind, from_user, to_user_id, product_id=None):
+    notify_many(from_user, [(kind, to_user_id, product_id)])
+
+
+def notify_many(from_user, recipients):
+    """``notify()`` for each ``(kind, to_user_id, product_id)`` in ``recipients``, written in one batch"""
+    events = [
+        NotificationEvent(kind, from_user.pk, from_user.username, to_user_id, product_id)
+        for kind, to_user_id, product_id in recipients if to_user_id != from_user.pk
+    ]
+    if not events:
+        return
+    mode = dispatch_setting("MODE")
+    if mode == "outbox":
+        NotificationOutbox.objects.bulk_create([event.to_outbox() for event in events])
+    elif mode == "inline":
+        write_notifications([
+            Notification(from_user_id=event.from_user_id, to_user_id=event.to_user_id,
+                         message=build_message(event.kind, [from_user.username]))
+            for event in events
+        ])
+    else:
+        def submit():
+            for event in events:
+                dispatcher.submit(event)
+
+        transaction.on_commit(submit)
+
+
+def drain_outbox(batch_size=None, window=None):
+    """Write pending outbox rows as coalesced notifications; returns (events, notifications)"""
+    batch_size = batch_size or dispatch_setting("BATCH_SIZE")
+    coalescer = Coalescer(dispatch_setting("COALESCE_WINDOW") if window is None else window)
+    events = written = 0
+    while True:
+        with transaction.atomic():
+            # Claim the batch: a concurrent drainer skips these rows instead of writing them again.
+            # SQLite has no row locks, but its IMMEDIATE transactions already run drainers one at a time.
+            rows = list(
+                NotificationOutbox.objects.select_related("from_user")
+                .select_for_update(skip_locked=True, of=("self",)).order_by("id")[:batch_size]
+            )
+            if not rows:
+                return events, written
+            ready = []
+            for row in rows:
+                ready.extend(coalescer.add(NotificationEvent.from_outbox(row)))
+            ready.extend(coalescer.pop_all())
+            write_notifications(ready)
+            NotificationOutbox.objects.filter(id__in=[row.id for row in rows]).delete()
+        events += len(rows)
+        written += len(ready)
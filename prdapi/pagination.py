@@ -0,0 +1,123 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class ProductCursorPagination(CursorPagination):
+    page_size = getattr(settings, 'PRODUCT_PAGE_SIZE', 20)
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
+
+class ProductListPagination(BasePagination):
+    """
+    Keyset pagination over the listing's whole ordering, e.g. ``(price, id)``.
+
+    CursorPagination positions its cursor on the first ordering field only and
+    skips ties with an offset it caps at 1000, so an ordering on ``price`` or
+    ``like_count`` repeats rows and never ends past 1000 equal values. Here the
+    cursor holds every ordering field of the boundary row, as prdapi/history.py
+    does for ``(created_at, id)``, and each page is a range on the full tuple.
+    Responses keep CursorPagination's ``next``/``previous``/``results`` shape.
+    """
+    page_size = ProductCursorPagination.page_size
+    page_size_query_param = 'page_size'
+    max_page_size = ProductCursorPagination.max_page_size
+    ordering = ProductCursorPagination.ordering
+    cursor_query_param = 'cursor'
+
+    def get_ordering(self, request, queryset, view):
+        # ProductFilterBackend has already validated ?ordering= and applied it
+        return tuple(queryset.query.order_by) or self.ordering
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, reverse, row):
+        position = '|'.join(['r' if reverse else 'n', *(str(self.value(row, field)) for field in self.fields)])
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, raw, model):
+        try:
+            reverse, *values = urlsafe_b64decode(raw.encode()).decode().split('|')
+            if reverse not in ('n', 'r') or len(values) != len(self.fields):
+                raise ValueError(raw)
+            return reverse == 'r', [
+                model._meta.get_field(field).to_python(value) for field, value in zip(self.fields, values)
+            ]
+        except (ValueError, UnicodeDecodeError, DjangoValidationError):
+            raise ValidationError({'cursor': 'Invalid cursor'})
+
+    @staticmethod
+    def value(row, field):
+        return row[field] if isinstance(row, dict) else getattr(row, field)
+
+    @staticmethod
+    def after(ordering, position):
+        """Rows past ``position`` in ``ordering``: past on the first field, or tied on it and past on the rest"""
+        past, tied = Q(), {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            past |= Q(**tied, **{f'{name}__{lookup}': value})
+            tied[name] = value
+        # The redundant range on the leading field keeps its index usable
+        first = ordering[0]
+        lookup = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{lookup}': position[0]}) & past
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        ordering = self.get_ordering(request, queryset, view)
+        self.fields = [field.lstrip('-') for field in ordering]
+
+        raw = request.query_params.get(self.cursor_query_param)
+        self.reverse, position = self.decode_cursor(raw, queryset.model) if raw else (False, None)
+        if self.reverse:
+            # Walk backwards from the cursor and flip the page round afterwards
+            ordering = tuple(field[1:] if field.startswith('-') else '-' + field for field in ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(ordering, position))
+
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, more
+        else:
+            self.has_next, self.has_previous = more, position is not None
+        return self.page
+
+    def get_next_link(self):
+        if not (self.has_next and self.page):
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(False, self.page[-1]))
+
+    def get_previous_link(self):
+        if not (self.has_previous and self.page):
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(True, self.page[0]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return CursorPagination().get_paginated_response_schema(schema)
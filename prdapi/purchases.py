@@ -0,0 +1,108 @@
+from django.db import IntegrityError, transaction
+
+from ecom.cache import bump_versions, invalidate_product
+from .ledger import balance_of, record_purchase, record_purchases
+from .models import NotificationOutbox, Product, Transaction, UserProfile
+from .notifications import notify, notify_many
+
+
+class PurchaseError(Exception):
+    pass
+
+
+class IdempotencyConflict(PurchaseError):
+    pass
+
+
+def _replay(tx, product):
+    if tx.product_id != product.pk:
+        raise IdempotencyConflict("Idempotency-Key was already used for a different product")
+    return tx, False
+
+
+def purchase_product(buyer, product, idempotency_key=None):
+    """
+    Move ``product.price`` from buyer to seller: record the Transaction and
+    append its debit and credit to the ledger.
+
+    Returns ``(transaction, created)``; a repeated ``idempotency_key`` returns
+    the original transaction with ``created=False`` instead of charging again,
+    or raises ``IdempotencyConflict`` if that transaction was for another product.
+    """
+    if idempotency_key:
+        existing = Transaction.objects.filter(sender=buyer, idempotency_key=idempotency_key).first()
+        if existing:
+            return _replay(existing, product)
+
+    seller_id = product.user_id
+    if buyer.pk == seller_id:
+        raise PurchaseError("You cannot buy your own product")
+
+    price = product.price
+    try:
+        with transaction.atomic():
+            # Serialises purchases by this buyer; the seller only gains a credit, so needs no lock
+            list(UserProfile.objects.select_for_update().filter(user_id=buyer.pk).values_list("pk", flat=True))
+            if balance_of(buyer.pk) < price:
+                raise PurchaseError("Insufficient balance")
+
+            tx = Transaction.objects.create(
+                product=product,
+                sender=buyer,
+                receiver_id=seller_id,
+                amount=price,
+                tx_type="withdraw",
+                idempotency_key=idempotency_key or None,
+            )
+            record_purchase(tx)
+            notify(NotificationOutbox.PURCHASE, buyer, seller_id, product.pk)
+    except IntegrityError:
+        # A concurrent retry with the same key committed first
+        if idempotency_key:
+            return _replay(Transaction.objects.get(sender=buyer, idempotency_key=idempotency_key), product)
+        raise
+
+    invalidate_product("prdapi", product.pk)
+    return tx, True
+
+
+def checkout(buyer, product_ids):
+    """
+    Buy every product in ``product_ids`` or none of them.
+
+    The Transactions and their ledger entries are each written with one
+    ``bulk_create``, and every seller gets a single notification however
+    many of their products were bought. Returns the Transactions.
+    """
+    products = list(Product.objects.filter(pk__in=product_ids).only("pk", "user_id", "price"))
+    missing = set(product_ids) - {product.pk for product in products}
+    if missing:
+        raise PurchaseError(f"Products not found: {', '.join(map(str, sorted(missing)))}")
+    if any(product.user_id == buyer.pk for product in products):
+        raise PurchaseError("You cannot buy your own product")
+
+    total = sum((product.price for product in products), 0)
+    with transaction.atomic():
+        # Same buyer lock as purchase_product, so a checkout and single buys can't overspend together
+        list(UserProfile.objects.select_for_update().filter(user_id=buyer.pk).values_list("pk", flat=True))
+        if balance_of(buyer.pk) < total:
+            raise PurchaseError("Insufficient balance")
+
+        transactions = Transaction.objects.bulk_create([
+            Transaction(product=product, sender=buyer, receiver_id=product.user_id, amount=product.price,
+                        tx_type="withdraw")
+            for product in products
+        ])
+        record_purchases(transactions)
+
+        sold = {}
+        for product in products:
+            sold.setdefault(product.user_id, []).append(product.pk)
+        notify_many(buyer, [
+            (NotificationOutbox.PURCHASE, seller_id, pks[0]) if len(pks) == 1
+            else (NotificationOutbox.CHECKOUT, seller_id, None)
+            for seller_id, pks in sold.items()
+        ])
+
+    bump_versions("prdapi:products", *(f"prdapi:product:{product.pk}" for product in products))
+    return transactions
@@ -1,7 +1,11 @@
 from email_validator import validate_email, EmailNotValidError
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Product, Comment, UserProfile, Like, Notification, Transaction
+from ecom.fieldsets import SparseFieldsetMixin
+from ecom.flat import FlatSerializer
+from ecom.passwords import create_user
+from .ledger import open_account
+from .models import Product, Comment, Like, Notification, Transaction
 
 
 class UserMiniSerializer(serializers.ModelSerializer):
@@ -35,8 +39,13 @@ class RegisterSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         balance = validated_data.pop("balance")
-        user = User.objects.create_user(**validated_data)
-        UserProfile.objects.create(user=user, balance=balance)
+        encoded = validated_data.pop("password_hash", None)
+        if encoded:
+            validated_data.pop("password")
+            user = create_user(encoded, **validated_data)
+        else:
+            user = User.objects.create_user(**validated_data)
+        open_account(user, balance)
         return user
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -47,7 +56,7 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ["id", "content", "user", "created_at"]
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = UserMiniSerializer(read_only=True)
     comments = CommentSerializer(source="comment_set", many=True, read_only=True)
 
@@ -65,14 +74,22 @@ class ProductSerializer(serializers.ModelSerializer):
             "is_liked_by_user","is_owner",
             "comments"
         ]
+        expandable_fields = ["comments"]
+        field_requirements = {
+            "user": ["user"],
+            "comments": ["comment_set"],
+            "is_liked_by_user": ["is_liked_by_user"],
+        }
 
     def get_like_count(self, obj):
-        return obj.like_set.count()
+        return obj.like_count
 
     def get_comment_count(self, obj):
-        return obj.comment_set.count()
+        return obj.comment_count
 
     def get_is_liked_by_user(self, obj):
+        if hasattr(obj, "is_liked_by_user"):
+            return obj.is_liked_by_user
         request = self.context.get("request")
         if request and request.user.is_authenticated:
             return obj.like_set.filter(user=request.user).exists()
@@ -83,6 +100,93 @@ class ProductSerializer(serializers.ModelSerializer):
         return request and request.user.is_authenticated and obj.user_id == request.user.id
 
 
+class ProductListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """Listing rows: no embedded comments, counts come from the denormalized columns"""
+    user = UserMiniSerializer(read_only=True)
+    is_liked_by_user = serializers.BooleanField(read_only=True)
+    is_owner = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = [
+            "id", "name", "price", "image", "user", "created_at",
+            "like_count", "comment_count", "is_liked_by_user", "is_owner",
+        ]
+        field_requirements = {"user": ["user"], "is_liked_by_user": ["is_liked_by_user"]}
+
+    def get_is_owner(self, obj):
+        request = self.context.get("request")
+        return bool(request and request.user.is_authenticated and obj.user_id == request.user.id)
+
+
+class ProductListFlatSerializer(FlatSerializer):
+    """ProductListSerializer's output, built from ``.values()`` rows"""
+    columns = {
+        "id": "id",
+        "name": "name",
+        "price": "price",
+        "image": "image",
+        "user.id": "user_id",
+        "user.username": "user__username",
+        "created_at": "created_at",
+        "like_count": "like_count",
+        "comment_count": "comment_count",
+        "is_liked_by_user": "is_liked_by_user",
+        "is_owner": "user_id",
+    }
+
+    def get_price(self, value):
+        # DecimalField renders a string, not the float a bare Decimal encodes to
+        return f"{value:f}"
+
+    def get_image(self, name):
+        if not name:
+            return None
+        url = Product._meta.get_field("image").storage.url(name)
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def get_is_owner(self, user_id):
+        request = self.context.get("request")
+        return bool(request and request.user.is_authenticated and user_id == request.user.id)
+
+
+class LikeHistorySerializer(FlatSerializer):
+    columns = {"product": "product__name"}
+
+
+class CommentHistorySerializer(FlatSerializer):
+    columns = {"product": "product__name", "content": "content"}
+
+
+class TransactionHistorySerializer(FlatSerializer):
+    columns = {"product": "product__name", "amount": "amount", "type": "tx_type", "date": "created_at"}
+
+
+class ProductFilterSerializer(serializers.Serializer):
+    ORDERINGS = {
+        "recent": ("-created_at", "-id"),
+        "price": ("price", "id"),
+        "-price": ("-price", "-id"),
+        "popular": ("-like_count", "-created_at", "-id"),
+    }
+
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    owner = serializers.IntegerField(min_value=1, required=False)
+    my_products = serializers.BooleanField(required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+    ordering = serializers.ChoiceField(choices=list(ORDERINGS), default="recent")
+
+    def validate(self, attrs):
+        if "min_price" in attrs and "max_price" in attrs and attrs["min_price"] > attrs["max_price"]:
+            raise serializers.ValidationError({"max_price": "max_price must not be below min_price"})
+        if "created_after" in attrs and "created_before" in attrs and attrs["created_after"] >= attrs["created_before"]:
+            raise serializers.ValidationError({"created_before": "created_before must be after created_after"})
+        return attrs
+
+
 class UserSerializer(serializers.ModelSerializer):
     balance = serializers.DecimalField(write_only=True, max_digits=10, decimal_places=2)
     class Meta:
@@ -129,6 +233,23 @@ class NotificationSerializer(serializers.ModelSerializer):
         model = Notification
         fields = "__all__"
 
+class MarkNotificationsReadSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False, max_length=1000)
+    before = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        if ("ids" in attrs) == ("before" in attrs):
+            raise serializers.ValidationError("Provide either ids or before")
+        return attrs
+
+class CheckoutSerializer(serializers.Serializer):
+    product_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=100)
+
+    def validate_product_ids(self, value):
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError("Each product can only be bought once")
+        return value
+
 class TransactionSerializer(serializers.ModelSerializer):
     sender = UserMiniSerializer(read_only=True)
     receiver = UserMiniSerializer(read_only=True)
@@ -0,0 +1,162 @@
+"""
+Server-Sent Events for live notifications.
+
+``hub`` keeps one small asyncio.Queue per connected stream, so thousands of
+idle clients cost a coroutine each rather than a thread. The notification
+dispatcher publishes from its worker thread; delivery is handed to each
+subscriber's event loop with ``call_soon_threadsafe``.
+"""
+import asyncio
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from ecom.authentication import CachedJWTAuthentication
+from .models import Notification
+
+DEFAULTS = {
+    "HEARTBEAT": 15,
+    "QUEUE_SIZE": 100,
+    "BACKLOG": 100,
+}
+
+# Sentinel telling a stream it fell behind and should end so the client resumes
+OVERFLOW = object()
+
+
+def stream_setting(name):
+    return getattr(settings, "NOTIFICATION_STREAM", {}).get(name, DEFAULTS[name])
+
+
+class NotificationHub:
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        queue = asyncio.Queue(maxsize=stream_setting("QUEUE_SIZE"))
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, user_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, notifications):
+        """Safe to call from any thread"""
+        with self._lock:
+            targets = [
+                (notification, list(self._subscribers.get(notification.to_user_id, ())))
+                for notification in notifications
+            ]
+        for notification, subscribers in targets:
+            if not subscribers or notification.id is None:
+                continue
+            payload = (notification.id, format_event(notification))
+            for loop, queue in subscribers:
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(_offer, queue, payload)
+
+
+def _offer(queue, payload):
+    try:
+        queue.put_nowait(payload)
+    except asyncio.QueueFull:
+        # Slow consumer: drop its queue and end the stream; Last-Event-ID resumes it
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(OVERFLOW)
+
+
+hub = NotificationHub()
+
+
+def format_event(notification):
+    data = json.dumps({
+        "id": notification.id,
+        "message": notification.message,
+        "from_user": notification.from_user_id,
+        "status": notification.status,
+        "created_at": notification.created_at.isoformat(),
+    })
+    return f"id: {notification.id}\nevent: notification\ndata: {data}\n\n"
+
+
+def _authenticate(request):
+    """EventSource cannot set headers, so the access token may also come as ?token="""
+    auth = CachedJWTAuthentication()
+    header = auth.get_header(request)
+    raw = auth.get_raw_token(header) if header else request.GET.get("token")
+    if not raw:
+        return None
+    try:
+        return auth.get_user(auth.get_validated_token(raw))
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+
+
+def _backlog(user_id, after_id):
+    rows = Notification.objects.filter(to_user_id=user_id, id__gt=after_id).order_by("id")
+    return [(n.id, format_event(n)) for n in rows[:stream_setting("BACKLOG")]]
+
+
+def _last_event_id(request):
+    value = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+async def notification_stream(request):
+    user = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    last_id = _last_event_id(request)
+    heartbeat = stream_setting("HEARTBEAT")
+
+    async def events():
+        subscriber = hub.subscribe(user.pk)
+        sent_id = last_id or 0
+        try:
+            yield "retry: 3000\n\n"
+            if last_id is not None:
+                # Subscribed first, so nothing published meanwhile is missed
+                for event_id, payload in await sync_to_async(_backlog)(user.pk, last_id):
+                    sent_id = event_id
+                    yield payload
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscriber[1].get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if item is OVERFLOW:
+                    return
+                event_id, payload = item
+                if event_id > sent_id:
+                    sent_id = event_id
+                    yield payload
+        finally:
+            hub.unsubscribe(user.pk, subscriber)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -1,3 +1,759 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from ecom.authentication import CachedJWTAuthentication, user_cache
+from ecom.metrics import Histogram, fingerprint, registry
+from ecom.renderers import FastJSONRenderer
+
+from .ledger import balance_of, balances_of, open_account, take_snapshots
+from .models import (
+    BalanceSnapshot, Comment, LedgerEntry, Like, Notification, NotificationOutbox, Product, Transaction, UserProfile,
+)
+from .purchases import purchase_product
+from .notifications import NotificationDispatcher, NotificationEvent
+from .streams import hub, notification_stream
+
+
+def make_user(username, balance='0'):
+    user = User.objects.create_user(username)
+    open_account(user, Decimal(balance))
+    return user
+
+
+def make_products(owner, count, price='10.00'):
+    return Product.objects.bulk_create([
+        Product(user=owner, name=f'Item {i}', desc='Test item', price=Decimal(price), image='products/x.jpg')
+        for i in range(count)
+    ])
+
+
+class PublicProductListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user('seller')
+        make_products(cls.owner, 5)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_cursor_pages_cover_catalog(self):
+        first = self.client.get('/api/products/public/', {'page_size': 3}).data
+        second = self.client.get(first['next']).data
+
+        self.assertEqual(len(first['results']), 3)
+        self.assertEqual(len(second['results']), 2)
+        self.assertIsNone(second['next'])
+        self.assertIn('cursor=', first['next'])
+
+    def test_listing_query_count_does_not_grow_with_the_page(self):
+        fan = make_user('fan')
+        Like.objects.create(user=fan, product=Product.objects.first())
+        Comment.objects.bulk_create([Comment(user=fan, product=product, content='Nice') for product in Product.objects.all()])
+        self.client.force_authenticate(fan)
+
+        # Page, owners (joined), comments, comment authors
+        with self.assertNumQueries(3):
+            results = self.client.get('/api/products/public/').data['results']
+
+        self.assertEqual(sum(product['is_liked_by_user'] for product in results), 1)
+
+    def test_sparse_fieldset_skips_comments(self):
+        with self.assertNumQueries(1):
+            results = self.client.get('/api/products/public/', {'fields': 'id,name,price'}).data['results']
+
+        self.assertEqual(set(results[0]), {'id', 'name', 'price'})
+
+    def test_api_app_is_mounted_next_to_prdapi(self):
+        self.assertEqual(self.client.get('/api/v2/products/').status_code, 200)
+
+
+class ProductListFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user('seller')
+        cls.other = make_user('other')
+        for price in ('5.00', '15.50', '25.00'):
+            make_products(cls.owner, 1, price)
+        make_products(cls.other, 1, '15.00')
+        Product.objects.filter(price=Decimal('25.00')).update(like_count=7)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def prices(self, **params):
+        response = self.client.get('/api/products/', params)
+        self.assertEqual(response.status_code, 200)
+        return [row['price'] for row in response.data['results']]
+
+    def test_price_range_is_inclusive_and_decimal(self):
+        self.assertEqual(self.prices(min_price='15.00', max_price='15.50', ordering='price'), ['15.00', '15.50'])
+
+    def test_owner_and_orderings(self):
+        self.assertEqual(self.prices(owner=self.other.pk), ['15.00'])
+        self.assertEqual(self.prices(ordering='-price'), ['25.00', '15.50', '15.00', '5.00'])
+        self.assertEqual(self.prices(ordering='popular')[0], '25.00')
+
+    def test_price_ordering_pages_with_the_cursor(self):
+        first = self.client.get('/api/products/', {'ordering': 'price', 'page_size': 2}).data
+        second = self.client.get(first['next']).data
+
+        prices = [row['price'] for row in first['results'] + second['results']]
+        self.assertEqual(prices, ['5.00', '15.00', '15.50', '25.00'])
+        self.assertIsNone(second['next'])
+        back = self.client.get(second['previous']).data
+        self.assertEqual([row['price'] for row in back['results']], ['5.00', '15.00'])
+
+    def test_pages_through_more_than_a_thousand_ties(self):
+        tied = {product.pk for product in make_products(self.other, 1100, '15.00')}
+        Product.objects.filter(pk__in=tied).update(like_count=7)
+        for ordering in ('price', 'popular'):
+            seen, url = [], '/api/products/'
+            params = {'ordering': ordering, 'page_size': 100}
+            while url:
+                page = self.client.get(url, params).data
+                seen += [row['id'] for row in page['results']]
+                url, params = page['next'], None
+            self.assertEqual(len(seen), 1104)
+            self.assertEqual(len(set(seen)), 1104)
+            self.assertTrue(tied <= set(seen))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/products/', {'ordering': 'price', 'cursor': 'bm90LWEtY3Vyc29y'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_params_are_rejected(self):
+        for params in ({'min_price': 'abc'}, {'min_price': '20', 'max_price': '10'}, {'ordering': 'name'}):
+            self.assertEqual(self.client.get('/api/products/', params).status_code, 400)
+
+    def test_rows_are_light_and_cost_one_query(self):
+        with self.assertNumQueries(1):
+            rows = self.client.get('/api/products/').data['results']
+
+        self.assertNotIn('comments', rows[0])
+        self.assertEqual(rows[0]['user']['username'], 'other')
+
+
+class FastRenderingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user('seller')
+        cls.fan = make_user('fan')
+        cls.products = make_products(cls.owner, 3, '12.50')
+        Like.objects.create(user=cls.fan, product=cls.products[0])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.fan)
+
+    def test_flat_rows_match_the_model_serializer(self):
+        flat = self.client.get('/api/products/').content
+        with override_settings(FLAT_LIST_RESPONSES=False):
+            model = self.client.get('/api/products/').content
+
+        self.assertEqual(flat, model)
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'price': Decimal('12.50'),
+            'when': timezone.now(),
+            'text': 'caf\u00e9 \u2028',
+            'nested': [{'n': 1, 'ok': True, 'none': None}],
+            1: 'int key',
+        }
+
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+
+def read_stream(response):
+    return json.loads(b''.join(response.streaming_content))
+
+
+class HistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.trader = make_user('trader')
+        cls.other = make_user('other')
+        cls.product = make_products(cls.other, 1)[0]
+        now = timezone.now()
+        rows = []
+        for i in range(7):
+            sender, receiver = (cls.trader, cls.other) if i % 2 else (cls.other, cls.trader)
+            rows.append(Transaction(sender=sender, receiver=receiver, product=cls.product if i else None,
+                                    amount=Decimal(i), tx_type='withdraw'))
+        # Two rows share a timestamp so the cursor has to break the tie on id
+        Transaction.objects.bulk_create(rows)
+        for i, tx in enumerate(Transaction.objects.order_by('id')):
+            Transaction.objects.filter(pk=tx.pk).update(created_at=now - timedelta(minutes=min(i, 5)))
+        Transaction.objects.create(sender=cls.other, receiver=cls.other, amount=Decimal('1'), tx_type='withdraw')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.trader)
+
+    def pages(self, url, **params):
+        response = self.client.get(url, params)
+        while True:
+            self.assertTrue(response.streaming)
+            page = read_stream(response)
+            yield page
+            if page['next'] is None:
+                return
+            response = self.client.get(page['next'])
+
+    def test_transactions_merge_both_sides_newest_first_across_pages(self):
+        pages = list(self.pages('/api/transactions/', page_size=3))
+        amounts = [row['amount'] for page in pages for row in page['results']]
+
+        self.assertEqual([len(page['results']) for page in pages], [3, 3, 1])
+        # Newest first; 5 and 6 share a timestamp and fall back to id
+        self.assertEqual(amounts, [0.0, 1.0, 2.0, 3.0, 4.0, 6.0, 5.0])
+        self.assertIsNone(pages[0]['results'][0]['product'])
+
+    def test_like_history_pages_with_a_cursor(self):
+        products = make_products(self.other, 3)
+        Like.objects.bulk_create([Like(user=self.trader, product=product) for product in products])
+
+        pages = list(self.pages('/api/likes/', page_size=2))
+
+        names = [row['product'] for page in pages for row in page['results']]
+        self.assertEqual(sorted(names), ['Item 0', 'Item 1', 'Item 2'])
+        self.assertEqual(len(pages), 2)
+
+    def test_bad_cursor_is_rejected(self):
+        self.assertEqual(self.client.get('/api/comments/', {'cursor': 'nope'}).status_code, 400)
+
+
+class EngagementCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = make_user('seller')
+        cls.fan = make_user('fan')
+
+    def setUp(self):
+        self.product = make_products(self.owner, 1)[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.fan)
+
+    def test_like_is_counted_once(self):
+        self.client.post(f'/api/products/{self.product.pk}/like/')
+        self.client.post(f'/api/products/{self.product.pk}/like/')
+        self.client.post(f'/api/products/{self.product.pk}/comment/', {'content': 'Nice'})
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.like_count, self.product.comment_count), (1, 1))
+
+
+class BuyProductTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = make_user('seller', '0')
+        cls.buyer = make_user('buyer', '15')
+        cls.product = make_products(cls.seller, 1, price='10.00')[0]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def balances(self):
+        return [UserProfile.objects.get(user=u).balance for u in (self.buyer, self.seller)]
+
+    def test_purchase_moves_price_between_profiles(self):
+        response = self.client.post(f'/api/products/{self.product.pk}/buy/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.balances(), [Decimal('5.00'), Decimal('10.00')])
+
+    def test_insufficient_balance_changes_nothing(self):
+        self.client.post(f'/api/products/{self.product.pk}/buy/')
+        response = self.client.post(f'/api/products/{self.product.pk}/buy/')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.balances(), [Decimal('5.00'), Decimal('10.00')])
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_idempotency_key_replays_instead_of_charging_twice(self):
+        url = f'/api/products/{self.product.pk}/buy/'
+        first = self.client.post(url, HTTP_IDEMPOTENCY_KEY='checkout-1')
+        second = self.client.post(url, HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        self.assertEqual(first.data['transaction_id'], second.data['transaction_id'])
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.balances(), [Decimal('5.00'), Decimal('10.00')])
+
+    def test_idempotency_key_reused_for_another_product_conflicts(self):
+        other = make_products(self.seller, 1, price='1.00')[0]
+        self.client.post(f'/api/products/{self.product.pk}/buy/', HTTP_IDEMPOTENCY_KEY='checkout-1')
+        response = self.client.post(f'/api/products/{other.pk}/buy/', HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.balances(), [Decimal('5.00'), Decimal('10.00')])
+
+    def test_cannot_buy_own_product(self):
+        self.client.force_authenticate(self.seller)
+        response = self.client.post(f'/api/products/{self.product.pk}/buy/')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(NOTIFICATION_DISPATCH={'MODE': 'inline'})
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sellers = [make_user('seller0'), make_user('seller1')]
+        cls.buyer = make_user('buyer', '40')
+        cls.products = make_products(cls.sellers[0], 3, price='10.00') + make_products(cls.sellers[1], 3, price='5.00')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def checkout(self, products):
+        return self.client.post('/api/checkout/', {'product_ids': [p.pk for p in products]}, format='json')
+
+    def test_checkout_buys_everything_and_notifies_each_seller_once(self):
+        response = self.checkout(self.products[:3] + self.products[3:4])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['transaction_ids']), 4)
+        self.assertEqual(response.data['total'], Decimal('35.00'))
+        self.assertEqual(balances_of([self.buyer.pk] + [s.pk for s in self.sellers]), {
+            self.buyer.pk: Decimal('5.00'), self.sellers[0].pk: Decimal('30.00'), self.sellers[1].pk: Decimal('5.00'),
+        })
+        self.assertEqual(
+            sorted(Notification.objects.values_list('to_user_id', 'message')),
+            [(self.sellers[0].pk, 'buyer bought several of your products'),
+             (self.sellers[1].pk, 'buyer bought your product')],
+        )
+        call_command('verify_ledger', stdout=StringIO())
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        with self.assertNumQueries(9):
+            self.checkout(self.products[:1])
+        with self.assertNumQueries(9):
+            self.checkout(self.products[1:5])
+
+    def test_all_or_nothing(self):
+        for cart in (self.products, self.products[:1] + [Product(pk=999999)]):
+            response = self.checkout(cart)
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.checkout(self.products[:1] * 2).status_code, 400)
+        self.client.force_authenticate(self.sellers[0])
+        self.assertEqual(self.checkout(self.products[2:4]).status_code, 400)
+
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(balance_of(self.buyer.pk), Decimal('40.00'))
+
+
+@override_settings(NOTIFICATION_DISPATCH={'MODE': 'inline'})
+class PurchaseStressTests(TransactionTestCase):
+    def test_concurrent_purchases_conserve_total_balance(self):
+        out = StringIO()
+        call_command('stress_purchases', threads=4, buys=15, stdout=out)
+        self.assertIn('Total balance conserved', out.getvalue())
+
+
+@override_settings(NOTIFICATION_DISPATCH={'MODE': 'inline'})
+class LedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = make_user('seller', '0')
+        cls.buyer = make_user('buyer', '50')
+        cls.products = make_products(cls.seller, 3, price='10.00')
+
+    def buy(self, product):
+        return purchase_product(self.buyer, product)[0]
+
+    def verify(self):
+        out, err = StringIO(), StringIO()
+        call_command('verify_ledger', stdout=out, stderr=err)
+        return out.getvalue()
+
+    def test_purchase_appends_balanced_entries(self):
+        tx = self.buy(self.products[0])
+
+        self.assertEqual(
+            sorted(tx.entries.values_list('user_id', 'amount')),
+            sorted([(self.buyer.pk, Decimal('-10.00')), (self.seller.pk, Decimal('10.00'))]),
+        )
+        self.assertEqual(balances_of([self.buyer.pk, self.seller.pk]),
+                         {self.buyer.pk: Decimal('40.00'), self.seller.pk: Decimal('10.00')})
+
+    def test_balance_is_snapshot_plus_later_entries(self):
+        self.buy(self.products[0])
+        self.assertEqual(take_snapshots(lag=0), 2)
+        self.buy(self.products[1])
+
+        snapshot = BalanceSnapshot.objects.get(user=self.buyer)
+        self.assertEqual(snapshot.balance, Decimal('40.00'))
+        with self.assertNumQueries(2):
+            self.assertEqual(balance_of(self.buyer.pk), Decimal('30.00'))
+
+        self.assertEqual(take_snapshots(lag=0), 2)
+        self.assertEqual(take_snapshots(lag=0), 0)
+        self.assertEqual(BalanceSnapshot.objects.get(user=self.buyer).balance, Decimal('30.00'))
+        self.assertEqual(balance_of(self.buyer.pk), Decimal('30.00'))
+
+    def test_balances_of_many_users(self):
+        self.buy(self.products[0])
+        take_snapshots(lag=0)
+        self.buy(self.products[1])
+        user_ids = [self.buyer.pk, self.seller.pk, *range(10**6, 10**6 + 1500)]
+
+        balances = balances_of(user_ids)
+        self.assertEqual(len(balances), 1502)
+        self.assertEqual(balances[self.buyer.pk], Decimal('30.00'))
+        self.assertEqual(balances[self.seller.pk], Decimal('20.00'))
+        self.assertEqual(balances[10**6], Decimal('0.00'))
+
+    def test_snapshots_leave_recent_entries_for_later(self):
+        self.buy(self.products[0])
+        self.assertEqual(take_snapshots(lag=3600), 0)
+        self.assertFalse(BalanceSnapshot.objects.exists())
+
+    def test_verify_ledger_passes_and_catches_tampering(self):
+        for product in self.products:
+            self.buy(product)
+        take_snapshots(lag=0)
+        self.assertIn('Ledger consistent', self.verify())
+
+        LedgerEntry.objects.filter(user=self.seller).update(amount=Decimal('9.00'))
+        BalanceSnapshot.objects.filter(user=self.buyer).update(balance=Decimal('1.00'))
+        with self.assertRaisesMessage(CommandError, '5 problem(s)'):
+            self.verify()
+
+
+class NotificationDispatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = make_user('seller')
+        cls.fans = [make_user(f'fan{i}') for i in range(50)]
+        cls.product = make_products(cls.seller, 1)[0]
+
+    def test_burst_of_likes_is_coalesced_into_one_row(self):
+        dispatcher = NotificationDispatcher(window=10, autostart=False)
+        for fan in self.fans:
+            dispatcher.submit(NotificationEvent('like', fan.pk, fan.username, self.seller.pk, self.product.pk))
+        dispatcher.flush()
+
+        notification = Notification.objects.get(to_user=self.seller)
+        self.assertEqual(notification.message, 'fan0 and 49 others liked your product')
+        self.assertEqual(notification.from_user, self.fans[0])
+
+    def test_like_is_queued_after_commit(self):
+        client = APIClient()
+        client.force_authenticate(self.fans[0])
+        with self.captureOnCommitCallbacks() as callbacks:
+            client.post(f'/api/products/{self.product.pk}/like/')
+
+        self.assertEqual(len(callbacks), 2)  # cache version bump + notification hand-off
+        self.assertFalse(Notification.objects.exists())
+
+    @override_settings(NOTIFICATION_DISPATCH={'MODE': 'inline'})
+    def test_inline_notification_is_published_after_commit(self):
+        client = APIClient()
+        client.force_authenticate(self.fans[0])
+        with mock.patch.object(hub, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                client.post(f'/api/products/{self.product.pk}/comment/', {'content': 'Nice'})
+            publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+
+        [notification] = publish.call_args.args[0]
+        self.assertEqual(notification.message, 'fan0 commented on your product')
+
+    @override_settings(NOTIFICATION_DISPATCH={'MODE': 'outbox', 'COALESCE_WINDOW': 10})
+    def test_outbox_is_drained_by_management_command(self):
+        client = APIClient()
+        for fan in self.fans[:3]:
+            client.force_authenticate(fan)
+            client.post(f'/api/products/{self.product.pk}/comment/', {'content': 'Nice'})
+        self.assertEqual(NotificationOutbox.objects.count(), 3)
+
+        out = StringIO()
+        call_command('drain_notifications', stdout=out)
+
+        self.assertFalse(NotificationOutbox.objects.exists())
+        self.assertEqual(
+            list(Notification.objects.values_list('message', flat=True)),
+            ['fan0 and 2 others commented on your product'],
+        )
+        self.assertIn('Drained 3 event(s) into 1 notification(s)', out.getvalue())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class RegisterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+
+    def register(self, **fields):
+        data = {'username': 'newcomer', 'email': 'newcomer@shop.test', 'password': 'correct horse', **fields}
+        # email_validator would look the domain up in DNS
+        with mock.patch('prdapi.serializers.validate_email'):
+            return self.client.post('/api/register/', data, content_type='application/json')
+
+    def test_register_opens_the_account_and_returns_a_working_token(self):
+        response = self.register(balance='25.50')
+
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        user = User.objects.get(username='newcomer')
+        self.assertEqual(body['user']['balance'], 25.5)
+        self.assertEqual(balance_of(user.pk), Decimal('25.50'))
+        self.assertEqual(LedgerEntry.objects.get(user=user).kind, LedgerEntry.DEPOSIT)
+        self.assertTrue(user.check_password('correct horse'))
+
+        response = self.client.get('/api/notifications/unread-count/',
+                                   HTTP_AUTHORIZATION=f'Bearer {body["access"]}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_duplicate_username_is_rejected(self):
+        self.register()
+        self.assertEqual(self.register(email='other@shop.test').status_code, 400)
+
+
+# The first hasher is the upgrade target; MD5 stands in for a legacy hash and keeps the test fast
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+                                     'django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('walker', '12.50')
+        cls.user.password = make_password('correct horse', hasher='md5')
+        cls.user.save()
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self, password='correct horse'):
+        return self.client.post('/api/login/', {'username': 'walker', 'password': password},
+                                content_type='application/json')
+
+    def test_login_verifies_on_the_pool_and_upgrades_the_hash(self):
+        response = self.login()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['balance'], 12.5)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha1$'))
+        self.assertTrue(self.user.check_password('correct horse'))
+
+    def test_wrong_password_is_rejected(self):
+        response = self.login('battery staple')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid credentials'})
+
+    @override_settings(PASSWORD_HASHING={'RATE_LIMITS': {'username': (2, 60)}})
+    def test_excess_attempts_are_refused_before_hashing(self):
+        self.login('nope')
+        self.login('nope')
+        with self.assertNumQueries(0):
+            response = self.login()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+
+    @override_settings(PASSWORD_HASHING={'MAX_PENDING': 0})
+    def test_saturated_pool_answers_503(self):
+        response = self.login()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+
+    def setUp(self):
+        # Primary keys come back after each test's rollback, so rows cached by another test could match
+        user_cache.clear()
+        self.auth = CachedJWTAuthentication()
+        self.token = AccessToken.for_user(self.user)
+
+    def get(self):
+        return self.client.get('/api/notifications/unread-count/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def test_cached_user_comes_with_profile_and_costs_no_queries(self):
+        self.assertEqual(self.get().status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().status_code, 200)
+            user = self.auth.get_user(self.token)
+            self.assertEqual((user.pk, user.username, user.profile.pk), (self.user.pk, 'reader', self.user.profile.pk))
+        self.assertIsNot(user, self.auth.get_user(self.token))
+
+    def test_saving_the_user_evicts_it(self):
+        self.get()
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_entries_are_bounded_in_number_and_age(self):
+        others = [make_user(f'other{i}') for i in range(3)]
+        with override_settings(JWT_USER_CACHE={'MAX_ENTRIES': 2, 'TTL_SECONDS': 30}):
+            for user in [self.user] + others:
+                self.auth.get_user(AccessToken.for_user(user))
+            self.assertEqual(len(user_cache), 2)
+        with override_settings(JWT_USER_CACHE={'MAX_ENTRIES': 2, 'TTL_SECONDS': -1}):
+            self.auth.get_user(self.token)
+            with self.assertNumQueries(1):
+                self.auth.get_user(self.token)
+
+
+class NotificationStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('listener')
+        cls.sender = make_user('sender')
+        cls.seen, cls.missed = [
+            Notification.objects.create(from_user=cls.sender, to_user=cls.user, message=f'note {i}')
+            for i in range(2)
+        ]
+
+    def stream_request(self, **headers):
+        token = AccessToken.for_user(self.user)
+        return AsyncRequestFactory().get('/api/notifications/stream/', {'token': str(token)}, headers=headers)
+
+    async def test_resumes_after_last_event_id_then_receives_live_events(self):
+        response = await notification_stream(self.stream_request(last_event_id=str(self.seen.pk)))
+        events = response.streaming_content
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(await anext(events), b'retry: 3000\n\n')
+        self.assertIn(f'id: {self.missed.pk}\n'.encode(), await anext(events))
+
+        live = Notification(id=self.missed.pk + 1, from_user=self.sender, to_user=self.user,
+                            message='live', created_at=timezone.now())
+        hub.publish([self.missed, live])  # already-sent ids are skipped
+        self.assertIn(b'"message": "live"', await anext(events))
+        await events.aclose()
+
+    async def test_requires_token(self):
+        request = AsyncRequestFactory().get('/api/notifications/stream/')
+        response = await notification_stream(request)
+        self.assertEqual(response.status_code, 401)
+
+
+class NotificationReadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        cls.other = make_user('other')
+        cls.notes = Notification.objects.bulk_create([
+            Notification(from_user=cls.other, to_user=cls.user, message=f'note {i}') for i in range(5)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_mark_by_ids_is_one_update(self):
+        ids = [n.pk for n in self.notes[:3]]
+        with self.assertNumQueries(2):  # UPDATE + unread COUNT
+            response = self.client.post('/api/notifications/read/', {'ids': ids}, format='json')
+
+        self.assertEqual(response.data, {'updated': 3, 'unread': 2})
+
+    def test_mark_all_before_timestamp(self):
+        cutoff = timezone.now()
+        later = Notification.objects.create(from_user=self.other, to_user=self.user, message='later')
+        Notification.objects.filter(pk=later.pk).update(created_at=cutoff + timedelta(seconds=1))
+
+        response = self.client.post('/api/notifications/read/', {'before': cutoff.isoformat()}, format='json')
+
+        self.assertEqual(response.data, {'updated': 5, 'unread': 1})
+
+    def test_requires_exactly_one_selector(self):
+        response = self.client.post('/api/notifications/read/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_unread_count_is_cached_until_invalidated(self):
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').data, {'unread': 5})
+        with self.assertNumQueries(0):
+            self.client.get('/api/notifications/unread-count/')
+
+        self.client.post(f'/api/notifications/{self.notes[0].pk}/read/')
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').data, {'unread': 4})
+
+    def test_marking_someone_elses_notification_is_404(self):
+        self.client.force_authenticate(self.other)
+        response = self.client.post(f'/api/notifications/{self.notes[0].pk}/read/')
+        self.assertEqual(response.status_code, 404)
+
+
+class MetricsMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        make_products(make_user('seller'), 3)
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    def test_requests_are_exported_per_route_and_view(self):
+        for _ in range(3):
+            self.client.get('/api/products/public/')
+
+        body = self.client.get('/metrics').content.decode()
+
+        labels = 'url_name="api/products/public/",view="PublicProductListAPIView"'
+        self.assertIn(f'ecom_request_duration_seconds_count{{{labels}}} 3', body)
+        self.assertIn(f'ecom_db_queries{{{labels},quantile="0.5"}}', body)
+        self.assertIn(f'ecom_response_bytes_count{{{labels}}} 3', body)
+
+    @override_settings(METRICS={'ALLOWED_IPS': ('10.0.0.5',), 'TOKEN': 'scrape-me'})
+    def test_metrics_are_served_to_allowed_ips_and_the_token_only(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+    @override_settings(METRICS={'QUERY_LOG_THRESHOLD': 0})
+    def test_requests_over_the_threshold_log_repeated_queries(self):
+        with self.assertLogs('ecom.metrics', level='WARNING') as logs:
+            self.client.get('/api/products/public/')
+
+        self.assertIn('/api/products/public/', logs.output[0])
+
+    async def test_sync_views_under_asgi_report_their_queries(self):
+        await self.async_client.get('/api/products/public/')
+
+        queries = registry.snapshot()[('db_queries', 'api/products/public/', 'PublicProductListAPIView')]
+        self.assertEqual(queries.count, 1)
+        self.assertGreater(queries.total, 0)
+
+    def test_histogram_quantiles_stay_within_bucket_error(self):
+        histogram = Histogram()
+        for value in range(1, 10001):
+            histogram.record(value)
+
+        for q in (0.5, 0.9, 0.99):
+            self.assertAlmostEqual(histogram.quantile(q) / (q * 10000), 1, delta=0.125)
+
+    def test_fingerprint_collapses_literals(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id = 7 AND name = \'x\''),
+            fingerprint('SELECT * FROM t WHERE id = 12 AND name = \'y\''),
+        )
@@ -1,5 +1,6 @@
 from django.urls import path
 from .views import *
+from .streams import notification_stream
 
 urlpatterns = [
     path('register/', RegisterAPIView.as_view()),
@@ -11,7 +12,11 @@ urlpatterns = [
     path('products/<int:pk>/comment/', AddComment.as_view()),
     path('products/<int:pk>/buy/', BuyProduct.as_view()),
     path('products/', ProductListAPIView.as_view()),
+    path('checkout/', Checkout.as_view()),
     path('notifications/', NotificationList.as_view()),
+    path('notifications/stream/', notification_stream),
+    path('notifications/read/', MarkNotificationsRead.as_view()),
+    path('notifications/unread-count/', UnreadNotificationCount.as_view()),
     path('notifications/<int:pk>/read/', MarkNotificationRead.as_view()),
     path('likes/', LikeHistory.as_view()),
     path('comments/', CommentHistory.as_view()),
@@ -1,67 +1,81 @@
-from django.contrib.auth import authenticate
+from asgiref.sync import sync_to_async
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import F
 from django.shortcuts import get_object_or_404
 from rest_framework import generics
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import Product, Like, Comment, Notification, Transaction
-from .serializers import ProductSerializer, RegisterSerializer, NotificationSerializer
-from .permissions import IsOwner
-
-
-class RegisterAPIView(APIView):
-    permission_classes = [AllowAny]
-
-    def post(self, request):
-        serializer = RegisterSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        user = serializer.save()
 
-        refresh = RefreshToken.for_user(user)
-
-        return Response({
-            "user": {
-                "id": user.id,
-                "username": user.username,
-                "email": user.email,
-                "balance": user.profile.balance
-            },
-            "access": str(refresh.access_token),
-            "refresh": str(refresh)
-        }, status=201)
-
-
-class LoginAPIView(APIView):
-    permission_classes = [AllowAny]
-    def post(self, request):
-        username = request.data.get("username")
-        password = request.data.get("password")
-
-        user = authenticate(username=username, password=password)
+from ecom.cache import cache_response, invalidate_product
+from ecom.credentials import CredentialView, render_json
+from ecom.passwords import authenticate, make_password
+from ecom.flat import FlatListMixin
+from .models import Product, Like, Comment, Notification, NotificationOutbox, Transaction
+from .notifications import forget_unread_counts, notify, unread_count
+from .filters import ProductFilterBackend
+from .ledger import balance_of
+from .history import decode_cursor, merge_newest_first, newest_first, page_size, stream_page
+from .pagination import ProductCursorPagination, ProductListPagination
+from .serializers import ProductSerializer, ProductListSerializer, RegisterSerializer, NotificationSerializer, \
+    MarkNotificationsReadSerializer, ProductListFlatSerializer, LikeHistorySerializer, CommentHistorySerializer, \
+    TransactionHistorySerializer, CheckoutSerializer
+from .permissions import IsOwner
+from .purchases import IdempotencyConflict, PurchaseError, checkout, purchase_product
+
+
+def user_session(user):
+    refresh = RefreshToken.for_user(user)
+    return {
+        "user": {
+            "id": user.id,
+            "username": user.username,
+            "email": user.email,
+            "balance": balance_of(user.id)
+        },
+        "access": str(refresh.access_token),
+        "refresh": str(refresh)
+    }
+
+
+class RegisterAPIView(CredentialView):
+    async def post(self, request):
+        data = self.payload(request)
+        await self.throttle(request, data.get("username"))
+
+        serializer = RegisterSerializer(data=data)
+        if not await sync_to_async(serializer.is_valid)():
+            return render_json(serializer.errors, status=400)
+        encoded = await make_password(serializer.validated_data["password"])
+        user = await sync_to_async(serializer.save)(password_hash=encoded)
+        return render_json(await sync_to_async(user_session)(user), status=201)
+
+
+class LoginAPIView(CredentialView):
+    async def post(self, request):
+        data = self.payload(request)
+        username = data.get("username")
+        await self.throttle(request, username)
+
+        user = await authenticate(request, username, data.get("password"))
         if not user:
-            return Response({"error": "Invalid credentials"}, status=400)
-
-        refresh = RefreshToken.for_user(user)
+            return self.error("Invalid credentials", 400)
+        return render_json(await sync_to_async(user_session)(user))
 
-        return Response({
-            "user": {
-                "id": user.id,
-                "username": user.username,
-                "email": user.email,
-                "balance": user.profile.balance
-            },
-            "access": str(refresh.access_token),
-            "refresh": str(refresh)
-        })
 
 class PublicProductListAPIView(generics.ListAPIView):
-    queryset = Product.objects.select_related("user").prefetch_related("like_set","comment_set")
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
+    pagination_class = ProductCursorPagination
+
+    @cache_response("prdapi:products")
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return ProductSerializer.prune_queryset(Product.objects.for_listing(self.request.user), self.request)
 
     def get_serializer_context(self):
         return {"request": self.request}
@@ -77,11 +91,17 @@ class ProductCreateAPIView(generics.CreateAPIView):
             raise ValidationError({"name": "Product already exists"})
 
         serializer.save(user=self.request.user)
+        invalidate_product("prdapi")
 
 class ProductDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
 
+    def get_queryset(self):
+        if self.request.method == "GET":
+            return ProductSerializer.prune_queryset(Product.objects.for_listing(self.request.user), self.request)
+        return super().get_queryset()
+
     def get_permissions(self):
         if self.request.method == "GET":
             return [AllowAny()]
@@ -90,22 +110,28 @@ class ProductDetailAPIView(generics.RetrieveUpdateDestroyAPIView):
     def get_serializer_context(self):
         return {"request": self.request}
 
+    def perform_update(self, serializer):
+        serializer.save()
+        invalidate_product("prdapi", serializer.instance.pk)
+
+    def perform_destroy(self, instance):
+        invalidate_product("prdapi", instance.pk)
+        instance.delete()
+
 class LikeProduct(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, pk):
-        product = get_object_or_404(Product, pk=pk)
+        product = get_object_or_404(Product.objects.only("pk", "user_id"), pk=pk)
 
-        like, created = Like.objects.get_or_create(
-            user=request.user, product=product
-        )
-
-        if created and product.user != request.user:
-            Notification.objects.create(
-                from_user=request.user,
-                to_user=product.user,
-                message=f"{request.user.username} liked your product"
+        with transaction.atomic():
+            like, created = Like.objects.get_or_create(
+                user=request.user, product=product
             )
+            if created:
+                Product.objects.filter(pk=product.pk).update(like_count=F("like_count") + 1)
+                invalidate_product("prdapi", product.pk)
+                notify(NotificationOutbox.LIKE, request.user, product.user_id, product.pk)
 
         return Response({"liked": True})
 
@@ -113,93 +139,74 @@ class AddComment(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, pk):
-        product = get_object_or_404(Product, pk=pk)
+        product = get_object_or_404(Product.objects.only("pk", "user_id"), pk=pk)
 
-        Comment.objects.create(
-            user=request.user,
-            product=product,
-            content=request.data.get("content")
-        )
-
-        if product.user != request.user:
-            Notification.objects.create(
-                from_user=request.user,
-                to_user=product.user,
-                message=f"{request.user.username} commented on your product"
+        with transaction.atomic():
+            Comment.objects.create(
+                user=request.user,
+                product=product,
+                content=request.data.get("content")
             )
+            Product.objects.filter(pk=product.pk).update(comment_count=F("comment_count") + 1)
+            invalidate_product("prdapi", product.pk)
+            notify(NotificationOutbox.COMMENT, request.user, product.user_id, product.pk)
 
         return Response({"status": "commented"})
 
 class BuyProduct(APIView):
     permission_classes = [IsAuthenticated]
 
-    @transaction.atomic
     def post(self, request, pk):
         product = get_object_or_404(Product, pk=pk)
-        buyer = request.user
-        seller = product.user
-
-        if buyer == seller:
-            return Response(
-                {"error": "You cannot buy your own product"},
-                status=400
-            )
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if idempotency_key and len(idempotency_key) > 64:
+            return Response({"error": "Idempotency-Key cannot exceed 64 characters"}, status=400)
+
+        try:
+            tx, created = purchase_product(request.user, product, idempotency_key)
+        except IdempotencyConflict as e:
+            return Response({"error": str(e)}, status=409)
+        except PurchaseError as e:
+            return Response({"error": str(e)}, status=400)
+
+        response = Response({"status": "purchased", "transaction_id": tx.pk})
+        if not created:
+            response["Idempotent-Replayed"] = "true"
+        return response
+
+class Checkout(APIView):
+    permission_classes = [IsAuthenticated]
 
-        if buyer.profile.balance < product.price:
-            return Response({"error": "Insufficient balance"}, status=400)
+    def post(self, request):
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-        buyer.profile.balance -= product.price
-        seller.profile.balance += product.price
-        buyer.profile.save()
-        seller.profile.save()
+        try:
+            transactions = checkout(request.user, serializer.validated_data["product_ids"])
+        except PurchaseError as e:
+            return Response({"error": str(e)}, status=400)
 
-        Transaction.objects.create(
-            product=product,
-            sender=buyer,
-            receiver=seller,
-            amount=product.price,
-            tx_type="withdraw"
-        )
+        return Response({
+            "status": "purchased",
+            "transaction_ids": [tx.pk for tx in transactions],
+            "total": sum((tx.amount for tx in transactions), 0),
+        })
 
-        Notification.objects.create(
-            from_user=buyer,
-            to_user=seller,
-            message=f"{buyer.username} bought your product"
-        )
+class ProductListAPIView(FlatListMixin, generics.ListAPIView):
+    serializer_class = ProductListSerializer
+    flat_serializer_class = ProductListFlatSerializer
+    permission_classes = [AllowAny]
+    pagination_class = ProductListPagination
+    filter_backends = [ProductFilterBackend]
 
-        return Response({"status": "purchased"})
+    @cache_response("prdapi:products")
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
 
-class ProductListAPIView(APIView):
-    def get(self, request):
-        products = Product.objects.all()
-
-        min_price = request.GET.get('min_price')
-        max_price = request.GET.get('max_price')
-        my_products = request.GET.get('my_products')
-
-        if min_price:
-            try:
-                products = products.filter(price__gte=float(min_price))
-            except ValueError:
-                return Response(
-                    {"error": "min_price must be a number"},
-                    status=400
-                )
-
-        if max_price:
-            try:
-                products = products.filter(price__lte=float(max_price))
-            except ValueError:
-                return Response(
-                    {"error": "max_price must be a number"},
-                    status=400
-                )
-
-        if my_products == "true" and request.user.is_authenticated:
-            products = products.filter(user=request.user)
-
-        serializer = ProductSerializer(products, many=True, context={"request": request})
-        return Response(serializer.data)
+    def get_queryset(self):
+        return ProductListSerializer.prune_queryset(
+            Product.objects.select_related("user").with_viewer_like(self.request.user), self.request
+        )
 
 class NotificationList(generics.ListAPIView):
     serializer_class = NotificationSerializer
@@ -214,33 +221,67 @@ class MarkNotificationRead(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, pk):
-        n = Notification.objects.get(pk=pk, to_user=request.user)
-        n.status = "read"
-        n.save()
+        if not Notification.objects.filter(pk=pk, to_user=request.user).update(status="read"):
+            raise NotFound()
+        forget_unread_counts([request.user.pk])
         return Response({"status":"read"})
 
-class LikeHistory(APIView):
+class MarkNotificationsRead(APIView):
     permission_classes = [IsAuthenticated]
 
-    def get(self, request):
-        qs = Like.objects.select_related("product").filter(user=request.user)
-        return Response([{"product": l.product.name} for l in qs])
+    def post(self, request):
+        serializer = MarkNotificationsReadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-class CommentHistory(APIView):
+        unread = Notification.objects.filter(to_user=request.user, status="unread")
+        if "ids" in serializer.validated_data:
+            unread = unread.filter(pk__in=serializer.validated_data["ids"])
+        else:
+            unread = unread.filter(created_at__lte=serializer.validated_data["before"])
+        updated = unread.update(status="read")
+
+        forget_unread_counts([request.user.pk])
+        return Response({"updated": updated, "unread": unread_count(request.user.pk)})
+
+class UnreadNotificationCount(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        qs = Comment.objects.select_related("product").filter(user=request.user)
-        return Response([{"product": c.product.name, "content": c.content} for c in qs])
+        return Response({"unread": unread_count(request.user.pk)})
 
-class TransactionHistory(APIView):
+class HistoryView(APIView):
+    """Keyset-paginated history streamed as ``{"results": [...], "next": ...}`` (see history.py)"""
     permission_classes = [IsAuthenticated]
+    serializer_class = None
 
     def get(self, request):
-        qs = Transaction.objects.select_related("product").filter(Q(sender=request.user) | Q(receiver=request.user))
-        return Response([{
-            "product": t.product.name if t.product else None,
-            "amount": t.amount,
-            "type": t.tx_type,
-            "date": t.created_at
-        } for t in qs])
+        limit = page_size(request)
+        cursor = decode_cursor(request.GET["cursor"]) if request.GET.get("cursor") else None
+        rows = self.rows(request.user, cursor, limit + 1)
+        return stream_page(request, rows, self.serializer_class(context={"request": request}).builder(), limit)
+
+    def scan(self, queryset, cursor, limit):
+        return newest_first(self.serializer_class.values(queryset, "created_at", "id"), cursor, limit)
+
+class LikeHistory(HistoryView):
+    serializer_class = LikeHistorySerializer
+
+    def rows(self, user, cursor, limit):
+        # Served by the (user, -created_at) index
+        return self.scan(Like.objects.filter(user=user), cursor, limit)
+
+class CommentHistory(HistoryView):
+    serializer_class = CommentHistorySerializer
+
+    def rows(self, user, cursor, limit):
+        return self.scan(Comment.objects.filter(user=user), cursor, limit)
+
+class TransactionHistory(HistoryView):
+    serializer_class = TransactionHistorySerializer
+
+    def rows(self, user, cursor, limit):
+        # Q(sender) | Q(receiver) can't walk one index in order; two scans, one per
+        # (sender|receiver, -created_at) index, merged newest first can
+        sent = self.scan(Transaction.objects.filter(sender=user), cursor, limit)
+        received = self.scan(Transaction.objects.filter(receiver=user).exclude(sender=user), cursor, limit)
+        return merge_newest_first(sent, received)
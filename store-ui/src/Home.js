@@ -6,6 +6,7 @@ import { Modal, Button } from 'react-bootstrap';
 function Home() {
   const cookies = new Cookies();
   const [products, setProducts] = useState([]);
+  const [next, setNext] = useState(null);
   const [search, setSearch] = useState('');
   const [showModal, setShowModal] = useState(false);
   const user = cookies.get('user');
@@ -17,7 +18,18 @@ function Home() {
   const loadProducts = async () => {
     try {
       const res = await api.get(`products/public/`);
-      setProducts(res.data);
+      setProducts(res.data.results);
+      setNext(res.data.next);
+    } catch (err) {
+      console.error(err);
+    }
+  };
+
+  const loadMore = async () => {
+    try {
+      const res = await api.get(next);
+      setProducts(prev => [...prev, ...res.data.results]);
+      setNext(res.data.next);
     } catch (err) {
       console.error(err);
     }
@@ -86,6 +98,14 @@ function Home() {
         ))}
       </div>
 
+      {next && (
+        <div className="text-center my-4">
+          <button className="btn btn-outline-primary" onClick={loadMore}>
+            Load more
+          </button>
+        </div>
+      )}
+
       <Modal show={showModal} onHide={() => setShowModal(false)}>
         <Modal.Header closeButton>
           <Modal.Title>Login Required</Modal.Title>
@@ -1,11 +1,21 @@
-import api from "./api";
+import api, { API_URL } from "./api";
 import React, { useState, useEffect } from 'react';
+import { Cookies } from 'react-cookie';
 
 function Notifications() {
   const [notifications, setNotifications] = useState([]);
 
   useEffect(() => {
     loadNotifications();
+
+    // New notifications are pushed over SSE; EventSource resumes with Last-Event-ID on reconnect
+    const token = new Cookies().get('token');
+    const source = new EventSource(`${API_URL}/notifications/stream/?token=${token}`);
+    source.addEventListener('notification', (e) => {
+      const notification = JSON.parse(e.data);
+      setNotifications(prev => [notification, ...prev.filter(n => n.id !== notification.id)]);
+    });
+    return () => source.close();
   }, []);
 
   const loadNotifications = async () => {